@@ -0,0 +1,383 @@
+"""Benchmarks das operações mais pesadas do editor.
+
+Corre o editor a sério (Tk incluído) num display virtual, com documentos
+sintéticos de 1k a 1M linhas, com e sem cores do utilizador, e mede:
+
+    - abrir (GestorFicheiros.abrir_caminho, sem a caixa de diálogo)
+    - gravar (GestorFicheiros.gravar_ficheiro, até a gravação acabar)
+    - pesquisar (PainelPesquisa.pesquisar_texto, até à última fatia)
+    - numeros_linha (AreaTexto.atualizar_numeros_linha)
+    - escrever (teclas inseridas a meio do documento, com o realce de sintaxe)
+    - substituir (PainelPesquisa.substituir_tudo do termo pesquisado, e o
+      desfazer dessa substituição; fora do modo de ficheiro grande)
+    - arranque (processo novo até à primeira pintura, comparado com
+      EditorTexto.ALVO_ARRANQUE_MS)
+
+Uso:
+    xvfb-run -a python benchmarks/bench_editor.py --saida resultados.json
+    python benchmarks/bench_editor.py --tamanhos 1000 10000 --repeticoes 5
+
+Sem DISPLAY, o próprio script tenta arrancar um Xvfb. Os resultados são
+gravados em JSON (um registo por operação/tamanho/cores), para comparar
+execuções de versões diferentes.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+# Uma linha colorida em cada tantas, quando o documento tem cores
+LINHAS_POR_COR = 10
+CORES = ["color_red", "color_blue", "color_green", "color_orange"]
+TERMO_PESQUISA = "resultado"
+SUBSTITUTO = "valor"
+TEXTO_ESCRITO = "    resultado = calcular(x, 'abc')  # nova linha\n"
+
+MODELOS_LINHA = [
+    "def funcao_{n}(x, y=None):",
+    "    \"\"\"Documentação da função {n}.\"\"\"",
+    "    resultado = x * {n} + (y or 0)",
+    "    if resultado > {n}:",
+    "        return str(resultado)  # comentário {n}",
+    "    for i in range({n}):",
+    "        resultado += i",
+    "    return resultado",
+    "",
+    "class Classe{n}(object):",
+    "    valor = '{n}'",
+    "",
+]
+
+
+def iniciar_display():
+    """Garante um display X; devolve o processo Xvfb arrancado (ou None)."""
+    if os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("Xvfb") is None:
+        sys.exit("Sem DISPLAY e sem Xvfb: corra com 'xvfb-run -a python ...'")
+    leitura, escrita = os.pipe()
+    processo = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(escrita), "-screen", "0", "1280x1024x24",
+         "-nolisten", "tcp"],
+        pass_fds=(escrita,), stderr=subprocess.DEVNULL)
+    os.close(escrita)
+    with os.fdopen(leitura) as pipe:
+        numero = pipe.readline().strip()
+    if not numero:
+        processo.kill()
+        sys.exit("Não foi possível arrancar o Xvfb")
+    os.environ["DISPLAY"] = f":{numero}"
+    return processo
+
+
+def gerar_documento(n_linhas, com_cores, semente=0):
+    """Devolve (conteudo, spans) com spans em {tag: [(inicio, fim), ...]}."""
+    aleatorio = random.Random(semente)
+    linhas = [MODELOS_LINHA[i % len(MODELOS_LINHA)].format(n=i)
+              for i in range(n_linhas)]
+    spans = {}
+    if com_cores:
+        posicao = 0
+        for i, linha in enumerate(linhas):
+            if i % LINHAS_POR_COR == 0 and linha:
+                inicio = posicao + aleatorio.randrange(len(linha))
+                fim = min(inicio + aleatorio.randint(1, 20), posicao + len(linha))
+                spans.setdefault(aleatorio.choice(CORES), []).append((inicio, fim))
+            posicao += len(linha) + 1
+    return '\n'.join(linhas), spans
+
+
+def escrever_documento(pasta, n_linhas, com_cores):
+    import rtxt
+    conteudo, spans = gerar_documento(n_linhas, com_cores)
+    caminho = os.path.join(
+        pasta, f"doc_{n_linhas}_{'cores' if com_cores else 'simples'}.rtxt")
+    with open(caminho, "wb") as ficheiro:
+        rtxt.FormatoRtxt.escrever(ficheiro, conteudo, spans)
+    return caminho, os.path.getsize(caminho)
+
+
+def processar_ate(janela, condicao, limite_s=600):
+    """Processa eventos do Tk até condicao() ser verdadeira."""
+    limite = time.perf_counter() + limite_s
+    while not condicao():
+        if time.perf_counter() > limite:
+            raise TimeoutError("operação não terminou a tempo")
+        janela.update()
+
+
+def resumo(tempos):
+    """Estatísticas (em segundos) de uma lista de medições."""
+    ordenados = sorted(tempos)
+    return {
+        "n": len(ordenados),
+        "min": ordenados[0],
+        "mediana": statistics.median(ordenados),
+        "p95": ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))],
+        "max": ordenados[-1],
+    }
+
+
+class Bancada:
+    """Uma instância do editor, usada para todas as medições."""
+
+    def __init__(self):
+        import tkinter as tk
+        import editor_texto
+        # Os diários ficam numa pasta temporária: o benchmark não deve
+        # oferecer (nem apagar) os diários do utilizador
+        self.pasta = tempfile.mkdtemp(prefix="bench_editor_")
+        editor_texto.DiarioEdicoes.PASTA = os.path.join(self.pasta, "diario")
+        editor_texto.CacheRealce.PASTA = os.path.join(self.pasta, "realce")
+        self.janela = tk.Tk()
+        self.janela.geometry("1200x900+0+0")
+        self.app = editor_texto.EditorTexto(self.janela)
+        self.app.completar_arranque()
+        self.gestor = self.app.gestor_ficheiros
+        self.area = self.app.area_texto
+        self.pesquisa = self.app.painel_pesquisa
+        self.janela.update()
+
+    def fechar(self):
+        self.gestor.modificado = False
+        self.gestor.esperar_gravacao()
+        self.gestor.diario.fechar()
+        self.area.agendador.parar()
+        self.app.verificador_sintaxe.fechar()
+        self.area.percolator.close()
+        self.janela.destroy()
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+    def documento_novo(self):
+        self.pesquisa.limpar_pesquisa()
+        self.gestor.modificado = False
+        # Fecha o separador em vez de abrir outro: os documentos das medições
+        # anteriores não podem ficar em memória, em separadores inativos
+        self.app.separadores.fechar_atual()
+        self.janela.update()
+
+    def abrir(self, caminho):
+        self.documento_novo()
+        inicio = time.perf_counter()
+        if not self.gestor.abrir_caminho(caminho):
+            raise RuntimeError(f"não foi possível abrir {caminho}")
+        processar_ate(self.janela, lambda: not self.gestor.a_carregar)
+        self.janela.update_idletasks()
+        return time.perf_counter() - inicio
+
+    def gravar(self, caminho):
+        self.gestor.caminho_ficheiro = caminho
+        inicio = time.perf_counter()
+        if not self.gestor.gravar_ficheiro(esperar=True):
+            raise RuntimeError(f"não foi possível gravar {caminho}")
+        return time.perf_counter() - inicio
+
+    def pesquisar(self, termo):
+        self.pesquisa.entry_pesquisa.delete(0, "end")
+        self.pesquisa.entry_pesquisa.insert(0, termo)
+        # A escrita do termo agenda uma pesquisa; a medida é a pedida já
+        self.area.agendador.cancelar("pesquisa")
+        inicio = time.perf_counter()
+        self.pesquisa.pesquisar_texto()
+        processar_ate(self.janela, lambda: self.pesquisa._id_fatia is None
+                      and self.pesquisa._pesquisa_em_curso is None)
+        return time.perf_counter() - inicio, len(self.pesquisa.resultados_pesquisa)
+
+    def substituir(self, termo, substituto):
+        """Substitui todas as ocorrências e desfaz; devolve os dois tempos e
+        o número de ocorrências."""
+        self.pesquisa.entry_pesquisa.delete(0, "end")
+        self.pesquisa.entry_pesquisa.insert(0, termo)
+        self.area.agendador.cancelar("pesquisa")
+        self.pesquisa.substituto_var.set(substituto)
+        ocorrencias = len(self.area.indice_pesquisa.procurar(termo))
+        inicio = time.perf_counter()
+        self.pesquisa.substituir_tudo()
+        self.janela.update_idletasks()
+        segundos = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        self.area.undo.undo_event(None)
+        self.janela.update_idletasks()
+        return segundos, time.perf_counter() - inicio, ocorrencias
+
+    def numeros_linha(self, repeticoes):
+        texto = self.area.texto
+        tempos = []
+        for i in range(repeticoes):
+            # Vistas diferentes, para não medir sempre o mesmo desenho
+            texto.yview_moveto(i / max(repeticoes, 1))
+            self.janela.update()
+            inicio = time.perf_counter()
+            self.area.atualizar_numeros_linha()
+            tempos.append(time.perf_counter() - inicio)
+        return tempos
+
+    def escrever(self, teclas):
+        """Insere as teclas a meio do documento; devolve a latência de cada uma
+        e o tempo até o realce de sintaxe ficar em dia."""
+        texto = self.area.texto
+        cor = self.area.color
+        meio = max(int(texto.index("end-1c").split('.')[0]) // 2, 1)
+        texto.mark_set("insert", f"{meio}.0")
+        texto.see("insert")
+        self.janela.update()
+        tempos = []
+        inicio_total = time.perf_counter()
+        for tecla in teclas:
+            inicio = time.perf_counter()
+            texto.insert("insert", tecla)
+            texto.see("insert")
+            # O que o Tk faz antes de voltar a ler o teclado
+            self.janela.update_idletasks()
+            tempos.append(time.perf_counter() - inicio)
+            self.janela.update()
+        processar_ate(self.janela, lambda: cor.after_id is None and not cor.colorizing)
+        return tempos, time.perf_counter() - inicio_total
+
+
+def medir_arranque(repeticoes):
+    """Arranca o editor em processos novos; devolve os tempos (s) e o alvo.
+
+    Cada medição conta desde o lançamento do processo (interpretador
+    incluído) até o editor escrever os seus tempos, depois do arranque
+    completo; os tempos internos (desde o carregamento do módulo) vêm
+    também, em ms.
+    """
+    pasta = tempfile.mkdtemp(prefix="bench_arranque_")
+    # HOME própria: sem diários por recuperar, não aparece nenhum diálogo
+    ambiente = dict(os.environ, HOME=pasta)
+    totais, internos = [], []
+    try:
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            saida = subprocess.run(
+                [sys.executable, os.path.join(RAIZ, "editor_texto.py"),
+                 "--medir-arranque"],
+                env=ambiente, capture_output=True, text=True, check=True,
+                timeout=60).stdout
+            totais.append(time.perf_counter() - inicio)
+            internos.append(json.loads(saida.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return totais, internos
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=RAIZ,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def correr(tamanhos, repeticoes, teclas):
+    import tkinter as tk
+    resultados = []
+
+    def registar(operacao, n_linhas, com_cores, tempos, **extra):
+        registo = {"operacao": operacao, "linhas": n_linhas,
+                   "cores": com_cores, "segundos": resumo(tempos)}
+        registo.update(extra)
+        resultados.append(registo)
+        print(f"{operacao:>14} {n_linhas:>9} linhas "
+              f"{'com' if com_cores else 'sem'} cores: "
+              f"mediana {registo['segundos']['mediana'] * 1000:.1f} ms",
+              file=sys.stderr, flush=True)
+
+    totais, internos = medir_arranque(max(repeticoes, 5))
+    primeira = [t["primeira_pintura"] / 1000 for t in internos
+                if "primeira_pintura" in t]
+    registar("arranque", 0, False, totais,
+             primeira_pintura=resumo(primeira) if primeira else None,
+             completo=resumo([t["completo"] / 1000 for t in internos]),
+             alvo_ms=internos[0]["alvo_ms"],
+             dentro_do_alvo=bool(primeira) and statistics.median(primeira) * 1000
+             <= internos[0]["alvo_ms"])
+
+    bancada = Bancada()
+    try:
+        for n_linhas in tamanhos:
+            for com_cores in (False, True):
+                caminho, tamanho = escrever_documento(bancada.pasta, n_linhas, com_cores)
+                extra = {"bytes": tamanho}
+
+                tempos = [bancada.abrir(caminho) for _ in range(repeticoes)]
+                extra["modo_grande"] = bancada.area.modo_grande
+                registar("abrir", n_linhas, com_cores, tempos, **extra)
+
+                destino = os.path.join(bancada.pasta, "gravado.rtxt")
+                tempos = [bancada.gravar(destino) for _ in range(repeticoes)]
+                registar("gravar", n_linhas, com_cores, tempos, **extra)
+
+                medicoes = [bancada.pesquisar(TERMO_PESQUISA) for _ in range(repeticoes)]
+                registar("pesquisar", n_linhas, com_cores,
+                         [segundos for segundos, _ in medicoes],
+                         resultados=medicoes[-1][1], **extra)
+
+                registar("numeros_linha", n_linhas, com_cores,
+                         bancada.numeros_linha(max(repeticoes, 10)), **extra)
+
+                por_tecla, total = bancada.escrever(teclas)
+                registar("escrever", n_linhas, com_cores, por_tecla,
+                         teclas=len(teclas), total_segundos=total, **extra)
+
+                if not bancada.area.modo_grande:
+                    segundos, desfazer, ocorrencias = bancada.substituir(
+                        TERMO_PESQUISA, SUBSTITUTO)
+                    registar("substituir", n_linhas, com_cores, [segundos],
+                             ocorrencias=ocorrencias, desfazer_segundos=desfazer,
+                             **extra)
+        return {
+            "versao": versao_codigo(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "tk": tk.TkVersion,
+            "plataforma": platform.platform(),
+            "repeticoes": repeticoes,
+            "resultados": resultados,
+        }
+    finally:
+        bancada.fechar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS,
+                        help="números de linhas dos documentos gerados")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--teclas", type=int, default=200,
+                        help="teclas inseridas na medição da escrita")
+    parser.add_argument("--saida", default="-",
+                        help="ficheiro JSON dos resultados ('-' para o stdout)")
+    args = parser.parse_args()
+
+    xvfb = iniciar_display()
+    try:
+        teclas = (TEXTO_ESCRITO * (args.teclas // len(TEXTO_ESCRITO) + 1))[:args.teclas]
+        relatorio = correr(args.tamanhos, args.repeticoes, teclas)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+    dados = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida == "-":
+        print(dados)
+    else:
+        with open(args.saida, "w", encoding="utf-8") as ficheiro:
+            ficheiro.write(dados + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,457 +1,4800 @@
+import time
+# Início do carregamento do módulo: referência para os tempos de arranque
+INICIO_ARRANQUE = time.perf_counter()
+
+import functools
+import heapq
+import io
+import mmap
+import os
+import queue
+import re
+import struct
+import sys
+import threading
+import warnings
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from itertools import accumulate, chain, compress, groupby, repeat
 import tkinter as tk
 from tkinter import ttk  # para o Combobox
+from tkinter import font as tkfont  # para medir a largura dos números de linha
 import json  # para permitir usar persistência de dados entre sessões
-from tkinter.filedialog import asksaveasfilename, askopenfilename
-from tkinter.messagebox import askyesnocancel
-# Destaque de sintaxe
-from idlelib.colorizer import ColorDelegator, color_config
+from tkinter.messagebox import askyesno, askyesnocancel
+# Filtros da área de texto; o realce de sintaxe, os diálogos de ficheiros e
+# os módulos pesados usados só às vezes (multiprocessing, tempfile...) são
+# importados quando são precisos, para o arranque ser rápido
+from idlelib.delegator import Delegator
 from idlelib.percolator import Percolator
-from idlelib.undo import UndoDelegator
+from idlelib.undo import Command, CommandSequence, DeleteCommand, InsertCommand, UndoDelegator
+# Leitura e escrita do formato .rtxt (sem Tk, também usado pela linha de comandos)
+import rtxt
 
 # NOTAS
-# -- A janela da aplicação não reduz abaixo de um determinado valor
-# para evitar desincronização das linhas da área de texto com
-# as linhas do widget de números de linha.
+# -- Os números de linha são desenhados num Canvas e apenas para as linhas
+# visíveis, alinhados com a geometria real (dlineinfo) da área de texto.
 # -- A aplicação começou como editor de texto, por isso a seleção de
 # cores. Num editor de código não é habitual haver coloração do texto
 # pelo utilizador (eu nunca usei, pelo menos)
 # -- O código foi reestruturado por classes quando começou a ter 
 # muitas linhas
 # -- Optou-se por colocar tudo num ficheiro ao invés de dividir em vários
-# ficheiros, só para não se andar a saltar de um lado para outro
+# ficheiros, só para não se andar a saltar de um lado para outro. A exceção
+# é o formato .rtxt (e a sua linha de comandos), em rtxt.py: não usa Tk, para
+# os documentos poderem ser convertidos e pesquisados num servidor sem
+# display, e assim pode ser testado sem abrir o editor
 
 
-class AreaTexto:
-    """Gerencia a área de texto principal e números de linha."""
+class MedidorDesempenho:
+    """Histogramas de latência das operações do editor.
 
-    def __init__(self, parent, familia_fonte="Arial", tamanho_fonte=12):
-        self.parent = parent
-        self.familia_fonte = familia_fonte
-        self.tamanho_fonte = tamanho_fonte
-        # variável para controlar se os números de linha estão visíveis
-        self.mostrar_numeros_linha = tk.BooleanVar()
-        # Definir o número de espaços para a tecla TAB
-        self.tab_width = 4
-        self._configurar_area_texto()
-        self._configurar_realce_sintaxe()
+    Está desligado por omissão (ou ligado com PYCHARMOSO_MEDIR=1): os
+    métodos decorados com medir() só verificam `ativo` e seguem. Quando
+    ligado, cada chamada fica num histograma por nome, com baldes em ms.
+    Também mede o tempo de cada tecla até o Tk ficar livre (a tecla em si,
+    o <<Modified>> e o trabalho que o agendador fez no idle a seguir) e
+    pode correr a sessão sob o cProfile.
+    """
 
-    def _configurar_area_texto(self):
-        # Frame para conter o widget de números de linha e o texto
-        self.frame = tk.Frame(self.parent)
-        self.frame.rowconfigure(0, weight=1)
-        # Coluna do texto principal é expansível
-        self.frame.columnconfigure(1, weight=1)
+    # Limites superiores (ms) dos baldes; o último balde fica acima de 1 s
+    LIMITES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
 
-        # Frame para conter os números de linha com uma largura fixa
-        self.frame_numeros_wrapper = tk.Frame(self.frame, width=50)
-        self.frame_numeros_wrapper.grid(row=0, column=0, sticky="ns")
-        # Impede que o widget interno redimensione este frame
-        self.frame_numeros_wrapper.grid_propagate(False)
+    def __init__(self):
+        self.ativo = os.environ.get("PYCHARMOSO_MEDIR") == "1"
+        # nome -> {"n", "total", "maximo", "baldes"} (tempos em s)
+        self.histogramas = {}
+        self._perfil = None
+        self._inicio_tecla = None
 
-        # Widget para números de linha
-        self.numeros_linha = tk.Text(
-            self.frame_numeros_wrapper,
-            width=4, padx=3, takefocus=0, border=0,
-            state='disabled', wrap='none',
-            font=(self.familia_fonte, self.tamanho_fonte, "bold"),
-            bg='lightgray', fg='black'
-        )
-        self.numeros_linha.pack(fill="both", expand=True)
+    def medir(self, nome):
+        """Decorador que regista a duração de cada chamada em `nome`."""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def medida(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self.registar(nome, time.perf_counter() - inicio)
+            return medida
+        return decorador
 
-        # Widget principal de texto
-        self.texto = tk.Text(
-            self.frame,
-            font=(self.familia_fonte, self.tamanho_fonte, "bold"),
-            wrap=tk.WORD, fg="black", undo=True
-        )
-        self.texto.grid(row=0, column=1, sticky="nsew")
+    def registar(self, nome, duracao):
+        if not self.ativo:
+            return
+        histograma = self.histogramas.get(nome)
+        if histograma is None:
+            histograma = self.histogramas[nome] = {
+                "n": 0, "total": 0.0, "maximo": 0.0,
+                "baldes": [0] * (len(self.LIMITES_MS) + 1)}
+        histograma["n"] += 1
+        histograma["total"] += duracao
+        histograma["maximo"] = max(histograma["maximo"], duracao)
+        histograma["baldes"][bisect_left(self.LIMITES_MS, duracao * 1000)] += 1
 
-        # Adicionar Scrollbar vertical
-        self.scrollbar_texto = tk.Scrollbar(
-            self.frame, orient=tk.VERTICAL, command=self.texto.yview)
-        self.scrollbar_texto.grid(row=0, column=2, sticky="ns")
+    def limpar(self):
+        self.histogramas = {}
 
-        self._configurar_scroll_sincronizado()
+    def ao_premir_tecla(self, event, agendador):
+        """Começa a medir uma tecla (ligado ao <KeyPress> da área de texto)."""
+        if not self.ativo or self._inicio_tecla is not None:
+            return
+        self._inicio_tecla = time.perf_counter()
+        event.widget.after_idle(self._tecla_terminada, event.widget, agendador)
 
-    def _configurar_realce_sintaxe(self):
-        ########## REALCE DE SINTAXE E GESTOR DE UNDO/REDO ##########
-        # Configurar o Percolator para interceptar modificações de texto
-        self.percolator = Percolator(self.texto)
+    def _tecla_terminada(self, widget, agendador):
+        if agendador.pendente:
+            # O trabalho pedido pela tecla corre neste idle: medir a seguir
+            widget.after_idle(self._tecla_terminada, widget, agendador)
+            return
+        self.registar("tecla até ficar livre", time.perf_counter() - self._inicio_tecla)
+        self._inicio_tecla = None
 
-        # Adicionar o gestor de Undo/Redo
-        self.undo = UndoDelegator()
-        self.percolator.insertfilter(self.undo)
+    def percentil(self, histograma, fracao):
+        """Limite superior (ms) do balde onde cai o percentil pedido."""
+        alvo = fracao * histograma["n"]
+        acumulado = 0
+        for limite, contagem in zip(self.LIMITES_MS, histograma["baldes"]):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return limite
+        return histograma["maximo"] * 1000
 
-        # Adicionar o ColorDelegator para syntax highlighting
-        self.color = ColorDelegator()
-        self.percolator.insertfilter(self.color)
+    def resumo(self):
+        """{nome: estatísticas em ms}, da operação mais cara para a mais barata."""
+        resumo = {}
+        for nome, h in sorted(self.histogramas.items(), key=lambda item: -item[1]["total"]):
+            rotulos = [f"<={limite}" for limite in self.LIMITES_MS]
+            rotulos.append(f">{self.LIMITES_MS[-1]}")
+            resumo[nome] = {
+                "n": h["n"],
+                "total_ms": h["total"] * 1000,
+                "media_ms": h["total"] * 1000 / h["n"],
+                "p50_ms": self.percentil(h, 0.5),
+                "p95_ms": self.percentil(h, 0.95),
+                "maximo_ms": h["maximo"] * 1000,
+                "baldes_ms": dict(zip(rotulos, h["baldes"])),
+            }
+        return resumo
 
-        # Aplicar as cores do tema padrão ao widget de texto
-        color_config(self.texto)
+    def exportar(self, caminho, extra=None):
+        """Grava o resumo em JSON; `extra` junta outras secções (ex.: o agendador)."""
+        dados = {"data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "operacoes": self.resumo()}
+        dados.update(extra or {})
+        with open(caminho, "w", encoding="utf-8") as ficheiro:
+            json.dump(dados, ficheiro, indent=2, ensure_ascii=False)
 
-        # Substituir algumas cores
-        self.texto.tag_configure("COMMENT", foreground="grey")
-        self.texto.tag_configure("STRING", foreground="orange")
-        self.texto.tag_configure("DEFINITION", foreground="green")
-        self.texto.tag_configure("BUILTIN", foreground="green")
+    @property
+    def a_perfilar(self):
+        return self._perfil is not None
 
-    def _configurar_scroll_sincronizado(self):
-        """Configura a sincronização de scroll entre o texto principal e os números de linha"""
-        def _sincronizar(*args):
-            # Atualiza a scrollbar
-            self.scrollbar_texto.set(*args)
-            # Sincroniza os números de linha, se visíveis
-            if self.mostrar_numeros_linha.get():
-                self.numeros_linha.yview_moveto(args[0])
+    def iniciar_perfil(self):
+        import cProfile
+        self._perfil = cProfile.Profile()
+        self._perfil.enable()
 
-        self.texto.config(yscrollcommand=_sincronizar)
+    def parar_perfil(self, caminho=None):
+        """Pára o cProfile; grava as estatísticas (.prof) e devolve as mais caras."""
+        import pstats
+        self._perfil.disable()
+        perfil, self._perfil = self._perfil, None
+        if caminho:
+            perfil.dump_stats(caminho)
+        saida = io.StringIO()
+        pstats.Stats(perfil, stream=saida).sort_stats("cumulative").print_stats(25)
+        return saida.getvalue()
 
-    def atualizar_numeros_linha(self):
-        """Atualiza os números de linha"""
-        # Não mostrar números de linha
-        if not self.mostrar_numeros_linha.get():
+
+# Um só medidor para a aplicação: os decoradores são aplicados às classes
+medidor = MedidorDesempenho()
+
+
+class ObservadorEdicoes(Delegator):
+    """Filtro do Percolator que avisa quais as linhas alteradas por cada edição.
+
+    Cada ouvinte é chamado com (linha, removidas, inseridas): as linhas
+    [linha, linha + removidas) foram substituídas por `inseridas` linhas novas.
+    Os ouvintes de texto recebem (inicio, fim, texto): o intervalo [inicio, fim)
+    (índices de antes da edição) foi substituído por `texto`.
+    No modo de ficheiro grande as linhas são as do documento (somando
+    `deslocamento`), mas os índices de texto continuam a ser os do widget.
+    """
+
+    def __init__(self):
+        Delegator.__init__(self)
+        self.ouvintes = []
+        self.ouvintes_texto = []
+        # Linhas do documento antes da primeira linha do widget
+        self.deslocamento = 0
+        # Alterações que não são edições (ex.: trocar a janela de um
+        # ficheiro grande) não são notificadas
+        self.suspenso = False
+
+    def adicionar_ouvinte(self, funcao):
+        self.ouvintes.append(funcao)
+
+    def adicionar_ouvinte_texto(self, funcao):
+        self.ouvintes_texto.append(funcao)
+
+    def _notificar(self, linha, removidas, inseridas):
+        linha += self.deslocamento
+        for funcao in self.ouvintes:
+            funcao(linha, removidas, inseridas)
+
+    def insert(self, index, chars, tags=None):
+        index = self.index(index)
+        # O Tk insere sempre antes da última quebra de linha
+        if self.compare(index, ">", "end-1c"):
+            index = self.index("end-1c")
+        self.delegate.insert(index, chars, tags)
+        if self.suspenso:
             return
+        for funcao in self.ouvintes_texto:
+            funcao(index, index, chars)
+        self._notificar(int(index.split('.')[0]), 1, chars.count('\n') + 1)
 
-        # Guardar a posição atual do scroll para restaurar depois
-        scroll_pos = self.texto.yview()
+    def delete(self, index1, index2=None):
+        inicio = self.index(index1)
+        fim = self.index(index2) if index2 else self.index(f"{inicio}+1c")
+        if self.compare(fim, ">", "end-1c"):
+            fim = self.index("end-1c")
+        vazio = self.compare(inicio, ">=", fim)
+        self.delegate.delete(index1, index2)
+        if vazio or self.suspenso:
+            return  # Nada foi apagado (ou não é uma edição)
+        for funcao in self.ouvintes_texto:
+            funcao(inicio, fim, "")
+        linha_inicio = int(inicio.split('.')[0])
+        linha_fim = int(fim.split('.')[0])
+        self._notificar(linha_inicio, linha_fim - linha_inicio + 1, 1)
 
-        try:
-            # O índice 'end-1c' dá a posição do último caractere
-            linhas = int(self.texto.index(f"{tk.END}-1c").split('.')[0])
-        except tk.TclError:
-            linhas = 1  # Se o widget estiver vazio, ainda temos 1 linha
 
-        # Gerar os números de linha
-        # Numa string, cada número separado por uma quebra de linha
-        # Da linha 1 até "linhas" (+ 1, porque 2º valor de range não é inclusivo)
-        numeros = '\n'.join(str(i) for i in range(1, linhas + 1))
+class TextoComprimido:
+    """Texto guardado comprimido (zlib): no histórico de undo e nos separadores inativos."""
 
-        # Atualizar o widget de números de linha e restaurar o scroll
-        self.numeros_linha.config(state='normal')
-        self.numeros_linha.delete(1.0, tk.END)
-        self.numeros_linha.insert(1.0, numeros)
-        self.numeros_linha.config(state='disabled')
-        self.numeros_linha.yview_moveto(scroll_pos[0])
+    # Textos maiores do que isto (caracteres) não ficam em texto simples
+    LIMITE = 64 * 1024
 
-    def alternar_numeros_linha(self):
-        """Mostra ou oculta os números de linha baseado no estado do checkbox"""
-        if self.mostrar_numeros_linha.get():
-            self.numeros_linha.pack(fill="both", expand=True)
-            self.atualizar_numeros_linha()
+    def __init__(self, texto):
+        self.dados = zlib.compress(texto.encode("utf-8", "surrogatepass"), 1)
+        self.caracteres = len(texto)
+
+    def __len__(self):
+        return self.caracteres
+
+    def texto(self):
+        return zlib.decompress(self.dados).decode("utf-8", "surrogatepass")
+
+
+class ComandoInserir(InsertCommand):
+    """Inserção que não guarda o texto quando este é grande.
+
+    Desfazer só precisa dos índices; o texto é relido do widget nesse
+    momento e guardado comprimido, para poder ser refeito.
+    """
+
+    def do(self, text):
+        InsertCommand.do(self, text)
+        if len(self.chars) > TextoComprimido.LIMITE:
+            self.chars = None
+
+    def undo(self, text):
+        if self.chars is None:
+            self.chars = TextoComprimido(text.get(self.index1, self.index2))
+        InsertCommand.undo(self, text)
+
+    def redo(self, text):
+        if isinstance(self.chars, TextoComprimido):
+            self.chars = self.chars.texto()
+            InsertCommand.redo(self, text)
+            self.chars = None
         else:
-            self.numeros_linha.pack_forget()
+            InsertCommand.redo(self, text)
 
+    def merge(self, cmd):
+        """Junta a tecla seguinte, como o InsertCommand; um espaço junta-se à palavra anterior."""
+        if (self.__class__ is not cmd.__class__ or not isinstance(self.chars, str)
+                or self.index2 != cmd.index1 or self.tags != cmd.tags
+                or len(cmd.chars) != 1):
+            return False
+        if (self.chars and cmd.chars != " "
+                and self.classify(self.chars[-1]) != self.classify(cmd.chars)):
+            return False
+        self.index2 = cmd.index2
+        self.chars = self.chars + cmd.chars
+        return True
 
-class PainelFerramentas:
-    """Gerencia o painel de ferramentas lateral."""
-    
-    def __init__(self, parent, area_texto, gestor_ficheiros):
-        self.parent = parent
-        self.area_texto = area_texto
-        self.gestor_ficheiros = gestor_ficheiros
-        self._configurar_painel()
 
-    def _configurar_painel(self):
-        self.frame = tk.Frame(self.parent, relief=tk.RAISED, bd=2)
+class ComandoApagar(DeleteCommand):
+    """Remoção que guarda comprimido o texto apagado, quando é grande."""
 
-        # dicionário para criar os botões
-        botoes = {
-            "Novo": self.gestor_ficheiros.novo_ficheiro,
-            "Abrir": self.gestor_ficheiros.abrir_ficheiro,
-            "Gravar": self.gestor_ficheiros.gravar_ficheiro,
-            "Gravar Como": self.gestor_ficheiros.gravar_como,
-            # Não implementado
-            "Verificar Sintaxe": self._verificar_sintaxe 
-        }
+    def do(self, text):
+        DeleteCommand.do(self, text)
+        if len(self.chars) > TextoComprimido.LIMITE:
+            self.chars = TextoComprimido(self.chars)
 
-        # criação dos botões utilizando o dicionário
-        for i, (texto_botao, comando) in enumerate(botoes.items()):
-            botao = tk.Button(self.frame, text=texto_botao, command=comando)
-            botao.grid(row=i, column=0, padx=5, pady=5, sticky="ew")
+    def undo(self, text):
+        guardado = self.chars
+        if isinstance(guardado, TextoComprimido):
+            self.chars = guardado.texto()
+        DeleteCommand.undo(self, text)
+        self.chars = guardado
 
-        # Checkbox para mostrar/ocultar números de linha
-        checkbox_numeros = tk.Checkbutton(
-            self.frame, text="Números de Linha",
-            variable=self.area_texto.mostrar_numeros_linha,
-            command=self.area_texto.alternar_numeros_linha
-        )
-        checkbox_numeros.grid(row=len(botoes), column=0,
-                              padx=5, pady=5, sticky="w")
+    def merge(self, cmd):
+        """Junta remoções seguidas de um caractere (Backspace ou Delete)."""
+        if (self.__class__ is not cmd.__class__ or not isinstance(self.chars, str)
+                or not self.chars or len(cmd.chars) != 1
+                or "\n" in self.chars + cmd.chars):
+            return False
+        classe = self.classify(cmd.chars)
+        if cmd.index2 == self.index1 and self.classify(self.chars[0]) == classe:
+            # Backspace: o caractere apagado está antes dos anteriores
+            self.index1 = cmd.index1
+            self.chars = cmd.chars + self.chars
+        elif cmd.index1 == self.index1 and self.classify(self.chars[-1]) == classe:
+            # Delete: o caractere apagado estava depois dos anteriores
+            linha, coluna = map(int, self.index2.split('.'))
+            self.index2 = f"{linha}.{coluna + 1}"
+            self.chars = self.chars + cmd.chars
+        else:
+            return False
+        self.marks_after = cmd.marks_after
+        return True
 
-        # Controles de formatação
-        self._configurar_controles_formatacao(len(botoes) + 1)
+    classify = InsertCommand.classify
+    alphanumeric = InsertCommand.alphanumeric
 
-    def _configurar_controles_formatacao(self, linha_inicial):
-        # Label e seleção de cor do texto
-        label_cor = tk.Label(self.frame, text="Cor do Texto:")
-        label_cor.grid(row=linha_inicial, column=0,
-                       padx=5, pady=(10, 0), sticky="w")
 
-        # Frame para os botões de cor
-        frame_cores = tk.Frame(self.frame)
-        frame_cores.grid(row=linha_inicial + 1, column=0,
-                         padx=5, pady=5, sticky="w")
+class ComandoCores(Command):
+    """Repõe as cores do utilizador num troço, dentro de um bloco de undo.
 
-        # Dicionário com cores disponíveis
-        self.cores_disponiveis = {
-            "Preto": "black", "Azul": "blue", "Vermelho": "red",
-            "Verde": "green", "Roxo": "purple", "Laranja": "orange"
-        }
+    Não mexe no texto. No início do bloco (ao_desfazer=True) repõe as cores
+    antigas quando o texto antigo volta; no fim, põe as novas depois de o
+    texto novo ser inserido (ao fazer e ao refazer). `repor` é
+    AreaTexto.repor_cores.
+    """
 
-        # Pre-configurar tags de cor para o texto
-        for cor in self.cores_disponiveis.values():
-            self.area_texto.texto.tag_config(f"color_{cor}", foreground=cor)
+    def __init__(self, repor, inicio, fim, intervalos, ao_desfazer):
+        Command.__init__(self, inicio, fim, None)
+        self.repor = repor
+        self.intervalos = intervalos
+        self.ao_desfazer = ao_desfazer
 
-        # Criar botões para cada cor
-        for i, (nome_cor, valor_cor) in enumerate(self.cores_disponiveis.items()):
-            botao_cor = tk.Button(
-                frame_cores, text=nome_cor, bg=valor_cor, width=8,
-                fg="white" if valor_cor in [
-                    "black", "blue", "purple"] else "black",
-                command=lambda cor=valor_cor: self._alterar_cor_texto(cor)
-            )
-            # Organizar em 2 colunas
-            botao_cor.grid(row=i // 2, column=i % 2, padx=2, pady=2)
+    def do(self, text):
+        if not self.ao_desfazer:
+            self.repor(self.index1, self.index2, self.intervalos)
 
-        # Label paraa o tamanho da fonte
-        label_tamanho_fonte = tk.Label(self.frame, text="Tamanho da Fonte:")
-        label_tamanho_fonte.grid(
-            row=linha_inicial + 2, column=0, padx=5, pady=(10, 0), sticky="w")
+    redo = do
 
-        # Variável para controlar o tamanho da fonte
-        self.tamanho_fonte_var = tk.IntVar(value=12)
+    def undo(self, text):
+        if self.ao_desfazer:
+            self.repor(self.index1, self.index2, self.intervalos)
 
-        # Slider para alterar tamanho da fonte
-        slider_tamanho_fonte = tk.Scale(
-            # Intervalo de valores e orientação vertical
-            self.frame, from_=10, to=16, orient=tk.HORIZONTAL,
-            variable=self.tamanho_fonte_var,
-            # Função que é chamada quando se acciona o slider
-            command=self._alterar_tamanho_fonte
-        )
-        
-        slider_tamanho_fonte.grid(
-            row=linha_inicial + 3, column=0, padx=5, pady=5, sticky="ew")
 
-        # Label e combobox para a família da fonte
-        label_familia_fonte = tk.Label(self.frame, text="Família da Fonte:")
-        label_familia_fonte.grid(
-            row=linha_inicial + 4, column=0, padx=5, pady=(10, 0), sticky="w")
+class HistoricoUndo(UndoDelegator):
+    """UndoDelegator com um limite de memória.
 
-        # Opções de família de fonte disponíveis
-        familias_fonte_disponiveis = [
-            "Arial", "Times New Roman", "Courier New"]
+    Os blocos grandes não ficam em texto simples (ver ComandoInserir e
+    ComandoApagar) e, quando o histórico passa de `orcamento` bytes, as
+    entradas mais antigas são descartadas. `tamanho` é a memória estimada
+    em uso pelo histórico.
+    """
 
-        self.combobox_familia_fonte = ttk.Combobox(
-            self.frame, values=familias_fonte_disponiveis,
-            state="readonly", width=15  # impede edição manual
-        )
-        self.combobox_familia_fonte.set(self.area_texto.familia_fonte)
-        self.combobox_familia_fonte.bind(
-            "<<ComboboxSelected>>", self._alterar_familia_fonte)
-        self.combobox_familia_fonte.grid(
-            row=linha_inicial + 5, column=0, padx=5, pady=5, sticky="ew")
+    # Memória máxima (bytes, estimada) do histórico
+    ORCAMENTO = 64 * 1024 * 1024
+    # Custo estimado de cada entrada (objeto e índices) e de cada marca guardada
+    CUSTO_ENTRADA = 400
+    CUSTO_MARCA = 120
+    # Custo estimado de cada intervalo de cor guardado (ComandoCores)
+    CUSTO_INTERVALO = 100
 
-    def _alterar_cor_texto(self, nova_cor):
-        """Altera a cor do texto selecionado no editor."""
-        try:
-            # Obter os índices do texto selecionado
-            start, end = self.area_texto.texto.tag_ranges(tk.SEL)
-        except ValueError:
-            return  # Nenhum texto selecionado
+    def __init__(self, orcamento=None):
+        self.orcamento = orcamento or self.ORCAMENTO
+        # Trocas do documento inteiro (ex.: mudar de separador) passam
+        # direto, sem copiar para o histórico o texto que vai ser descartado
+        self.suspenso = False
+        UndoDelegator.__init__(self)
 
-        # Remover tags de cor existentes da seleção
-        for cor in self.cores_disponiveis.values():
-            self.area_texto.texto.tag_remove(f"color_{cor}", start, end)
+    def reset_undo(self):
+        UndoDelegator.reset_undo(self)
+        self.tamanho = 0
 
-        # Adicionar a nova tag de cor à seleção
-        if nova_cor != "black":
-            self.area_texto.texto.tag_add(f"color_{nova_cor}", start, end)
+    # Estado de um histórico, para o trocar com o de outro documento
+    CAMPOS_ESTADO = ("undolist", "pointer", "saved", "was_saved", "can_merge", "tamanho")
 
-    def _alterar_tamanho_fonte(self, novo_tamanho_str):
-        """Altera o tamanho da fonte no editor e nos números de linha."""
-        novo_tamanho = int(novo_tamanho_str)
-        nova_fonte = (self.area_texto.familia_fonte, novo_tamanho, "bold")
+    def exportar_estado(self):
+        """Devolve o histórico atual e fica com um histórico vazio."""
+        estado = {campo: getattr(self, campo) for campo in self.CAMPOS_ESTADO}
+        self.reset_undo()
+        return estado
 
-        self.area_texto.texto.config(font=nova_fonte)
-        self.area_texto.numeros_linha.config(font=nova_fonte)
-        self.area_texto.atualizar_numeros_linha()
+    def importar_estado(self, estado):
+        self.reset_undo()
+        for campo, valor in estado.items():
+            setattr(self, campo, valor)
+        # A escrita que se seguir não se junta à última entrada do outro documento
+        self.can_merge = False
 
-    def _alterar_familia_fonte(self, event=None):
-        """Altera a família da fonte no editor e nos números de linha."""
-        nova_familia = self.combobox_familia_fonte.get()
-        self.area_texto.familia_fonte = nova_familia
+    def insert(self, index, chars, tags=None):
+        if self.suspenso:
+            self.delegate.insert(index, chars, tags)
+            return
+        self.addcmd(ComandoInserir(index, chars, tags))
 
-        nova_fonte = (nova_familia, self.tamanho_fonte_var.get(), "bold")
-        self.area_texto.texto.config(font=nova_fonte)
-        self.area_texto.numeros_linha.config(font=nova_fonte)
-        self.area_texto.atualizar_numeros_linha()
+    def delete(self, index1, index2=None):
+        if self.suspenso:
+            self.delegate.delete(index1, index2)
+            return
+        self.addcmd(ComandoApagar(index1, index2))
 
-    # Não implementado
-    # Verificação de error no código
-    def _verificar_sintaxe(self):
-        if hasattr(self.parent, 'verificar_sintaxe'):
-            self.parent.verificar_sintaxe()
+    def addcmd(self, cmd, execute=True):
+        # Igual ao UndoDelegator.addcmd, mas a contar a memória de cada entrada
+        if execute:
+            cmd.do(self.delegate)
+        if self.undoblock != 0:
+            self.undoblock.append(cmd)
+            return
+        if self.can_merge and self.pointer > 0:
+            ultimo = self.undolist[self.pointer - 1]
+            if ultimo.merge(cmd):
+                self._medir(ultimo)
+                return
+        # As entradas que podiam ser refeitas deixam de poder
+        for descartada in self.undolist[self.pointer:]:
+            self.tamanho -= descartada.memoria
+        self.undolist[self.pointer:] = [cmd]
+        cmd.memoria = 0
+        self._medir(cmd)
+        if self.saved > self.pointer:
+            self.saved = -1
+        self.pointer = self.pointer + 1
+        self._limitar()
+        self.can_merge = True
+        self.check_saved()
 
+    def undo_event(self, event):
+        cmd = self.undolist[self.pointer - 1] if self.pointer else None
+        resultado = UndoDelegator.undo_event(self, event)
+        if cmd is not None:
+            # Uma inserção desfeita passa a guardar o seu texto
+            self._medir(cmd)
+            self._limitar()
+        return resultado
 
-class PainelPesquisa:
-    """Gerencia o painel de pesquisa."""
+    def redo_event(self, event):
+        cmd = self.undolist[self.pointer] if self.pointer < len(self.undolist) else None
+        resultado = UndoDelegator.redo_event(self, event)
+        if cmd is not None:
+            self._medir(cmd)
+        return resultado
 
-    def __init__(self, parent, area_texto):
-        self.parent = parent
-        self.area_texto = area_texto
-        # Lista para armazenar informações dos resultados
-        self.resultados_pesquisa = []
-        self._configurar_painel()
+    def _estimar(self, cmd):
+        if isinstance(cmd, CommandSequence):
+            return sum(map(self._estimar, cmd.cmds))
+        if isinstance(cmd, ComandoCores):
+            return self.CUSTO_ENTRADA + self.CUSTO_INTERVALO * len(cmd.intervalos)
+        if isinstance(cmd.chars, TextoComprimido):
+            texto = len(cmd.chars.dados)
+        else:
+            texto = sys.getsizeof(cmd.chars) if cmd.chars else 0
+        marcas = len(cmd.marks_before) + len(cmd.marks_after)
+        return texto + self.CUSTO_ENTRADA + self.CUSTO_MARCA * marcas
 
-    def _configurar_painel(self):
-        # Frame para o painel de pesquisa
-        self.frame = tk.Frame(self.parent, relief=tk.RAISED, bd=2)
+    def _medir(self, cmd):
+        memoria = self._estimar(cmd)
+        self.tamanho += memoria - cmd.memoria
+        cmd.memoria = memoria
 
-        # Campo de pesquisa e botões
-        label_termo = tk.Label(self.frame, text="Pesquisar:")
-        label_termo.grid(row=0, column=0, padx=(5, 2), pady=3, sticky="w")
+    def _limitar(self):
+        """Descarta as entradas mais antigas até caber no orçamento."""
+        while self.pointer > 0 and (len(self.undolist) > self.max_undo
+                                    or self.tamanho > self.orcamento):
+            descartada = self.undolist.pop(0)
+            self.tamanho -= descartada.memoria
+            self.pointer = self.pointer - 1
+            if self.saved >= 0:
+                self.saved = self.saved - 1
 
-        self.entry_pesquisa = tk.Entry(self.frame, width=8)
-        self.entry_pesquisa.grid(row=0, column=1, padx=2, pady=3)
-        # tecla Enter chama a função de pesquisa de texto
-        self.entry_pesquisa.bind("<Return>", self.pesquisar_texto)
 
-        # Carregando no botão chama a mesma função
-        btn_pesquisar = tk.Button(
-            self.frame, text="Pesquisar", command=self.pesquisar_texto)
-        btn_pesquisar.grid(row=0, column=2, padx=2, pady=3)
+class IndicePesquisa:
+    """Cache das linhas do documento e dos resultados das últimas pesquisas.
+
+    As linhas alteradas ficam marcadas como None e só são relidas do widget
+    na pesquisa seguinte; o mesmo acontece com os resultados guardados, por
+    isso repetir uma pesquisa só volta a analisar as linhas editadas.
+    No modo de ficheiro grande as linhas são lidas do DocumentoLinhas.
+    """
+
+    # Número de pesquisas diferentes cujos resultados são mantidos
+    MAX_PESQUISAS_GUARDADAS = 8
+
+    def __init__(self, texto):
+        self.texto = texto
+        # Texto de cada linha e a sua versão em minúsculas (None = por ler)
+        self._linhas = None
+        self._linhas_min = None
+        # Número de entradas None em self._linhas
+        self._por_ler = 0
+        # chave da pesquisa -> lista, por linha, de tuplos (inicio, fim)
+        self._resultados = OrderedDict()
+        # Incrementada a cada edição, para detetar pesquisas desatualizadas
+        self.versao = 0
+        # Documento fora do widget (modo de ficheiro grande) e função que lhe
+        # passa as edições ainda só feitas no widget
+        self.documento = None
+        self._antes_de_ler = None
+
+    def usar_documento(self, documento, antes_de_ler=None):
+        """Passa a ler as linhas de um DocumentoLinhas (None: do widget)."""
+        self.documento = documento
+        self._antes_de_ler = antes_de_ler
+        self.limpar()
+
+    def invalidar_linhas(self, linha, removidas, inseridas):
+        """Ouvinte do ObservadorEdicoes: marca as linhas editadas como por ler."""
+        self.versao += 1
+        if self._linhas is None:
+            return
+        i = linha - 1
+        novas = [None] * inseridas
+        self._por_ler += inseridas - sum(
+            1 for l in self._linhas[i:i + removidas] if l is None)
+        self._linhas[i:i + removidas] = novas
+        self._linhas_min[i:i + removidas] = novas
+        for resultados in self._resultados.values():
+            resultados[i:i + removidas] = novas
+
+    def limpar(self):
+        """Descarta toda a cache (ex.: ao abrir outro ficheiro)."""
+        self.versao += 1
+        self._linhas = None
+        self._linhas_min = None
+        self._por_ler = 0
+        self._resultados.clear()
+
+    def _carregar_tudo(self):
+        if self.documento is not None:
+            self._linhas = self.documento.todas_linhas()
+            # Uma cópia em minúsculas duplicaria um ficheiro que já é grande
+            self._linhas_min = MinusculasPorPedido(self._linhas)
+        else:
+            self._linhas = self.texto.get("1.0", "end-1c").split('\n')
+            self._linhas_min = [linha.lower() for linha in self._linhas]
+        self._por_ler = 0
+        self._resultados.clear()
+
+    def _atualizar_linhas(self):
+        """Relê do widget apenas as linhas marcadas como alteradas."""
+        if self.documento is not None:
+            self._antes_de_ler()
+            total = self.documento.total_linhas
+        else:
+            total = int(self.texto.index("end-1c").split('.')[0])
+        # Muitas linhas por ler (ou cache dessincronizada): ler tudo de uma vez
+        if (self._linhas is None or len(self._linhas) != total
+                or self._por_ler > total // 4):
+            self._carregar_tudo()
+            return
+        i = 0
+        while self._por_ler:
+            i = self._linhas.index(None, i)
+            if self.documento is not None:
+                linha = self.documento.linha(i)
+            else:
+                linha = self.texto.get(f"{i + 1}.0", f"{i + 1}.end")
+            self._linhas[i] = linha
+            self._linhas_min[i] = linha.lower()
+            self._por_ler -= 1
+
+    @staticmethod
+    def _compilar(termo, maiusculas, palavra_inteira, regex):
+        """Expressão regular da pesquisa (pode levantar re.error, tratado por quem chama)."""
+        return rtxt.compilar_procura(termo, maiusculas, palavra_inteira, regex)
+
+    @staticmethod
+    def _criar_procura(termo, maiusculas, palavra_inteira, regex):
+        """Devolve uma função linha, linha_min -> tuplo de (inicio, fim).
+
+        A função tem o atributo `alvo` (texto literal a procurar, ou None)
+        e `em_minusculas`, usados para filtrar rapidamente as linhas candidatas.
+        """
+        if not regex and not palavra_inteira:
+            chave_min = not maiusculas
+            alvo = termo if maiusculas else termo.lower()
+            tamanho = len(termo)
+            padrao_min = re.compile(re.escape(termo), re.IGNORECASE)
+
+            def procurar(linha, linha_min):
+                base = linha_min if chave_min else linha
+                if alvo not in base:
+                    return ()
+                # lower() pode mudar o comprimento de alguns caracteres;
+                # nesse caso as colunas vêm da expressão regular
+                if chave_min and len(linha_min) != len(linha):
+                    return tuple(m.span() for m in padrao_min.finditer(linha))
+                ocorrencias = []
+                pos = base.find(alvo)
+                while pos != -1:
+                    ocorrencias.append((pos, pos + tamanho))
+                    pos = base.find(alvo, pos + tamanho)
+                return tuple(ocorrencias)
+            procurar.alvo = alvo
+            procurar.em_minusculas = chave_min
+            return procurar
+
+        compilado = IndicePesquisa._compilar(termo, maiusculas, palavra_inteira, regex)
+
+        def procurar(linha, linha_min):
+            # Ocorrências vazias (ex.: "a*") não são realçáveis
+            return tuple(m.span() for m in compilado.finditer(linha)
+                         if m.end() > m.start())
+        procurar.alvo = None
+        return procurar
+
+    def _preencher(self, por_linha, procura, inicio, fim):
+        """Calcula as ocorrências das linhas [inicio, fim) ainda por analisar."""
+        parte = por_linha[inicio:fim]
+        if procura.alvo is not None and parte.count(None) == len(parte):
+            # Parte nova: as linhas candidatas são filtradas em C (map/compress)
+            # para não pagar um ciclo Python por linha
+            base = self._linhas_min if procura.em_minusculas else self._linhas
+            por_linha[inicio:fim] = [()] * (fim - inicio)
+            candidatas = compress(range(inicio, fim), map(
+                str.__contains__, base[inicio:fim], repeat(procura.alvo)))
+            for i in candidatas:
+                por_linha[i] = procura(self._linhas[i], self._linhas_min[i])
+        elif None in parte:
+            # Só as linhas editadas desde a última vez voltam a ser analisadas
+            for j, ocorrencias in enumerate(parte):
+                if ocorrencias is None:
+                    i = inicio + j
+                    por_linha[i] = procura(self._linhas[i], self._linhas_min[i])
+
+    def procurar_por_partes(self, termo, maiusculas=False, palavra_inteira=False,
+                            regex=False, linhas_por_parte=5000):
+        """Prepara uma pesquisa que é feita aos bocados.
+
+        Devolve um gerador que produz, para cada bloco de linhas, a lista das
+        ocorrências (num_linha, inicio, fim). O gerador termina com valor
+        False se o texto for editado a meio (a pesquisa ficou desatualizada).
+        Levanta re.error logo aqui se a expressão regular for inválida.
+        """
+        procura = self._criar_procura(termo, maiusculas, palavra_inteira, regex)
+        self._atualizar_linhas()
+        chave = (termo, maiusculas, palavra_inteira, regex)
+        por_linha = self._resultados.get(chave)
+        if por_linha is None:
+            # Fica guardada desde já, para que as edições a mantenham alinhada
+            # e uma pesquisa interrompida aproveite o que já foi calculado
+            por_linha = [None] * len(self._linhas)
+            self._resultados[chave] = por_linha
+            if len(self._resultados) > self.MAX_PESQUISAS_GUARDADAS:
+                self._resultados.popitem(last=False)
+        else:
+            self._resultados.move_to_end(chave)
+        return self._gerar_partes(por_linha, procura, linhas_por_parte)
+
+    def _gerar_partes(self, por_linha, procura, linhas_por_parte):
+        versao = self.versao
+        total = len(por_linha)
+        for inicio in range(0, total, linhas_por_parte):
+            if self.versao != versao:
+                return False
+            fim = min(inicio + linhas_por_parte, total)
+            self._preencher(por_linha, procura, inicio, fim)
+            # Os tuplos vazios (linhas sem ocorrências) são descartados pelo compress
+            yield [(i + 1, a, b)
+                   for i in compress(range(inicio, fim), por_linha[inicio:fim])
+                   for a, b in por_linha[i]]
+        return True
+
+    def procurar(self, termo, maiusculas=False, palavra_inteira=False, regex=False):
+        """Devolve todas as ocorrências como tuplos (num_linha, inicio, fim)."""
+        ocorrencias = []
+        for parte in self.procurar_por_partes(
+                termo, maiusculas, palavra_inteira, regex, linhas_por_parte=1 << 30):
+            ocorrencias += parte
+        return ocorrencias
+
+    def substituicoes(self, termo, substituto, maiusculas=False, palavra_inteira=False,
+                      regex=False):
+        """Devolve as ocorrências como tuplos (num_linha, inicio, fim, texto_novo).
+
+        Com regex, `substituto` pode ter referências a grupos (\\1, \\g<nome>),
+        como no re.sub. Levanta re.error se o termo ou o substituto forem inválidos.
+        """
+        ocorrencias = self.procurar(termo, maiusculas, palavra_inteira, regex)
+        if not regex or "\\" not in substituto:
+            # Sem referências a grupos o texto novo é sempre o mesmo
+            return [(*ocorrencia, substituto) for ocorrencia in ocorrencias]
+        padrao = self._compilar(termo, maiusculas, palavra_inteira, regex)
+        # Valida o substituto (ex.: grupo que não existe) antes de começar
+        padrao.sub(substituto, "")
+        # Match.expand volta a analisar o substituto a cada chamada; o re.sub
+        # analisa-o uma vez. Com o texto novo entre separadores que não
+        # aparecem na linha, uma chamada ao sub por linha dá todos os textos novos
+        separador = "\0"
+        modelo = separador + substituto + separador
+        resultado = []
+        for num_linha, grupo in groupby(ocorrencias, key=lambda ocorrencia: ocorrencia[0]):
+            grupo = list(grupo)
+            linha = self._linhas[num_linha - 1]
+            novos = ()
+            if separador not in linha and separador not in substituto:
+                novos = padrao.sub(modelo, linha).split(separador)[1::2]
+            if len(novos) != len(grupo):
+                # Ocorrências vazias (que a pesquisa não conta) desalinham as listas
+                novos = [m.expand(substituto) for m in padrao.finditer(linha)
+                         if m.end() > m.start()]
+            resultado += [(*ocorrencia, novo) for ocorrencia, novo in zip(grupo, novos)]
+        return resultado
+
+    def linha(self, num_linha):
+        """Texto de uma linha já lida pelo índice."""
+        return self._linhas[num_linha - 1]
+
+
+class MinusculasPorPedido:
+    """Versão em minúsculas de uma lista de linhas, calculada só quando é lida."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(map(str.lower, self.linhas[i]))
+        return self.linhas[i].lower()
+
+    def __setitem__(self, i, valor):
+        pass  # Acompanha sempre self.linhas
+
+
+class IndiceSimbolos:
+    """Classes, funções e atribuições Python do documento.
+
+    O texto é partido em blocos de topo: cada linha sem indentação começa
+    um bloco, exceto as continuações (else, except, fechar parênteses...)
+    e o que vem depois de um decorador; linhas vazias e comentários ficam
+    no bloco anterior. Cada bloco é analisado sozinho com o ast e os seus
+    símbolos (com linhas relativas ao bloco) ficam em cache pelo hash do
+    texto. As edições só marcam linhas como sujas: atualizar() relê e
+    analisa apenas os blocos que as contêm.
+    """
+
+    MAX_CACHE = 4096
+    # Com mais edições do que isto por atualizar, o documento é relido todo
+    MAX_EDICOES = 200
+    CONTINUACAO = re.compile(r"(?:else|elif|except|finally)\b|[)\]}]")
+    # Usado quando um bloco não compila (ex.: a meio de ser escrito)
+    APROXIMADO = re.compile(
+        r"^([ \t]*)(?:(class)|(?:async[ \t]+)?(def))[ \t]+(\w+)"
+        r"|^(\w+)[ \t]*(?::[^=\n]*)?=(?!=)", re.M)
+
+    def __init__(self, texto):
+        self.texto = texto
+        # Blocos por ordem: [primeira linha (a contar de 0), número de linhas, símbolos]
+        self.blocos = []
+        # Muda quando a lista de símbolos (sem contar as linhas) muda
+        self.versao = 0
+        self._cache = OrderedDict()
+        self._edicoes = []
+        self._tudo = True
+
+    def invalidar_linhas(self, linha, removidas, inseridas):
+        """Ouvinte do ObservadorEdicoes."""
+        if self._tudo:
+            return
+        if len(self._edicoes) >= self.MAX_EDICOES:
+            self.limpar()
+        else:
+            self._edicoes.append((linha - 1, removidas, inseridas))
+
+    def limpar(self):
+        """O documento mudou todo (ex.: outro separador): é relido no próximo atualizar()."""
+        self._tudo = True
+        self._edicoes = []
+
+    def atualizar(self):
+        if self._tudo:
+            self._tudo = False
+            self._edicoes = []
+            antes = self.blocos
+            self.blocos = []
+            self._reler(0, 0, antes)
+            return
+        if not self._edicoes:
+            return
+        sujo = None
+        removidos = []
+        for linha, removidas, inseridas in self._edicoes:
+            sujo = self._aplicar_edicao(sujo, removidos, linha, removidas, inseridas)
+        self._edicoes = []
+        inicio, fim = sujo
+        # Os blocos que sobram dentro da zona suja também são relidos
+        primeiro = self._procurar_bloco(inicio)
+        ultimo = primeiro
+        while ultimo < len(self.blocos) and self.blocos[ultimo][0] < fim:
+            fim = max(fim, self.blocos[ultimo][0] + self.blocos[ultimo][1])
+            ultimo += 1
+        if primeiro < ultimo:
+            inicio = min(inicio, self.blocos[primeiro][0])
+        removidos += self.blocos[primeiro:ultimo]
+        del self.blocos[primeiro:ultimo]
+        self._reler(primeiro, inicio, removidos, fim)
+
+    def _procurar_bloco(self, linha):
+        """Índice do primeiro bloco que acaba depois de `linha`."""
+        inicios = [bloco[0] for bloco in self.blocos]
+        i = bisect_right(inicios, linha) - 1
+        if i < 0 or self.blocos[i][0] + self.blocos[i][1] <= linha:
+            i += 1
+        return i
+
+    def _aplicar_edicao(self, sujo, removidos, linha, removidas, inseridas):
+        """Desloca os blocos, tira os editados (para `removidos`) e devolve a
+        zona suja [inicio, fim) atualizada."""
+        fim = linha + removidas
+        delta = inseridas - removidas
+        i = self._procurar_bloco(linha)
+        j = i
+        inicio_sujo, fim_sujo = linha, fim
+        while j < len(self.blocos) and self.blocos[j][0] < fim:
+            inicio_sujo = min(inicio_sujo, self.blocos[j][0])
+            fim_sujo = max(fim_sujo, self.blocos[j][0] + self.blocos[j][1])
+            j += 1
+        removidos += self.blocos[i:j]
+        del self.blocos[i:j]
+        for bloco in self.blocos[i:]:
+            bloco[0] += delta
+
+        def deslocar(posicao):
+            if posicao <= linha:
+                return posicao
+            if posicao >= fim:
+                return posicao + delta
+            return linha + inseridas
+        novo = (inicio_sujo, deslocar(fim_sujo))
+        if sujo is not None:
+            novo = (min(novo[0], deslocar(sujo[0])), max(novo[1], deslocar(sujo[1])))
+        return novo
+
+    def _reler(self, posicao, inicio, removidos, fim=None):
+        """Relê as linhas [inicio, fim) (fim None: até ao fim) e põe os seus
+        blocos em self.blocos[posicao]."""
+        blocos = self.blocos
+        while True:
+            ultima = "end-1c" if fim is None else f"{fim + 1}.0"
+            linhas = self.texto.get(f"{inicio + 1}.0", ultima).split('\n')
+            if fim is not None:
+                linhas.pop()  # O que vem depois da última quebra de linha
+            # Uma zona que já não começa um bloco junta-se ao anterior
+            if posicao > 0 and linhas and not self._comeca_bloco(
+                    linhas[0], self._ultimo_topo(blocos[posicao - 1])):
+                posicao -= 1
+                removidos.insert(0, blocos.pop(posicao))
+                inicio = removidos[0][0]
+                continue
+            partes = self._partir(linhas)
+            # e um decorador no fim junta-lhe o bloco seguinte
+            if (posicao < len(blocos) and partes
+                    and self._ultimo_topo(linhas[partes[-1][0]:]).startswith("@")):
+                seguinte = blocos.pop(posicao)
+                removidos.append(seguinte)
+                fim = seguinte[0] + seguinte[1]
+                continue
+            break
+        novos = []
+        for rel, n in partes:
+            codigo = '\n'.join(linhas[rel:rel + n])
+            novos.append([inicio + rel, n, self._simbolos_bloco(codigo)])
+        blocos[posicao:posicao] = novos
+        if ([s[2:] for b in removidos for s in b[2]]
+                != [s[2:] for b in novos for s in b[2]]):
+            self.versao += 1
+
+    def _ultimo_topo(self, bloco_ou_linhas):
+        """Última linha de código sem indentação (de um bloco ou de uma lista de linhas)."""
+        if bloco_ou_linhas and isinstance(bloco_ou_linhas[0], int):
+            inicio, n = bloco_ou_linhas[0], bloco_ou_linhas[1]
+            bloco_ou_linhas = self.texto.get(
+                f"{inicio + 1}.0", f"{inicio + n}.end").split('\n')
+        for linha in reversed(bloco_ou_linhas):
+            if linha[:1] not in ("", " ", "\t", "#"):
+                return linha
+        return ""
+
+    def _comeca_bloco(self, linha, anterior):
+        return (linha[:1] not in ("", " ", "\t", "#")
+                and not self.CONTINUACAO.match(linha)
+                and not anterior.startswith("@"))
+
+    def _partir(self, linhas):
+        """Divide as linhas em blocos: [(primeira, número de linhas), ...]."""
+        partes = []
+        inicio = 0
+        anterior = ""
+        for i, linha in enumerate(linhas):
+            if i and self._comeca_bloco(linha, anterior):
+                partes.append((inicio, i - inicio))
+                inicio = i
+            if linha[:1] not in ("", " ", "\t", "#"):
+                anterior = linha
+        if linhas:
+            partes.append((inicio, len(linhas) - inicio))
+        return partes
+
+    def _simbolos_bloco(self, codigo):
+        chave = (len(codigo), hash(codigo))
+        simbolos = self._cache.get(chave)
+        if simbolos is None:
+            simbolos = self._cache[chave] = self.analisar(codigo)
+            if len(self._cache) > self.MAX_CACHE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(chave)
+        return simbolos
+
+    @classmethod
+    def analisar(cls, codigo):
+        """Símbolos de um bloco: ((linha, coluna, tipo, nome, nível), ...),
+        com as linhas a contar de 0 no início do bloco."""
+        import ast
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                arvore = ast.parse(codigo)
+        except (SyntaxError, ValueError):
+            return cls._analisar_aproximado(codigo)
+        simbolos = []
+
+        def nomes(alvo):
+            # Só os nomes atribuídos (não self.x ou d[k])
+            if isinstance(alvo, ast.Name):
+                yield alvo
+            elif isinstance(alvo, (ast.Tuple, ast.List)):
+                for elemento in alvo.elts:
+                    yield from nomes(elemento)
+            elif isinstance(alvo, ast.Starred):
+                yield from nomes(alvo.value)
+
+        def visitar(corpo, nivel, atribuicoes):
+            for no in corpo:
+                if isinstance(no, ast.ClassDef):
+                    simbolos.append((no.lineno - 1, no.col_offset, "class", no.name, nivel))
+                    visitar(no.body, nivel + 1, True)
+                elif isinstance(no, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    simbolos.append((no.lineno - 1, no.col_offset, "def", no.name, nivel))
+                    visitar(no.body, nivel + 1, False)
+                elif isinstance(no, (ast.Assign, ast.AnnAssign)):
+                    if not atribuicoes:
+                        continue
+                    alvos = no.targets if isinstance(no, ast.Assign) else [no.target]
+                    for alvo in alvos:
+                        for nome in nomes(alvo):
+                            simbolos.append((nome.lineno - 1, nome.col_offset,
+                                             "var", nome.id, nivel))
+                else:
+                    # if/try/with... ao nível do módulo ou da classe
+                    for campo in ("body", "orelse", "finalbody", "handlers"):
+                        filhos = getattr(no, campo, None)
+                        if isinstance(filhos, list):
+                            visitar(filhos, nivel, atribuicoes)
+        visitar(arvore.body, 0, True)
+        return tuple(simbolos)
+
+    @classmethod
+    def _analisar_aproximado(cls, codigo):
+        simbolos = []
+        for correspondencia in cls.APROXIMADO.finditer(codigo):
+            linha = codigo.count('\n', 0, correspondencia.start())
+            if correspondencia.group(4):
+                indentacao = correspondencia.group(1).expandtabs(4)
+                tipo = "class" if correspondencia.group(2) else "def"
+                simbolos.append((linha, len(indentacao), tipo,
+                                 correspondencia.group(4), len(indentacao) // 4))
+            else:
+                simbolos.append((linha, 0, "var", correspondencia.group(5), 0))
+        return tuple(simbolos)
+
+    def simbolos(self):
+        """Todos os símbolos: [(linha, coluna, tipo, nome, nível), ...], linhas a contar de 1."""
+        return [(inicio + linha + 1, coluna, tipo, nome, nivel)
+                for inicio, _, simbolos in self.blocos
+                for linha, coluna, tipo, nome, nivel in simbolos]
+
+    def definicoes(self, nome):
+        """Posições ("linha.coluna") onde `nome` é definido; classes e funções primeiro."""
+        encontrados = [s for s in self.simbolos() if s[3] == nome]
+        encontrados.sort(key=lambda s: s[2] == "var")
+        return [f"{linha}.{coluna}" for linha, coluna, *_ in encontrados]
+
+
+class IndicePalavras:
+    """Identificadores do documento e do Python, para completar palavras.
+
+    Cada linha guarda a lista dos seus identificadores e `_contagens` soma-os
+    no documento todo. `_ordenadas` tem os identificadores distintos (mais as
+    palavras-chave e os builtins) por ordem: os que começam por um prefixo
+    são uma fatia encontrada com bisect. O índice só acompanha as edições
+    depois de ser usado; elas são anotadas e o atualizar() seguinte relê
+    apenas as linhas editadas. A primeira leitura de um documento grande
+    pode ser feita aos bocados (carregar_por_partes).
+    """
+
+    IDENTIFICADOR = re.compile(r"[^\W\d]\w*")
+    # Com mais edições do que isto por atualizar, o documento é relido todo
+    MAX_EDICOES = 200
+
+    def __init__(self, texto):
+        self.texto = texto
+        self._linhas = []
+        self._contagens = Counter()
+        self._ordenadas = []
+        # Palavras-chave e builtins (lidos na primeira atualização)
+        self._fixas = None
+        self._fixas_ordenadas = []
+        self._edicoes = []
+        self._tudo = True
+        # Leitura aos bocados em curso (número da leitura, ou None)
+        self._leitura = None
+        self._leituras = 0
+
+    @property
+    def pronto(self):
+        return not self._tudo
+
+    def invalidar_linhas(self, linha, removidas, inseridas):
+        """Ouvinte do ObservadorEdicoes."""
+        if self._tudo and self._leitura is None:
+            return
+        if len(self._edicoes) >= self.MAX_EDICOES:
+            self.limpar()
+        else:
+            self._edicoes.append((linha - 1, removidas, inseridas))
+
+    def limpar(self):
+        """O documento mudou todo (ex.: outro separador): é relido no próximo atualizar()."""
+        self._tudo = True
+        self._leitura = None
+        self._edicoes = []
+
+    def _carregar_fixas(self):
+        if self._fixas is None:
+            import builtins
+            import keyword
+            self._fixas = frozenset(keyword.kwlist).union(
+                nome for nome in dir(builtins) if not nome.startswith("_"))
+            self._fixas_ordenadas = sorted(self._fixas)
+
+    def carregar_por_partes(self, linhas_por_parte=5000):
+        """Gerador que lê o documento todo, um bocado em cada next().
+
+        As edições feitas entretanto ficam anotadas para o atualizar()
+        seguinte. Pára sem efeito se limpar() (ou outra leitura) o interromper.
+        """
+        self._carregar_fixas()
+        self._leituras += 1
+        self._leitura = leitura = self._leituras
+        self._edicoes = []
+        linhas = self.texto.get("1.0", "end-1c").split('\n')
+        encontrar = self.IDENTIFICADOR.findall
+        por_linha = []
+        contagens = Counter()
+        for inicio in range(0, len(linhas), linhas_por_parte):
+            parte = list(map(encontrar, linhas[inicio:inicio + linhas_por_parte]))
+            por_linha += parte
+            contagens.update(chain.from_iterable(parte))
+            yield
+            if self._leitura != leitura:
+                return
+        self._linhas = por_linha
+        self._contagens = contagens
+        self._ordenadas = sorted(self._fixas.union(contagens))
+        self._tudo = False
+        self._leitura = None
+
+    def atualizar(self):
+        if self._tudo:
+            for _ in self.carregar_por_partes(linhas_por_parte=1 << 30):
+                pass
+        if not self._edicoes:
+            return
+        # Intervalos [a, b) de linhas por ler, já nas posições finais
+        sujas = []
+        for i, removidas, inseridas in self._edicoes:
+            fim = i + removidas
+            for palavras in self._linhas[i:fim]:
+                if palavras is not None:
+                    self._descontar(palavras)
+            self._linhas[i:fim] = [None] * inseridas
+            sujas = self._deslocar(sujas, i, fim, inseridas)
+        self._edicoes = []
+        if len(self._linhas) != int(self.texto.index("end-1c").split('.')[0]):
+            # Dessincronizado (não devia acontecer): relê o documento todo
+            self.limpar()
+            self.atualizar()
+            return
+        for a, b in sujas:
+            linhas = self.texto.get(f"{a + 1}.0", f"{b}.end").split('\n')
+            for k, linha in zip(range(a, b), linhas):
+                if self._linhas[k] is None:
+                    self._linhas[k] = palavras = self.IDENTIFICADOR.findall(linha)
+                    self._contar(palavras)
+
+    @staticmethod
+    def _deslocar(sujas, i, fim, inseridas):
+        """Intervalos por ler depois de as linhas [i, fim) passarem a `inseridas` linhas novas."""
+        desvio = inseridas - (fim - i)
+        novo_a, novo_b = i, i + inseridas
+        resultado = []
+        for a, b in sujas:
+            if b < i:
+                resultado.append((a, b))
+            elif a > fim:
+                resultado.append((a + desvio, b + desvio))
+            else:
+                novo_a = min(novo_a, a)
+                novo_b = max(novo_b, b + desvio if b > fim else i + inseridas)
+        resultado.append((novo_a, novo_b))
+        resultado.sort()
+        return resultado
+
+    def _contar(self, palavras):
+        contagens = self._contagens
+        for palavra in palavras:
+            n = contagens.get(palavra, 0)
+            contagens[palavra] = n + 1
+            if not n and palavra not in self._fixas:
+                insort(self._ordenadas, palavra)
+
+    def _descontar(self, palavras):
+        contagens = self._contagens
+        for palavra in palavras:
+            n = contagens[palavra] - 1
+            if n:
+                contagens[palavra] = n
+                continue
+            del contagens[palavra]
+            if palavra not in self._fixas:
+                del self._ordenadas[bisect_left(self._ordenadas, palavra)]
+
+    @medidor.medir("completar (consulta)")
+    def completar(self, prefixo, limite=10, documento=True):
+        """Até `limite` palavras começadas por `prefixo` (sem ser ele próprio),
+        as mais usadas no documento primeiro e, entre iguais, por ordem.
+
+        Com documento=False só são dadas palavras-chave e builtins.
+        """
+        if documento:
+            self.atualizar()
+            ordenadas, contagens = self._ordenadas, self._contagens
+        else:
+            self._carregar_fixas()
+            ordenadas, contagens = self._fixas_ordenadas, Counter()
+        i = bisect_left(ordenadas, prefixo)
+        if i < len(ordenadas) and ordenadas[i] == prefixo:
+            i += 1
+        candidatas = ordenadas[i:bisect_left(ordenadas, prefixo + "\U0010ffff", i)]
+        # O Counter dá 0 às palavras que não estão no documento
+        return heapq.nlargest(limite, candidatas, key=contagens.__getitem__)
+
+
+@functools.lru_cache(maxsize=None)
+def classe_realce_sintaxe():
+    """Devolve a classe RealceSintaxe, criada na primeira chamada.
+
+    O idlelib.colorizer (que lê do disco a configuração do IDLE) é das
+    importações mais caras do arranque; só é feito quando o realce é
+    ligado, depois de a área de texto já estar desenhada.
+    """
+    from idlelib.colorizer import ColorDelegator
+
+    class RealceSintaxe(ColorDelegator):
+        """ColorDelegator que dá prioridade ao que está visível.
+
+        As zonas por colorir (tag TODO) dentro da área visível são tratadas
+        primeiro; o resto é colorido aos poucos, em fatias de tempo limitado
+        agendadas com after(), para nunca atrasar o que se escreve. Cada zona
+        termina assim que o resultado volta a coincidir com a passagem anterior
+        (tag SYNC no fim de um bloco), como no ColorDelegator do IDLE.
+        """
+
+        # Tempo máximo (s) de cada fatia de colorização
+        ORCAMENTO_FATIA = 0.01
+        # Espera (ms) entre fatias fora da área visível
+        ATRASO_FORA_DO_ECRA = 30
+        # Acima destas linhas só a área visível é colorida
+        LINHAS_SO_VISIVEL = 50000
+        # Acima destas linhas não há realce de sintaxe
+        LINHAS_SEM_REALCE = 500000
+        # Distância (linhas) máxima até à SYNC anterior para começar a partir dela
+        DISTANCIA_SYNC = 200
+
+        # Chamado quando o documento fica todo colorido (ver CacheRealce)
+        ao_terminar = None
+
+        def _agendar(self, atraso):
+            if self.after_id:
+                self.after_cancel(self.after_id)
+            self.after_id = self.after(atraso, self.recolorize)
+
+        def ao_deslocar(self):
+            """Chamado quando a área visível muda: colore logo o que ficou à vista."""
+            if not self.delegate or not self.allow_colorizing or self.colorizing:
+                return
+            if self._por_colorir_visivel(*self._area_visivel()):
+                self._agendar(1)
+
+        def _area_visivel(self):
+            inicio = self.index("@0,0 linestart")
+            fim = self.index(f"@0,{self.winfo_height()} lineend +1c")
+            return inicio, fim
+
+        def _por_colorir_visivel(self, inicio, fim):
+            """Se há zonas TODO em [inicio, fim).
+
+            O tag_nextrange só encontra zonas que começam dentro do intervalo.
+            Depois de abrir um ficheiro, o que falta colorir é uma só zona que
+            começa acima da área visível. Por isso, uma zona que cobre `inicio`
+            é partida aí: perde a TODO a quebra de linha anterior, que a
+            passagem vinda de cima colore na mesma, porque só pára numa SYNC.
+            """
+            if "TODO" not in self.tag_names(inicio):
+                return bool(self.tag_nextrange("TODO", inicio, fim))
+            if inicio != "1.0" and "TODO" in self.tag_names(f"{inicio}-1c"):
+                self.tag_remove("TODO", f"{inicio}-1c")
+            return True
+
+        def recolorize(self):
+            """Colore uma fatia e agenda a seguinte enquanto houver trabalho."""
+            self.after_id = None
+            if not self.delegate or not self.allow_colorizing or self.colorizing:
+                return
+            try:
+                self.stop_colorizing = False
+                self.colorizing = True
+                terminado = self.recolorize_main()
+            finally:
+                self.colorizing = False
+            if self.allow_colorizing and not terminado:
+                self._agendar(self.ATRASO_FORA_DO_ECRA)
+            elif terminado and self.ao_terminar is not None:
+                self.ao_terminar()
+
+        @medidor.medir("realce de sintaxe (passagem)")
+        def recolorize_main(self):
+            """Colore a área visível e depois uma fatia do resto.
+
+            Devolve True quando já não há mais nada (permitido) para colorir.
+            """
+            linhas = int(self.index("end-1c").split('.')[0])
+            if linhas > self.LINHAS_SEM_REALCE:
+                return True
+            limite = time.perf_counter() + self.ORCAMENTO_FATIA
+            inicio, fim = self._area_visivel()
+            if self._por_colorir_visivel(inicio, fim):
+                anterior = self.tag_prevrange("SYNC", inicio)
+                distancia = (int(inicio.split('.')[0]) - int(anterior[1].split('.')[0])
+                             if anterior else int(inicio.split('.')[0]))
+                if distancia > self.DISTANCIA_SYNC and inicio != "1.0":
+                    # Texto acima ainda por colorir: começa na primeira linha
+                    # visível. Se essa suposição estiver errada (ex.: dentro de
+                    # uma string com aspas triplas), a passagem que vier de cima
+                    # não encontra a SYNC esperada e volta a colorir esta zona.
+                    self.tag_add("SYNC", f"{inicio}-1c")
+                if not self._colorir(inicio, fim, limite):
+                    return False
+            if linhas > self.LINHAS_SO_VISIVEL:
+                return True
+            return self._colorir("1.0", "end", limite)
+
+        def _colorir(self, inicio, fim, limite):
+            """Colore as zonas TODO que começam em [inicio, fim).
+
+            Segue o algoritmo do ColorDelegator.recolorize_main, mas pára quando
+            se esgota o tempo em vez de chamar update_idletasks. Devolve False
+            se ficou trabalho por fazer.
+            """
+            next = inicio
+            while todo_tag_range := self.tag_nextrange("TODO", next, fim):
+                self.tag_remove("SYNC", todo_tag_range[0], todo_tag_range[1])
+                sync_tag_range = self.tag_prevrange("SYNC", todo_tag_range[0])
+                head = sync_tag_range[1] if sync_tag_range else "1.0"
+
+                chars = ""
+                next = head
+                lines_to_get = 1
+                ok = False
+                while not ok:
+                    mark = next
+                    next = self.index(mark + "+%d lines linestart" %
+                                      lines_to_get)
+                    lines_to_get = min(lines_to_get * 2, 100)
+                    ok = "SYNC" in self.tag_names(next + "-1c")
+                    line = self.get(mark, next)
+                    if not line:
+                        return True
+                    for tag in self.tagdefs:
+                        self.tag_remove(tag, mark, next)
+                    chars += line
+                    self._add_tags_in_section(chars, head)
+                    if "SYNC" in self.tag_names(next + "-1c"):
+                        head = next
+                        chars = ""
+                    else:
+                        ok = False
+                    if not ok:
+                        # Deixa a indicação de onde continuar na próxima fatia
+                        self.tag_add("TODO", next)
+                    if self.stop_colorizing or time.perf_counter() > limite:
+                        return False
+            return True
+
+    return RealceSintaxe
+
+
+class CacheRealce:
+    """Realce de sintaxe já calculado, guardado no disco pelo hash do conteúdo.
+
+    Cada entrada é um ficheiro <hash>.json.z com {tag: [inicio, fim, ...]}
+    em índices do Tk, incluindo as SYNC, para que as edições seguintes não
+    voltem a colorir o documento todo. Quando a pasta passa de LIMITE bytes,
+    são apagadas as entradas usadas há mais tempo (mtime).
+    """
+
+    PASTA = os.path.join(os.path.expanduser("~"), ".pycharmoso", "realce")
+    LIMITE = 64 * 1024 * 1024
+    # Muda quando o que é guardado deixa de ser compatível
+    VERSAO = 1
+    TAGS = ("COMMENT", "KEYWORD", "BUILTIN", "STRING", "DEFINITION", "SYNC")
+
+    @classmethod
+    def chave(cls, conteudo):
+        """Hash do conteúdo (e da versão do Python, de que dependem as palavras-chave)."""
+        import hashlib
+        resumo = hashlib.blake2b(
+            f"{cls.VERSAO} {sys.version_info[0]}.{sys.version_info[1]}\n".encode())
+        resumo.update(conteudo.encode("utf-8", "surrogatepass"))
+        return resumo.hexdigest()
+
+    @classmethod
+    def _caminho(cls, chave):
+        return os.path.join(cls.PASTA, chave + ".json.z")
+
+    @classmethod
+    def ler(cls, chave):
+        """{tag: [inicio, fim, ...]} guardado para a chave, ou None."""
+        caminho = cls._caminho(chave)
+        try:
+            with open(caminho, "rb") as fich:
+                tags = json.loads(zlib.decompress(fich.read()))
+            # Usada agora: fica entre as últimas a ser apagadas
+            os.utime(caminho)
+        except (OSError, ValueError, zlib.error):
+            return None
+        return tags if isinstance(tags, dict) else None
+
+    @classmethod
+    def guardar(cls, chave, tags):
+        """Escreve a entrada (e apaga as mais antigas) num thread à parte."""
+        def escrever():
+            temporario = f"{cls._caminho(chave)}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(cls.PASTA, exist_ok=True)
+                with open(temporario, "wb") as fich:
+                    fich.write(zlib.compress(
+                        json.dumps(tags, separators=(",", ":")).encode("utf-8"), 6))
+                os.replace(temporario, cls._caminho(chave))
+                cls._limitar()
+            except OSError:
+                try:
+                    os.unlink(temporario)
+                except OSError:
+                    pass
+        threading.Thread(target=escrever, daemon=True).start()
+
+    @classmethod
+    def _limitar(cls):
+        entradas = []
+        with os.scandir(cls.PASTA) as iterador:
+            for entrada in iterador:
+                if entrada.name.endswith(".json.z"):
+                    estado = entrada.stat()
+                    entradas.append((estado.st_mtime, estado.st_size, entrada.path))
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= cls.LIMITE:
+                break
+            try:
+                os.unlink(caminho)
+            except OSError:
+                continue
+            total -= tamanho
+
+
+class ModeloFormatacao:
+    """Cores do utilizador guardadas como intervalos, fora das tags do Tk.
+
+    Os intervalos estão ordenados e não se sobrepõem (cada caractere tem no
+    máximo uma cor); intervalos vizinhos com a mesma tag ficam num só. As
+    posições são inteiros linha * LINHA + coluna: acompanhar uma edição é
+    somar uma constante às posições que vêm depois dela. O Tk só recebe
+    chamadas agrupadas (uma por tag) e as edições seguem as regras das tags
+    do Tk: texto inserido numa ponta de um intervalo fica fora dele.
+    """
+
+    LINHA = 1 << 32
+
+    def __init__(self, texto):
+        self.texto = texto
+        self._inicios = []
+        self._fins = []
+        self._tags = []
+
+    def _posicao(self, indice):
+        try:
+            linha, coluna = map(int, str(indice).split('.'))
+        except ValueError:  # Índices como "end-1c"
+            linha, coluna = map(int, self.texto.index(indice).split('.'))
+        return linha * self.LINHA + coluna
+
+    def _indice(self, posicao):
+        linha, coluna = divmod(posicao, self.LINHA)
+        return f"{linha}.{coluna}"
+
+    def limpar(self):
+        self._inicios, self._fins, self._tags = [], [], []
+
+    def carregar(self, indices_por_tag):
+        """Substitui tudo por {tag: [inicio1, fim1, ...]} (índices do widget)."""
+        intervalos = []
+        for nome, indices in indices_por_tag.items():
+            posicoes = list(map(self._posicao, indices))
+            intervalos += zip(posicoes[::2], posicoes[1::2], repeat(nome))
+        intervalos.sort()
+        self.limpar()
+        if all(anterior[1] <= seguinte[0]
+               for anterior, seguinte in zip(intervalos, intervalos[1:])):
+            self._substituir(0, 0, intervalos)
+        else:
+            # Intervalos sobrepostos (ex.: ficheiros antigos): o último ganha
+            for inicio, fim, nome in intervalos:
+                self._aplicar(inicio, fim, nome)
+
+    def tag_em(self, indice):
+        """Tag de cor do caractere em `indice`, ou None."""
+        posicao = self._posicao(indice)
+        i = bisect_right(self._inicios, posicao) - 1
+        if i >= 0 and posicao < self._fins[i]:
+            return self._tags[i]
+        return None
+
+    def tags_em(self, inicio, fim):
+        """Tags de cor presentes em [inicio, fim)."""
+        i, j = self._abrangidos(self._posicao(inicio), self._posicao(fim))
+        return set(self._tags[i:j])
+
+    def _abrangidos(self, a, b):
+        # Intervalos [i, j) com algum caractere em [a, b)
+        return bisect_right(self._fins, a), bisect_left(self._inicios, b)
+
+    def aplicar(self, inicio, fim, tag):
+        """Dá a tag a [inicio, fim), tirando-lhe as outras; tag=None só as tira."""
+        self._aplicar(self._posicao(inicio), self._posicao(fim), tag)
+
+    def _aplicar(self, a, b, tag):
+        if a >= b:
+            return
+        self._repor(a, b, [(a, b, tag)] if tag is not None else [])
+
+    def intervalos_em(self, inicio, fim):
+        """Intervalos (inicio, fim, tag), em posições, cortados a [inicio, fim)."""
+        a, b = self._posicao(inicio), self._posicao(fim)
+        i, j = self._abrangidos(a, b)
+        return [(max(x, a), min(y, b), tag) for x, y, tag in
+                zip(self._inicios[i:j], self._fins[i:j], self._tags[i:j])]
+
+    def repor(self, inicio, fim, intervalos):
+        """Troca os intervalos de [inicio, fim) por `intervalos` (como os de
+        intervalos_em: ordenados, sem sobreposições e dentro de [inicio, fim))."""
+        self._repor(self._posicao(inicio), self._posicao(fim), list(intervalos))
+
+    def _repor(self, a, b, novos):
+        i, j = self._abrangidos(a, b)
+        if i < j and self._inicios[i] < a:
+            novos.insert(0, (self._inicios[i], a, self._tags[i]))
+        if i < j and self._fins[j - 1] > b:
+            novos.append((b, self._fins[j - 1], self._tags[j - 1]))
+        self._substituir(i, j, novos)
+
+    def _substituir(self, lo, hi, novos):
+        """Troca os intervalos [lo, hi) por `novos` (ordenados e sem
+        sobreposições), juntando os vizinhos com a mesma tag."""
+        if lo > 0:
+            lo -= 1
+            novos.insert(0, (self._inicios[lo], self._fins[lo], self._tags[lo]))
+        if hi < len(self._inicios):
+            novos.append((self._inicios[hi], self._fins[hi], self._tags[hi]))
+            hi += 1
+        resultado = []
+        for inicio, fim, tag in novos:
+            if inicio >= fim:
+                continue
+            if resultado and resultado[-1][2] == tag and resultado[-1][1] == inicio:
+                resultado[-1] = (resultado[-1][0], fim, tag)
+            else:
+                resultado.append((inicio, fim, tag))
+        self._inicios[lo:hi] = [intervalo[0] for intervalo in resultado]
+        self._fins[lo:hi] = [intervalo[1] for intervalo in resultado]
+        self._tags[lo:hi] = [intervalo[2] for intervalo in resultado]
+
+    def ao_editar(self, inicio, fim, texto):
+        """Ouvinte de texto do ObservadorEdicoes: desloca os intervalos."""
+        a = self._posicao(inicio)
+        linha_seguinte = (a // self.LINHA + 1) * self.LINHA
+        if texto:
+            quebras = texto.count('\n')
+            if quebras:
+                ultima = len(texto) - texto.rfind('\n') - 1
+                mesma_linha = quebras * self.LINHA + ultima - a % self.LINHA
+            else:
+                mesma_linha = len(texto)
+            outras = quebras * self.LINHA
+            # Um intervalo que começa em `a` passa para depois do texto; um que
+            # acaba em `a` não cresce
+            self._somar(self._inicios, bisect_left(self._inicios, a),
+                        linha_seguinte, mesma_linha, outras)
+            self._somar(self._fins, bisect_right(self._fins, a),
+                        linha_seguinte, mesma_linha, outras)
+            return
+        b = self._posicao(fim)
+        linha_seguinte = (b // self.LINHA + 1) * self.LINHA
+        outras = (a // self.LINHA - b // self.LINHA) * self.LINHA
+        for lista in (self._inicios, self._fins):
+            i = bisect_right(lista, a)
+            j = bisect_right(lista, b)
+            lista[i:j] = [a] * (j - i)
+            self._somar(lista, j, linha_seguinte, a - b, outras)
+        # Remove os intervalos que ficaram vazios e junta os que passaram a tocar-se
+        lo = bisect_left(self._fins, a)
+        hi = bisect_right(self._inicios, a)
+        self._substituir(lo, hi, list(zip(
+            self._inicios[lo:hi], self._fins[lo:hi], self._tags[lo:hi])))
+
+    @staticmethod
+    def _somar(lista, desde, linha_seguinte, mesma_linha, outras):
+        """Soma `mesma_linha` às posições de `desde` até ao fim da linha, e `outras` às seguintes."""
+        k = bisect_left(lista, linha_seguinte, desde)
+        if mesma_linha:
+            lista[desde:k] = [posicao + mesma_linha for posicao in lista[desde:k]]
+        if outras:
+            lista[k:] = [posicao + outras for posicao in lista[k:]]
+
+    def indices_por_tag(self, intervalos=None):
+        """{tag: [inicio1, fim1, ...]} em índices "linha.coluna" (de todo o
+        modelo, ou de uma lista de intervalos como a de intervalos_em)."""
+        if intervalos is None:
+            intervalos = zip(self._inicios, self._fins, self._tags)
+        indices = {}
+        for inicio, fim, tag in intervalos:
+            indices.setdefault(tag, []).extend(
+                (self._indice(inicio), self._indice(fim)))
+        return indices
+
+    def intervalos_por_tag(self):
+        """{tag: [(linha1, coluna1, linha2, coluna2), ...]}."""
+        intervalos = {}
+        for inicio, fim, tag in zip(self._inicios, self._fins, self._tags):
+            intervalos.setdefault(tag, []).append(
+                divmod(inicio, self.LINHA) + divmod(fim, self.LINHA))
+        return intervalos
+
+    def empurrar(self):
+        """Põe as tags do Tk iguais ao modelo, com uma chamada por tag."""
+        for nome in self.texto.tag_names():
+            if nome.startswith("color_"):
+                self.texto.tag_remove(nome, "1.0", tk.END)
+        for nome, indices in self.indices_por_tag().items():
+            self.texto.tag_add(nome, *indices)
+
+
+class DocumentoLinhas:
+    """Texto de um documento guardado fora do widget, em blocos de linhas.
+
+    Usado no modo de ficheiro grande. Os blocos não são alterados depois de
+    o carregamento acabar (uma edição troca-os por blocos novos), por isso
+    uma cópia da lista de blocos (fotografia()) é uma imagem consistente do
+    documento, que pode ser gravada noutro thread. As cores do utilizador
+    ficam em `spans`: {tag: [(linha1, coluna1, linha2, coluna2), ...]}, com
+    as linhas a contar de 1, como no Tk.
+    """
+
+    LINHAS_POR_BLOCO = 2048
+    # Custo estimado (bytes) de cada linha além dos seus caracteres:
+    # o objeto str e o apontador na lista do bloco
+    CUSTO_LINHA = 57
+
+    def __init__(self):
+        self._abertos = [[""]]
+        # Os blocos, comprimidos, enquanto o documento está num separador inativo
+        self._comprimidos = None
+        # Primeira linha (a contar de 0) de cada bloco e, no fim, o total
+        self._inicios = None
+        self.spans = {}
+
+    @property
+    def _blocos(self):
+        """Listas de linhas; descomprimidas na primeira vez que são precisas."""
+        if self._comprimidos is not None:
+            self._abertos = [bloco.texto().split('\n') for bloco in self._comprimidos]
+            self._comprimidos = None
+        return self._abertos
+
+    def memoria(self):
+        """Memória (bytes, estimada) ocupada pelas linhas."""
+        if self._comprimidos is not None:
+            return sum(len(bloco.dados) for bloco in self._comprimidos)
+        return sum(sum(map(len, bloco)) + self.CUSTO_LINHA * len(bloco)
+                   for bloco in self._abertos)
+
+    def comprimir(self):
+        """Comprime cada bloco (zlib) até o documento voltar a ser usado."""
+        if self._comprimidos is None:
+            # Os inícios dos blocos continuam a valer sem os descomprimir
+            self._calcular_inicios()
+            self._comprimidos = [TextoComprimido('\n'.join(bloco))
+                                 for bloco in self._abertos]
+            self._abertos = None
+
+    def _calcular_inicios(self):
+        if self._inicios is None:
+            self._inicios = [0]
+            self._inicios += accumulate(map(len, self._blocos))
+        return self._inicios
+
+    @property
+    def total_linhas(self):
+        return self._calcular_inicios()[-1]
+
+    def _localizar(self, linha):
+        """(bloco, posição dentro do bloco) da linha indicada (a contar de 0)."""
+        inicios = self._calcular_inicios()
+        bloco = min(bisect_right(inicios, linha) - 1, len(self._blocos) - 1)
+        return bloco, linha - inicios[bloco]
+
+    def linha(self, linha):
+        bloco, posicao = self._localizar(linha)
+        return self._blocos[bloco][posicao]
+
+    def linhas(self, inicio, fim):
+        """Lista das linhas [inicio, fim)."""
+        resultado = []
+        bloco, posicao = self._localizar(inicio)
+        while len(resultado) < fim - inicio and bloco < len(self._blocos):
+            resultado += self._blocos[bloco][
+                posicao:posicao + fim - inicio - len(resultado)]
+            bloco += 1
+            posicao = 0
+        return resultado
+
+    def todas_linhas(self):
+        resultado = []
+        for bloco in self._blocos:
+            resultado += bloco
+        return resultado
+
+    def acrescentar(self, texto):
+        """Junta texto ao fim do documento (só durante o carregamento)."""
+        partes = texto.split('\n')
+        ultimo = self._blocos[-1]
+        ultimo[-1] += partes[0]
+        espaco = self.LINHAS_POR_BLOCO - len(ultimo)
+        ultimo += partes[1:espaco + 1]
+        for inicio in range(espaco + 1, len(partes), self.LINHAS_POR_BLOCO):
+            self._blocos.append(partes[inicio:inicio + self.LINHAS_POR_BLOCO])
+        self._inicios = None
+
+    def substituir(self, inicio, fim, novas):
+        """Troca as linhas [inicio, fim) pela lista `novas`."""
+        bloco_inicio, posicao_inicio = self._localizar(inicio)
+        bloco_fim, posicao_fim = self._localizar(fim)
+        linhas = (self._blocos[bloco_inicio][:posicao_inicio] + novas
+                  + self._blocos[bloco_fim][posicao_fim:])
+        if not linhas and len(self._blocos) == bloco_fim - bloco_inicio + 1:
+            linhas = [""]  # Um documento tem sempre pelo menos uma linha
+        n = self.LINHAS_POR_BLOCO
+        self._blocos[bloco_inicio:bloco_fim + 1] = [
+            linhas[i:i + n] for i in range(0, len(linhas), n)]
+        self._inicios = None
+
+    def fotografia(self):
+        """Cópia do estado atual: (blocos, spans), para gravar noutro thread."""
+        return list(self._blocos), dict(self.spans)
+
+    @staticmethod
+    def pedacos_texto(blocos):
+        """Texto de uma fotografia, um pedaço por bloco."""
+        ultimo = len(blocos) - 1
+        for i, bloco in enumerate(blocos):
+            yield '\n'.join(bloco) + ('\n' if i < ultimo else '')
+
+    @staticmethod
+    def spans_em_offsets(blocos, spans):
+        """{tag: [(l1, c1, l2, c2)]} -> {tag: [(inicio, fim)]} em caracteres."""
+        posicoes = sorted({posicao for intervalos in spans.values()
+                           for l1, c1, l2, c2 in intervalos
+                           for posicao in ((l1, c1), (l2, c2))})
+        offsets = {}
+        k = 0
+        primeira = 1
+        offset_bloco = 0
+        for bloco in blocos:
+            seguinte = primeira + len(bloco)
+            if k < len(posicoes) and posicoes[k][0] < seguinte:
+                # Início de cada linha do bloco, calculado em C
+                acumulado = [0]
+                acumulado += accumulate(map(len, bloco))
+                while k < len(posicoes) and posicoes[k][0] < seguinte:
+                    linha, coluna = posicoes[k]
+                    i = linha - primeira
+                    offsets[posicoes[k]] = offset_bloco + acumulado[i] + i + coluna
+                    k += 1
+            offset_bloco += sum(map(len, bloco)) + len(bloco)
+            primeira = seguinte
+        # Posições para lá do fim ficam no fim do texto
+        for posicao in posicoes[k:]:
+            offsets[posicao] = offset_bloco - 1
+        return {nome: [(offsets[(l1, c1)], offsets[(l2, c2)])
+                       for l1, c1, l2, c2 in intervalos]
+                for nome, intervalos in spans.items()}
+
+    def definir_spans(self, indices_por_tag):
+        """Recebe {tag: [inicio1, fim1, ...]} em índices "linha.coluna" do documento."""
+        self.spans = {}
+        for nome, indices in indices_por_tag.items():
+            posicoes = [tuple(map(int, str(indice).split('.'))) for indice in indices]
+            if posicoes:
+                self.spans[nome] = [inicio + fim for inicio, fim
+                                    in zip(posicoes[::2], posicoes[1::2])]
+
+
+class JanelaFicheiroGrande:
+    """Modo de ficheiro grande: o widget só mostra uma janela do documento.
+
+    O texto completo fica num DocumentoLinhas e a área de texto recebe apenas
+    LINHAS_JANELA linhas à volta da zona visível. Quando a vista se aproxima
+    de uma das pontas, as edições feitas na janela passam para o documento e
+    é carregada uma janela nova centrada na linha visível. A scrollbar e os
+    números de linha representam o documento inteiro.
+
+    Trocar de janela limpa o histórico de undo, cujos índices são do widget.
+    """
+
+    LINHAS_JANELA = 4000
+    # Distância (linhas) a uma ponta da janela a partir da qual esta é trocada
+    MARGEM = 600
+
+    def __init__(self, area_texto):
+        self.area_texto = area_texto
+        self.documento = DocumentoLinhas()
+        # Linha do documento (a contar de 0) que está na linha 1 do widget
+        self.inicio = 0
+        # Número de linhas do documento que foram postas no widget
+        self.linhas = 0
+        # A janela tem edições que ainda não passaram para o documento
+        self.modificada = False
+        # Enquanto o ficheiro é lido, a última linha ainda pode estar incompleta
+        self.a_carregar = True
+        self._id_verificacao = None
+
+    def total_linhas(self):
+        """Linhas do documento, contando com as edições ainda só no widget."""
+        total = self.documento.total_linhas
+        if self.linhas:
+            total += self._linhas_widget() - self.linhas
+        return total
+
+    def _linhas_widget(self):
+        return int(self.area_texto.texto.index("end-1c").split('.')[0])
+
+    def acrescentar(self, pedaco):
+        """Destino dos pedaços lidos pelo CarregadorFicheiro."""
+        self.documento.acrescentar(pedaco)
+        # Mostra logo a primeira janela, assim que as suas linhas estão completas
+        if not self.linhas and self.documento.total_linhas > self.LINHAS_JANELA:
+            self._carregar(0, 0)
+        self.area_texto.atualizar_scrollbar()
+
+    def terminar_carregamento(self, indices_spans):
+        """O documento está todo lido; indices_spans como em rtxt.LeitorRtxt."""
+        self.a_carregar = False
+        self.documento.definir_spans(indices_spans)
+        self._carregar(self.inicio, self.inicio + self._primeira_visivel() - 1)
+
+    def _primeira_visivel(self):
+        return int(self.area_texto.texto.index("@0,0").split('.')[0])
+
+    def sincronizar(self):
+        """Passa para o documento as edições e as cores feitas na janela."""
+        if not self.linhas:
+            # Janela ainda por mostrar: o que sai do widget é o documento anterior
+            self.modificada = False
+        if not self.modificada:
+            return
+        texto = self.area_texto.texto
+        novas = texto.get("1.0", "end-1c").split('\n')
+        primeira = self.inicio + 1
+        ultima = self.inicio + self.linhas
+        diferenca = len(novas) - self.linhas
+        # Fim da janela depois das edições, onde começam as partes de fora
+        fim_janela = (self.inicio + len(novas), len(novas[-1]))
+
+        spans = {}
+        for nome, intervalos in self.documento.spans.items():
+            fora = []
+            for l1, c1, l2, c2 in intervalos:
+                if l2 < primeira or (l2, c2) == (primeira, 0):
+                    fora.append((l1, c1, l2, c2))
+                elif l1 > ultima:
+                    fora.append((l1 + diferenca, c1, l2 + diferenca, c2))
+                else:
+                    # A parte dentro da janela vem do widget
+                    if l1 < primeira:
+                        fora.append((l1, c1, primeira, 0))
+                    if l2 > ultima:
+                        fora.append(fim_janela + (l2 + diferenca, c2))
+            spans[nome] = fora
+        for nome, intervalos in self.area_texto.formatacao.intervalos_por_tag().items():
+            spans.setdefault(nome, []).extend(
+                (l1 + self.inicio, c1, l2 + self.inicio, c2)
+                for l1, c1, l2, c2 in intervalos)
+
+        self.documento.substituir(self.inicio, self.inicio + self.linhas, novas)
+        self.documento.spans = {nome: intervalos
+                                for nome, intervalos in spans.items() if intervalos}
+        self.linhas = len(novas)
+        self.modificada = False
+
+    def _carregar(self, inicio, linha_vista):
+        """Põe no widget a janela que começa na linha `inicio` do documento.
+
+        `linha_vista` (do documento, a contar de 0) fica no topo da área visível.
+        """
+        area = self.area_texto
+        texto = area.texto
+        self.sincronizar()
+        cursor = self.para_documento(texto.index(tk.INSERT)) if self.linhas else None
+        total = self.documento.total_linhas
+        limite = total - 1 if self.a_carregar else total
+        inicio = max(0, min(inicio, limite - self.LINHAS_JANELA))
+        fim = min(inicio + self.LINHAS_JANELA, limite)
+        linhas = self.documento.linhas(inicio, fim)
+
+        estado = texto.cget("state")
+        area.observador.suspenso = area.undo.suspenso = True
+        try:
+            texto.config(state="normal")
+            texto.delete("1.0", tk.END)
+            texto.insert("1.0", '\n'.join(linhas))
+            area.formatacao.carregar(self._indices_spans(inicio, len(linhas)))
+            area.formatacao.empurrar()
+        finally:
+            texto.config(state=estado)
+            area.observador.suspenso = area.undo.suspenso = False
+        self.inicio = inicio
+        self.linhas = len(linhas)
+        area.observador.deslocamento = inicio
+        # O undo guarda índices do widget, que deixaram de corresponder
+        area.undo.reset_undo()
+        # Trocar de janela não é uma modificação do documento
+        texto.edit_modified(False)
+
+        local = self.para_local(cursor) if cursor else None
+        texto.mark_set(tk.INSERT, local or f"{max(linha_vista - inicio, 0) + 1}.0")
+        texto.yview(f"{max(linha_vista - inicio, 0) + 1}.0")
+        area.ao_mudar_janela()
+
+    def _indices_spans(self, inicio, n_linhas):
+        """Índices do widget das partes dos spans que caem na janela."""
+        primeira = inicio + 1
+        ultima = inicio + n_linhas
+        indices_por_tag = {}
+        for nome, intervalos in self.documento.spans.items():
+            indices = []
+            for l1, c1, l2, c2 in intervalos:
+                if l2 < primeira or l1 > ultima:
+                    continue
+                indices.append("1.0" if l1 < primeira else f"{l1 - inicio}.{c1}")
+                indices.append("end-1c" if l2 > ultima else f"{l2 - inicio}.{c2}")
+            if indices:
+                indices_por_tag[nome] = indices
+        return indices_por_tag
+
+    def para_documento(self, indice):
+        """Índice do widget -> índice "linha.coluna" do documento."""
+        linha, coluna = self.area_texto.texto.index(indice).split('.')
+        return f"{int(linha) + self.inicio}.{coluna}"
+
+    def para_local(self, indice):
+        """Índice do documento -> índice do widget, ou None se estiver fora da janela."""
+        linha, coluna = str(indice).split('.')
+        local = int(linha) - self.inicio
+        if 1 <= local <= self._linhas_widget():
+            return f"{local}.{coluna}"
+        return None
+
+    def mostrar(self, indice):
+        """Garante que o índice do documento está na janela; devolve o índice local."""
+        linha = int(str(indice).split('.')[0]) - 1
+        local = self.para_local(indice)
+        if local is None:
+            # Se ficar perto de uma ponta, a janela é recentrada ao deslocar
+            self._carregar(linha - self.LINHAS_JANELA // 2, linha)
+            local = self.para_local(indice)
+        if local is not None:
+            self.area_texto.texto.see(local)
+        return local
+
+    def fracoes(self):
+        """Parte visível do documento inteiro, como a scrollbar a espera."""
+        texto = self.area_texto.texto
+        total = max(self.total_linhas(), 1)
+        primeira = self._primeira_visivel()
+        ultima = int(texto.index(f"@0,{texto.winfo_height()}").split('.')[0])
+        return ((self.inicio + primeira - 1) / total,
+                min((self.inicio + ultima) / total, 1.0))
+
+    def rolar(self, *args):
+        """Comando da scrollbar, em frações do documento inteiro."""
+        if args[0] != "moveto":
+            # Linhas e páginas: a janela é trocada ao chegar perto das pontas
+            self.area_texto.texto.yview(*args)
+            return
+        linha = int(float(args[1]) * self.total_linhas())
+        linha = max(0, min(linha, self.total_linhas() - 1))
+        local = linha - self.inicio + 1
+        if self.MARGEM <= local <= self._linhas_widget() - self.MARGEM:
+            self.area_texto.texto.yview(f"{local}.0")
+        else:
+            self._carregar(linha - self.LINHAS_JANELA // 2, linha)
+
+    def ao_deslocar(self):
+        """Chamado a cada deslocamento da vista: verifica as pontas da janela."""
+        if self._id_verificacao is None:
+            self._id_verificacao = self.area_texto.texto.after_idle(
+                self._verificar_pontas)
+
+    def _verificar_pontas(self):
+        self._id_verificacao = None
+        if not self.linhas:
+            return
+        texto = self.area_texto.texto
+        primeira = self._primeira_visivel()
+        ultima = int(texto.index(f"@0,{texto.winfo_height()}").split('.')[0])
+        limite = self.documento.total_linhas - (1 if self.a_carregar else 0)
+        perto_do_topo = primeira <= self.MARGEM and self.inicio > 0
+        perto_do_fim = (ultima > self._linhas_widget() - self.MARGEM
+                        and self.inicio + self.linhas < limite)
+        if perto_do_topo or perto_do_fim:
+            linha = self.inicio + primeira - 1
+            self._carregar(linha - self.LINHAS_JANELA // 2, linha)
+
+    def cancelar(self):
+        if self._id_verificacao is not None:
+            self.area_texto.texto.after_cancel(self._id_verificacao)
+            self._id_verificacao = None
+
+    def retomar(self, linha_vista):
+        """Volta a pôr a janela no widget (ex.: ao regressar ao seu separador)."""
+        # O widget tem outro documento: não há nada a sincronizar
+        self.linhas = 0
+        self.modificada = False
+        self._carregar(self.inicio, linha_vista)
+
+
+class AgendadorAtualizacoes:
+    """Junta o trabalho provocado pelas edições e fá-lo quando o Tk está livre.
+
+    Cada componente regista uma tarefa com um nome, uma prioridade (menor
+    corre primeiro) e, opcionalmente, um atraso. pedir(nome) só marca a
+    tarefa como pendente: as tarefas sem atraso correm todas juntas num
+    after_idle, e as com atraso só depois de os pedidos pararem durante
+    `atraso_ms` (debounce). Uma rajada de teclas ou um paste grande dão
+    assim uma só atualização. As tarefas registadas com apos_edicao=True
+    são pedidas por ao_editar(). O tempo gasto em cada uma fica em
+    `estatisticas`.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        # nome -> (funcao, prioridade, atraso_ms)
+        self._tarefas = {}
+        self._apos_edicao = []
+        self._prontas = set()
+        self._id_idle = None
+        # nome -> id do after() de uma tarefa com atraso
+        self._ids_atraso = {}
+        # nome -> {"pedidos", "execucoes", "tempo_total", "tempo_maximo"} (s)
+        self.estatisticas = {}
+
+    def registar(self, nome, funcao, prioridade=0, atraso_ms=0, apos_edicao=False):
+        self._tarefas[nome] = (funcao, prioridade, atraso_ms)
+        if apos_edicao:
+            self._apos_edicao.append(nome)
+        self.estatisticas[nome] = {"pedidos": 0, "execucoes": 0,
+                                   "tempo_total": 0.0, "tempo_maximo": 0.0}
+
+    def pedir(self, nome):
+        """Marca a tarefa como pendente."""
+        atraso = self._tarefas[nome][2]
+        self.estatisticas[nome]["pedidos"] += 1
+        if atraso:
+            # Cada pedido adia a execução (debounce)
+            id_after = self._ids_atraso.pop(nome, None)
+            if id_after is not None:
+                self.widget.after_cancel(id_after)
+            self._ids_atraso[nome] = self.widget.after(
+                atraso, self._atraso_terminado, nome)
+        else:
+            self._prontas.add(nome)
+            self._agendar()
+
+    def ao_editar(self):
+        """Pede todas as tarefas que dependem do conteúdo do texto."""
+        for nome in self._apos_edicao:
+            self.pedir(nome)
+
+    def cancelar(self, nome):
+        """Esquece um pedido pendente da tarefa."""
+        self._prontas.discard(nome)
+        id_after = self._ids_atraso.pop(nome, None)
+        if id_after is not None:
+            self.widget.after_cancel(id_after)
+
+    def parar(self):
+        """Cancela tudo o que está pendente (ex.: ao fechar a janela)."""
+        for nome in list(self._ids_atraso):
+            self.cancelar(nome)
+        self._prontas.clear()
+        if self._id_idle is not None:
+            self.widget.after_cancel(self._id_idle)
+            self._id_idle = None
+
+    def _atraso_terminado(self, nome):
+        del self._ids_atraso[nome]
+        self._prontas.add(nome)
+        self._agendar()
+
+    def _agendar(self):
+        if self._id_idle is None:
+            self._id_idle = self.widget.after_idle(self._executar)
+
+    def _executar(self):
+        self._id_idle = None
+        prontas = sorted(self._prontas, key=lambda nome: self._tarefas[nome][1])
+        self._prontas.clear()
+        for i, nome in enumerate(prontas):
+            try:
+                self._correr(nome)
+            except Exception:
+                # As restantes ficam para a próxima vez; o erro segue para o Tk
+                self._prontas.update(prontas[i + 1:])
+                self._agendar()
+                raise
+
+    def _correr(self, nome):
+        inicio = time.perf_counter()
+        try:
+            self._tarefas[nome][0]()
+        finally:
+            duracao = time.perf_counter() - inicio
+            estatistica = self.estatisticas[nome]
+            estatistica["execucoes"] += 1
+            estatistica["tempo_total"] += duracao
+            estatistica["tempo_maximo"] = max(estatistica["tempo_maximo"], duracao)
+            medidor.registar(f"agendador: {nome}", duracao)
+
+    @property
+    def pendente(self):
+        """Se há tarefas à espera do próximo idle."""
+        return self._id_idle is not None
+
+    def relatorio(self):
+        """Texto com o tempo gasto por tarefa, da mais cara para a mais barata."""
+        linhas = []
+        for nome, e in sorted(self.estatisticas.items(),
+                              key=lambda item: -item[1]["tempo_total"]):
+            media = e["tempo_total"] / e["execucoes"] if e["execucoes"] else 0.0
+            linhas.append(
+                f"{nome}: {e['execucoes']} execuções / {e['pedidos']} pedidos, "
+                f"total {e['tempo_total'] * 1000:.1f} ms, "
+                f"média {media * 1000:.2f} ms, máximo {e['tempo_maximo'] * 1000:.2f} ms")
+        return "\n".join(linhas)
+
+
+class AreaTexto:
+    """Gerencia a área de texto principal e números de linha."""
+
+    # Ficheiros maiores do que isto (bytes) abrem no modo de ficheiro grande
+    LIMITE_MODO_GRANDE = 32 * 1024 * 1024
+
+    def __init__(self, parent, familia_fonte="Arial", tamanho_fonte=12):
+        self.parent = parent
+        self.familia_fonte = familia_fonte
+        self.tamanho_fonte = tamanho_fonte
+        # Objeto de fonte partilhado pelo texto e pelos números de linha:
+        # alterá-lo atualiza os dois widgets de uma só vez
+        self.fonte = tkfont.Font(
+            family=familia_fonte, size=tamanho_fonte, weight="bold")
+        # variável para controlar se os números de linha estão visíveis
+        self.mostrar_numeros_linha = tk.BooleanVar()
+        # Definir o número de espaços para a tecla TAB
+        self.tab_width = 4
+        # Margem horizontal (px) dos números de linha
+        self.margem_numeros = 5
+        # Itens de texto do Canvas reutilizados entre redesenhos,
+        # cada um guardado como [id_item, numero_linha, (x, y), cor]
+        self._itens_numeros = []
+        # Modo de ficheiro grande (JanelaFicheiroGrande), se estiver ativo
+        self.janela = None
+        self._ouvintes_janela = []
+        # Avisados de cada mudança das cores do utilizador (ex.: o diário),
+        # que não passam pelo Percolator
+        self._ouvintes_cor = []
+        # Trabalho adiado (números de linha, título, pesquisa...), feito
+        # uma só vez por cada rajada de edições
+        self.agendador = AgendadorAtualizacoes(self.parent)
+        self.agendador.registar(
+            "numeros_linha", self.atualizar_numeros_linha, prioridade=0,
+            apos_edicao=True)
+        # Realce de sintaxe (RealceSintaxe), ligado só depois do primeiro
+        # desenho por ativar_realce_sintaxe()
+        self.color = None
+        # CacheRealce: chave do documento, enquanto não for editado (para
+        # guardar o realce quando acabar de ser colorido), e realce lido da
+        # cache antes de o realce de sintaxe estar ligado
+        self._chave_realce = None
+        self._realce_guardado = None
+        self._configurar_area_texto()
+        self._configurar_filtros()
+        # Índice com as linhas do documento, mantido pelas edições
+        self.indice_pesquisa = IndicePesquisa(self.texto)
+        self.observador.adicionar_ouvinte(self.indice_pesquisa.invalidar_linhas)
+        # Símbolos Python do documento (ver PainelEstrutura)
+        self.indice_simbolos = IndiceSimbolos(self.texto)
+        self.observador.adicionar_ouvinte(self.indice_simbolos.invalidar_linhas)
+        # Identificadores do documento, para completar palavras
+        self.indice_palavras = IndicePalavras(self.texto)
+        self.observador.adicionar_ouvinte(self.indice_palavras.invalidar_linhas)
+        self.observador.adicionar_ouvinte(self._ao_editar)
+        # Intervalos das cores do utilizador, deslocados a cada edição
+        self.formatacao = ModeloFormatacao(self.texto)
+        self.observador.adicionar_ouvinte_texto(self.formatacao.ao_editar)
+
+    def _configurar_area_texto(self):
+        # Frame para conter o widget de números de linha e o texto
+        self.frame = tk.Frame(self.parent)
+        self.frame.rowconfigure(0, weight=1)
+        # Coluna do texto principal é expansível
+        self.frame.columnconfigure(1, weight=1)
+
+        # Frame para conter os números de linha; a largura é ajustada
+        # ao número de dígitos da última linha
+        self.frame_numeros_wrapper = tk.Frame(self.frame, width=50)
+        self.frame_numeros_wrapper.grid(row=0, column=0, sticky="ns")
+        # Impede que o widget interno redimensione este frame
+        self.frame_numeros_wrapper.grid_propagate(False)
+        self.frame_numeros_wrapper.pack_propagate(False)
+
+        # Canvas para números de linha: só são desenhadas as linhas visíveis
+        self.numeros_linha = tk.Canvas(
+            self.frame_numeros_wrapper,
+            takefocus=0, bd=0, highlightthickness=0, bg='lightgray'
+        )
+        self.numeros_linha.pack(fill="both", expand=True)
+
+        # Widget principal de texto
+        self.texto = tk.Text(
+            self.frame,
+            font=self.fonte,
+            # O undo do próprio Tk fica desligado: guardaria uma segunda
+            # cópia de tudo, sem limite; o histórico é o HistoricoUndo
+            wrap=tk.WORD, fg="black", undo=False
+        )
+        self.texto.grid(row=0, column=1, sticky="nsew")
+
+        # Adicionar Scrollbar vertical
+        self.scrollbar_texto = tk.Scrollbar(
+            self.frame, orient=tk.VERTICAL, command=self.texto.yview)
+        self.scrollbar_texto.grid(row=0, column=2, sticky="ns")
+
+        # Barra de progresso dos carregamentos (escondida por omissão)
+        self.frame_progresso = tk.Frame(self.frame)
+        self.frame_progresso.grid(row=1, column=0, columnspan=3, sticky="ew")
+        self.label_progresso = tk.Label(self.frame_progresso, anchor="w")
+        self.label_progresso.pack(side=tk.LEFT, padx=5)
+        self.botao_cancelar_progresso = tk.Button(
+            self.frame_progresso, text="Cancelar")
+        self.botao_cancelar_progresso.pack(side=tk.RIGHT, padx=5, pady=2)
+        self.barra_progresso = ttk.Progressbar(
+            self.frame_progresso, maximum=1.0, length=200)
+        self.barra_progresso.pack(side=tk.RIGHT, padx=5)
+        self.frame_progresso.grid_remove()
+
+        self._configurar_scroll_sincronizado()
+        # O número de linhas visíveis (e a quebra de linha) muda com o tamanho
+        self.texto.bind("<Configure>", lambda e: self._pedir_numeros_linha(), add="+")
+        # Começa escondido, tal como o checkbox
+        self.alternar_numeros_linha()
+
+    def _configurar_filtros(self):
+        ########## OBSERVADOR DE EDIÇÕES E GESTOR DE UNDO/REDO ##########
+        # Configurar o Percolator para interceptar modificações de texto
+        self.percolator = Percolator(self.texto)
+
+        # Observador de edições: fica no fundo da cadeia para ver também
+        # as alterações feitas pelo undo/redo
+        self.observador = ObservadorEdicoes()
+        self.percolator.insertfilter(self.observador)
+
+        # Adicionar o gestor de Undo/Redo (com limite de memória)
+        self.undo = HistoricoUndo()
+        self.percolator.insertfilter(self.undo)
+
+    def ativar_realce_sintaxe(self):
+        """Liga o realce de sintaxe (área visível primeiro), se ainda não estiver."""
+        if self.color is not None:
+            return
+        from idlelib.colorizer import color_config
+        # Fica no topo da cadeia, acima do undo; colore o texto que já existe
+        self.color = classe_realce_sintaxe()()
+        self.percolator.insertfilter(self.color)
+
+        self.color.ao_terminar = self._realce_terminado
+        if self._realce_guardado is not None:
+            self._aplicar_realce(self._realce_guardado)
+
+        # Aplicar as cores do tema padrão ao widget de texto
+        color_config(self.texto)
+
+        # Substituir algumas cores
+        self.texto.tag_configure("COMMENT", foreground="grey")
+        self.texto.tag_configure("STRING", foreground="orange")
+        self.texto.tag_configure("DEFINITION", foreground="green")
+        self.texto.tag_configure("BUILTIN", foreground="green")
+        # As tags de sintaxe são criadas agora, depois das cores do
+        # utilizador, da pesquisa, etc.; ficam por baixo de todas
+        for tag in self.color.tagdefs:
+            self.texto.tag_lower(tag)
+
+    def _configurar_scroll_sincronizado(self):
+        """Configura a sincronização de scroll entre o texto principal e os números de linha"""
+        def _sincronizar(*args):
+            # Atualiza a scrollbar (no modo de ficheiro grande, em relação
+            # ao documento inteiro e não só à janela)
+            if self.janela is not None:
+                self.scrollbar_texto.set(*self.janela.fracoes())
+                self.janela.ao_deslocar()
+            else:
+                self.scrollbar_texto.set(*args)
+            # Redesenha os números das linhas que passaram a estar visíveis
+            self._pedir_numeros_linha()
+            # e colore o que passou a estar à vista
+            if self.color is not None:
+                self.color.ao_deslocar()
+
+        self.texto.config(yscrollcommand=_sincronizar)
+
+    def _pedir_numeros_linha(self):
+        self.agendador.pedir("numeros_linha")
+
+    def obter_texto(self):
+        """Texto completo do documento (no modo de ficheiro grande, do DocumentoLinhas)."""
+        if self.janela is not None:
+            self.janela.sincronizar()
+            return '\n'.join(self.janela.documento.todas_linhas())
+        return self.texto.get("1.0", "end-1c")
+
+    def atualizar_scrollbar(self):
+        if self.janela is not None:
+            self.scrollbar_texto.set(*self.janela.fracoes())
+
+    def _ao_editar(self, linha, removidas, inseridas):
+        if self.janela is not None:
+            self.janela.modificada = True
+        # O realce em cache deixa de corresponder ao texto
+        self._chave_realce = self._realce_guardado = None
+
+    def usar_realce_em_cache(self):
+        """O documento acabou de ser posto no widget (ex.: um ficheiro aberto):
+        usa o realce de sintaxe guardado para este conteúdo, se existir.
+
+        Se não existir, o documento é colorido como sempre e o resultado
+        é guardado quando a colorização terminar sem edições pelo meio.
+        """
+        self._chave_realce = self._realce_guardado = None
+        if self.janela is not None:
+            return
+        conteudo = self.texto.get("1.0", "end-1c")
+        # Acima deste tamanho só a área visível é colorida: não há um realce
+        # completo para guardar (o realce já foi ativado no arranque)
+        if conteudo.count('\n') >= classe_realce_sintaxe().LINHAS_SO_VISIVEL:
+            return
+        chave = CacheRealce.chave(conteudo)
+        tags = CacheRealce.ler(chave)
+        if tags is None:
+            self._chave_realce = chave
+        elif self.color is None:
+            self._realce_guardado = tags
+        else:
+            self._aplicar_realce(tags)
+
+    def _aplicar_realce(self, tags):
+        """Substitui o realce de sintaxe pelo guardado, numa só passagem."""
+        self._realce_guardado = None
+        color = self.color
+        if color.after_id:
+            color.after_cancel(color.after_id)
+            color.after_id = None
+        # Também as TODO: não fica nada por colorir
+        for tag in color.tagdefs:
+            self.texto.tag_remove(tag, "1.0", tk.END)
+        for tag in CacheRealce.TAGS:
+            if tags.get(tag):
+                self.texto.tag_add(tag, *tags[tag])
+
+    def _realce_terminado(self):
+        """O realce de sintaxe terminou: guarda-o se o texto é o de usar_realce_em_cache()."""
+        if self._chave_realce is None or self.texto.tag_nextrange("TODO", "1.0"):
+            return
+        chave, self._chave_realce = self._chave_realce, None
+        CacheRealce.guardar(chave, {tag: list(map(str, self.texto.tag_ranges(tag)))
+                                    for tag in CacheRealce.TAGS})
+
+    @property
+    def modo_grande(self):
+        return self.janela is not None
+
+    def entrar_modo_grande(self):
+        """Passa ao modo de ficheiro grande, com um documento vazio; devolve a janela."""
+        self.sair_modo_grande()
+        return self._usar_janela(JanelaFicheiroGrande(self))
+
+    def _usar_janela(self, janela):
+        self.janela = janela
+        # Sem quebra de linha: com linhas longas, a quebra é o que mais
+        # custa ao Tk a cada deslocamento
+        self.texto.config(wrap=tk.NONE)
+        self.scrollbar_texto.config(command=janela.rolar)
+        self.indice_pesquisa.usar_documento(janela.documento, janela.sincronizar)
+        # As linhas do widget deixam de ser as do documento
+        self.indice_simbolos.limpar()
+        self.indice_palavras.limpar()
+        return janela
+
+    def sair_modo_grande(self):
+        if self.janela is None:
+            return
+        self.janela.cancelar()
+        self.janela = None
+        self.observador.deslocamento = 0
+        self.texto.config(wrap=tk.WORD)
+        self.scrollbar_texto.config(command=self.texto.yview)
+        self.indice_pesquisa.usar_documento(None)
+        self.indice_simbolos.limpar()
+        self.indice_palavras.limpar()
+
+    def exportar_documento(self):
+        """Tira do widget o documento atual e devolve o seu estado.
+
+        O widget fica vazio. Num ficheiro grande é guardada a própria
+        JanelaFicheiroGrande (com as edições da janela já no documento).
+        """
+        texto = self.texto
+        estado = {"insert": texto.index(tk.INSERT), "vista": texto.index("@0,0")}
+        if self.janela is not None:
+            janela = self.janela
+            janela.sincronizar()
+            estado["janela"] = janela
+            estado["insert"] = janela.para_documento(estado["insert"])
+            estado["vista"] = janela.para_documento(estado["vista"])
+            self.sair_modo_grande()
+        else:
+            estado["texto"] = texto.get("1.0", "end-1c")
+            estado["tags"] = self.formatacao.indices_por_tag()
+        # O histórico de undo vai com o documento (também na janela, que
+        # volta a ser a mesma)
+        estado["undo"] = self.undo.exportar_estado()
+        self.importar_documento()
+        return estado
+
+    def importar_documento(self, estado=None):
+        """Põe no widget um documento exportado (ou um documento vazio)."""
+        texto = self.texto
+        self.observador.suspenso = self.undo.suspenso = True
+        try:
+            texto.delete("1.0", tk.END)
+            self.formatacao.limpar()
+            if estado is not None and "texto" in estado:
+                conteudo = estado["texto"]
+                if isinstance(conteudo, TextoComprimido):
+                    conteudo = conteudo.texto()
+                texto.insert("1.0", conteudo)
+                self.formatacao.carregar(estado["tags"])
+                self.formatacao.empurrar()
+        finally:
+            self.observador.suspenso = self.undo.suspenso = False
+        # O widget mudou todo de uma vez: as linhas em cache deixam de valer
+        self.indice_pesquisa.limpar()
+        self.indice_simbolos.limpar()
+        self.indice_palavras.limpar()
+        self.undo.reset_undo()
+        if estado is None:
+            texto.edit_modified(False)
+            return
+        insert, vista = estado["insert"], estado["vista"]
+        if "janela" in estado:
+            janela = self._usar_janela(estado["janela"])
+            janela.retomar(int(vista.split('.')[0]) - 1)
+            insert = janela.para_local(insert) or tk.INSERT
+            vista = janela.para_local(vista) or "1.0"
+        else:
+            self.usar_realce_em_cache()
+        self.undo.importar_estado(estado["undo"])
+        texto.mark_set(tk.INSERT, insert)
+        texto.yview(vista)
+        texto.edit_modified(False)
+
+    def substituir_texto(self, novo):
+        """Torna o texto igual a `novo`, mudando só as linhas diferentes.
+
+        São edições normais, feitas num só passo de undo: o cursor, a vista
+        e as cores das linhas que ficam iguais mantêm-se.
+        """
+        import difflib
+        texto = self.texto
+        antigas = texto.get("1.0", "end-1c").split('\n')
+        novas = novo.split('\n')
+        # Início e fim iguais ficam de fora da comparação (o caso comum)
+        inicio, limite = 0, min(len(antigas), len(novas))
+        while inicio < limite and antigas[inicio] == novas[inicio]:
+            inicio += 1
+        fim = 0
+        while fim < limite - inicio and antigas[-1 - fim] == novas[-1 - fim]:
+            fim += 1
+        if inicio == len(antigas) == len(novas):
+            return
+        blocos = difflib.SequenceMatcher(
+            None, antigas[inicio:len(antigas) - fim],
+            novas[inicio:len(novas) - fim]).get_opcodes()
+
+        texto.mark_set("vista_substituir", "@0,0")
+        texto.mark_gravity("vista_substituir", tk.LEFT)
+        self.undo.undo_block_start()
+        try:
+            # Do fim para o início, para os números das linhas anteriores não mudarem
+            for operacao, a, b, c, d in reversed(blocos):
+                if operacao == "equal":
+                    continue
+                a, b = a + inicio, b + inicio
+                linhas = novas[c + inicio:d + inicio]
+                if b < len(antigas):
+                    # Linhas [a, b) com as suas quebras de linha
+                    texto.delete(f"{a + 1}.0", f"{b + 1}.0")
+                    if linhas:
+                        texto.insert(f"{a + 1}.0", "".join(l + '\n' for l in linhas))
+                elif a > 0:
+                    # Até ao fim do texto, que não acaba com uma quebra de linha
+                    texto.delete(f"{a}.end", "end-1c")
+                    if linhas:
+                        texto.insert(f"{a}.end", "".join('\n' + l for l in linhas))
+                else:
+                    texto.delete("1.0", "end-1c")
+                    texto.insert("1.0", '\n'.join(linhas))
+        finally:
+            self.undo.undo_block_stop()
+        texto.yview("vista_substituir")
+        texto.mark_unset("vista_substituir")
+
+    @medidor.medir("substituir")
+    def substituir_ocorrencias(self, ocorrencias):
+        """Substitui as ocorrências (num_linha, inicio, fim, texto_novo), por
+        ordem e sem sobreposições, num só passo de undo.
+
+        O troço entre a primeira e a última é trocado de uma vez (uma remoção
+        e uma inserção pelo Percolator, e não duas por ocorrência). As cores
+        do utilizador do troço são recalculadas: uma cor que abrange toda a
+        ocorrência passa para o texto novo, uma que só a apanha em parte fica
+        cortada. Desfazer repõe o texto e as cores antigas.
+        """
+        texto = self.texto
+        linha0, coluna0 = ocorrencias[0][:2]
+        inicio = f"{linha0}.{coluna0}"
+        fim = f"{ocorrencias[-1][0]}.{ocorrencias[-1][2]}"
+        antigo = texto.get(inicio, fim)
+        # Deslocamento (desde `inicio`) da coluna 0 de cada linha do troço
+        inicios = self._inicios_linhas(antigo, coluna0)
+        # Cada ocorrência [a, b) do texto antigo passa a [novos_a, novos_b)
+        partes, antigos_a, antigos_b, novos_a, novos_b = [], [], [], [], []
+        posicao = desvio = 0
+        for linha, a, b, novo in ocorrencias:
+            a += inicios[linha - linha0]
+            b += inicios[linha - linha0]
+            partes += (antigo[posicao:a], novo)
+            antigos_a.append(a)
+            antigos_b.append(b)
+            novos_a.append(a + desvio)
+            desvio += len(novo) - (b - a)
+            novos_b.append(b + desvio)
+            posicao = b
+        partes.append(antigo[posicao:])
+        novo_texto = "".join(partes)
+
+        def mover(deslocamento, e_inicio):
+            k = bisect_left(antigos_a, deslocamento)
+            if not k:
+                return deslocamento
+            if deslocamento < antigos_b[k - 1]:
+                # Dentro de uma ocorrência: fica fora do texto novo
+                return novos_b[k - 1] if e_inicio else novos_a[k - 1]
+            return deslocamento + novos_b[k - 1] - antigos_b[k - 1]
+
+        novos_inicios = self._inicios_linhas(novo_texto, coluna0)
+
+        def posicao_nova(deslocamento):
+            i = bisect_right(novos_inicios, deslocamento) - 1
+            return (linha0 + i) * ModeloFormatacao.LINHA + deslocamento - novos_inicios[i]
+
+        cores_antigas = self.formatacao.intervalos_em(inicio, fim)
+        cores_novas = []
+        for a, b, tag in cores_antigas:
+            linha_a, coluna_a = divmod(a, ModeloFormatacao.LINHA)
+            linha_b, coluna_b = divmod(b, ModeloFormatacao.LINHA)
+            a = mover(inicios[linha_a - linha0] + coluna_a, True)
+            b = mover(inicios[linha_b - linha0] + coluna_b, False)
+            if a < b:
+                cores_novas.append((posicao_nova(a), posicao_nova(b), tag))
+        linha_fim, coluna_fim = divmod(posicao_nova(len(novo_texto)), ModeloFormatacao.LINHA)
+        fim_novo = f"{linha_fim}.{coluna_fim}"
+
+        texto.mark_set("vista_substituir", "@0,0")
+        texto.mark_gravity("vista_substituir", tk.LEFT)
+        self.undo.undo_block_start()
+        try:
+            self.undo.addcmd(ComandoCores(
+                self.repor_cores, inicio, fim, cores_antigas, ao_desfazer=True))
+            texto.delete(inicio, fim)
+            texto.insert(inicio, novo_texto)
+            self.undo.addcmd(ComandoCores(
+                self.repor_cores, inicio, fim_novo, cores_novas, ao_desfazer=False))
+        finally:
+            self.undo.undo_block_stop()
+        texto.yview("vista_substituir")
+        texto.mark_unset("vista_substituir")
+
+    @staticmethod
+    def _inicios_linhas(troco, coluna0):
+        """Deslocamento da coluna 0 de cada linha de um troço que começa na coluna `coluna0`."""
+        return [-coluna0, *accumulate(len(linha) + 1 for linha in troco.split('\n')[:-1])]
+
+    def adicionar_ouvinte_janela(self, funcao):
+        """Regista uma função chamada quando a janela de um ficheiro grande muda."""
+        self._ouvintes_janela.append(funcao)
+
+    def ao_mudar_janela(self):
+        for funcao in self._ouvintes_janela:
+            funcao()
+        self.atualizar_numeros_linha()
+
+    def para_local(self, indice):
+        """Índice do documento -> índice do widget (None se não estiver carregado)."""
+        if self.janela is None:
+            return indice
+        return self.janela.para_local(indice)
+
+    def posicao(self):
+        """(cursor, primeira linha visível), em índices do documento."""
+        insert, vista = self.texto.index(tk.INSERT), self.texto.index("@0,0")
+        if self.janela is not None:
+            return self.janela.para_documento(insert), self.janela.para_documento(vista)
+        return insert, vista
+
+    def repor_posicao(self, insert, vista):
+        """Põe o cursor em `insert` e `vista` no topo (índices do documento)."""
+        if self.janela is not None:
+            local = self.janela.mostrar(insert)
+            if local is not None:
+                self.texto.mark_set(tk.INSERT, local)
+            return
+        self.texto.mark_set(tk.INSERT, insert)
+        self.texto.yview(vista)
+
+    def mostrar_posicao(self, indice):
+        """Faz scroll até um índice do documento; devolve o índice no widget."""
+        if self.janela is not None:
+            return self.janela.mostrar(indice)
+        self.texto.see(indice)
+        return indice
+
+    def definir_fonte(self, familia=None, tamanho=None):
+        """Altera a fonte do texto e dos números de linha."""
+        if familia is not None:
+            self.familia_fonte = familia
+        if tamanho is not None:
+            self.tamanho_fonte = tamanho
+        self.fonte.configure(family=self.familia_fonte, size=self.tamanho_fonte)
+        self.atualizar_numeros_linha()
+
+    def _ajustar_largura_numeros(self, ultima_linha):
+        """Ajusta a largura da coluna ao número de dígitos da última linha."""
+        digitos = max(len(str(ultima_linha)), 2)
+        largura = self.fonte.measure("9" * digitos) + 2 * self.margem_numeros
+        if int(self.frame_numeros_wrapper.cget("width")) != largura:
+            self.frame_numeros_wrapper.config(width=largura)
+        return largura
+
+    def atualizar_numeros_linha(self):
+        """Atualiza os números das linhas visíveis"""
+        # Não mostrar números de linha
+        if not self.mostrar_numeros_linha.get():
+            return
+
+        try:
+            # O índice 'end-1c' dá a posição do último caractere
+            ultima_linha = int(self.texto.index(f"{tk.END}-1c").split('.')[0])
+            # Primeira linha lógica com alguma parte visível
+            linha = int(self.texto.index("@0,0").split('.')[0])
+        except tk.TclError:
+            return  # Widget já destruído
+        # No modo de ficheiro grande os números são os do documento
+        deslocamento = 0
+        total = ultima_linha
+        if self.janela is not None:
+            deslocamento = self.janela.inicio
+            total = self.janela.total_linhas()
+        x = self._ajustar_largura_numeros(total) - self.margem_numeros
+        altura = self.texto.winfo_height()
+        # Linhas com erros de sintaxe ficam a vermelho
+        limites = self.texto.tag_ranges("erro_sintaxe")
+        linhas_erro = {int(str(indice).split('.')[0]) for indice in limites[::2]}
+
+        primeira_linha = linha
+        usados = 0
+        while linha <= ultima_linha:
+            # Geometria da primeira linha de ecrã desta linha lógica;
+            # uma linha com quebra ocupa várias linhas de ecrã mas só
+            # recebe o número na primeira
+            info = self.texto.dlineinfo(f"{linha}.0")
+            if info is None:
+                # O início da primeira linha pode estar acima da área visível
+                # (linha longa com quebra); as seguintes já não estão visíveis
+                if linha == primeira_linha:
+                    linha += 1
+                    continue
+                break
+            y = info[1]
+            if y >= altura:
+                break
+            if usados < len(self._itens_numeros):
+                # Reutiliza um item existente, só tocando no que mudou
+                item = self._itens_numeros[usados]
+                if item[1] != linha + deslocamento:
+                    self.numeros_linha.itemconfigure(
+                        item[0], text=str(linha + deslocamento), state="normal")
+                    item[1] = linha + deslocamento
+                if item[2] != (x, y):
+                    self.numeros_linha.coords(item[0], x, y)
+                    item[2] = (x, y)
+                cor = "red" if linha in linhas_erro else "black"
+                if item[3] != cor:
+                    self.numeros_linha.itemconfigure(item[0], fill=cor)
+                    item[3] = cor
+            else:
+                cor = "red" if linha in linhas_erro else "black"
+                id_item = self.numeros_linha.create_text(
+                    x, y, anchor="ne", text=str(linha + deslocamento),
+                    font=self.fonte, fill=cor)
+                self._itens_numeros.append([id_item, linha + deslocamento, (x, y), cor])
+            usados += 1
+            linha += 1
+
+        # Esconde os itens que sobraram (ex.: linhas apagadas ou janela menor)
+        for item in self._itens_numeros[usados:]:
+            if item[1] is not None:
+                self.numeros_linha.itemconfigure(item[0], state="hidden")
+                item[1] = None
+
+    def aplicar_cor(self, inicio, fim, cor):
+        """Aplica uma cor do utilizador ao intervalo [inicio, fim)."""
+        # Preto é a cor do texto sem tag
+        tag = None if cor == "black" else f"color_{cor}"
+        # Só as cores que de facto existem no intervalo são removidas
+        for antiga in self.formatacao.tags_em(inicio, fim):
+            if antiga != tag:
+                self.texto.tag_remove(antiga, inicio, fim)
+        self.formatacao.aplicar(inicio, fim, tag)
+        if tag is not None:
+            self.texto.tag_add(tag, inicio, fim)
+        if self.janela is not None:
+            self.janela.modificada = True
+        for funcao in self._ouvintes_cor:
+            funcao(inicio, fim, cor)
+
+    def repor_cores(self, inicio, fim, intervalos):
+        """Troca as cores do utilizador de [inicio, fim) por `intervalos`
+        (ver ModeloFormatacao.repor), com uma chamada ao Tk por tag."""
+        antigas = self.formatacao.tags_em(inicio, fim)
+        self.formatacao.repor(inicio, fim, intervalos)
+        novas = self.formatacao.indices_por_tag(intervalos)
+        for tag in antigas | novas.keys():
+            self.texto.tag_remove(tag, inicio, fim)
+        for tag, indices in novas.items():
+            self.texto.tag_add(tag, *indices)
+        if self.janela is not None:
+            self.janela.modificada = True
+        for funcao in self._ouvintes_cor:
+            funcao(inicio, fim, "black")
+            for tag, indices in novas.items():
+                cor = tag.removeprefix("color_")
+                for a, b in zip(indices[::2], indices[1::2]):
+                    funcao(a, b, cor)
+
+    def adicionar_ouvinte_cor(self, funcao):
+        """Regista uma função (inicio, fim, cor) chamada a cada mudança de cor."""
+        self._ouvintes_cor.append(funcao)
+
+    def mostrar_progresso(self, mensagem, fracao, ao_cancelar):
+        """Mostra a barra de progresso com um botão para cancelar a operação."""
+        self.label_progresso.config(text=mensagem)
+        self.barra_progresso["value"] = fracao
+        self.botao_cancelar_progresso.config(command=ao_cancelar)
+        self.frame_progresso.grid()
+
+    def esconder_progresso(self):
+        self.frame_progresso.grid_remove()
+
+    def alternar_numeros_linha(self):
+        """Mostra ou oculta os números de linha baseado no estado do checkbox"""
+        if self.mostrar_numeros_linha.get():
+            self.frame_numeros_wrapper.grid()
+            self.atualizar_numeros_linha()
+        else:
+            self.frame_numeros_wrapper.grid_remove()
+
+
+class VerificadorSintaxe:
+    """Verifica a sintaxe Python do documento num processo à parte.
+
+    O texto é compilado por um processo de trabalho, por isso um ficheiro
+    grande não bloqueia a interface. Os resultados ficam guardados pelo
+    hash do conteúdo; um resultado que chega depois de o texto ter sido
+    editado é descartado. A linha com erro é marcada com a tag
+    "erro_sintaxe" e a vermelho nos números de linha.
+    """
+
+    # Intervalo (ms) entre verificações do processo de trabalho
+    INTERVALO_VERIFICACAO_MS = 30
+    # Espera (ms) após a última edição antes da verificação automática
+    ATRASO_AUTOMATICO_MS = 800
+    MAX_RESULTADOS_GUARDADOS = 32
+
+    def __init__(self, area_texto):
+        self.area_texto = area_texto
+        # Verificar automaticamente quando o utilizador pára de escrever
+        self.automatica = tk.BooleanVar(value=False)
+        # Chamado com o resultado: None (sem erros) ou (linha, coluna, mensagem)
+        self.ao_concluir = None
+        self.resultado = None
+        self._executor = None
+        # Verificação em curso: (futuro, hash do conteúdo, edições no início)
+        self._em_curso = None
+        self._manual = False
+        self._edicoes = 0
+        self._resultados = OrderedDict()
+        self.area_texto.texto.tag_configure(
+            "erro_sintaxe", background="#ffd6d6", underline=True)
+        self.area_texto.observador.adicionar_ouvinte(self._ao_editar)
+        self.area_texto.adicionar_ouvinte_janela(self._marcar)
+        self.area_texto.agendador.registar(
+            "sintaxe", self._verificar_automaticamente, prioridade=10,
+            atraso_ms=self.ATRASO_AUTOMATICO_MS, apos_edicao=True)
+
+    @staticmethod
+    def compilar(codigo):
+        """Corre no processo de trabalho: devolve None ou (linha, coluna, mensagem)."""
+        with warnings.catch_warnings():
+            # Avisos (ex.: "is" com literais) não são erros de sintaxe
+            warnings.simplefilter("ignore")
+            try:
+                compile(codigo, "<editor>", "exec", dont_inherit=True)
+            except SyntaxError as erro:
+                return (erro.lineno or 1, max((erro.offset or 1) - 1, 0), erro.msg)
+            except ValueError as erro:  # ex.: caracteres nulos
+                return (1, 0, str(erro))
+        return None
+
+    def _ao_editar(self, linha, removidas, inseridas):
+        self._edicoes += 1
+
+    def _verificar_automaticamente(self):
+        if self.automatica.get():
+            self.verificar()
+
+    def verificar(self, manual=False):
+        """Começa uma verificação; com manual=True, a vista salta para o erro."""
+        self._manual = self._manual or manual
+        import hashlib
+        codigo = self.area_texto.obter_texto()
+        chave = hashlib.blake2b(
+            codigo.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        if chave in self._resultados:
+            self._resultados.move_to_end(chave)
+            self._cancelar()
+            self._concluir(self._resultados[chave])
+            return
+        self._cancelar()
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # "spawn": o processo novo não herda o estado do Tk nem os threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        futuro = self._executor.submit(VerificadorSintaxe.compilar, codigo)
+        self._em_curso = (futuro, chave, self._edicoes)
+        self.area_texto.texto.after(
+            self.INTERVALO_VERIFICACAO_MS, self._verificar_conclusao, futuro)
+
+    def _cancelar(self):
+        # Uma compilação já começada não pode ser interrompida, mas o seu
+        # resultado deixa de ser mostrado
+        if self._em_curso is not None:
+            self._em_curso[0].cancel()
+            self._em_curso = None
+
+    def _verificar_conclusao(self, futuro):
+        if self._em_curso is None or self._em_curso[0] is not futuro:
+            return  # Substituída por uma verificação mais recente
+        if not futuro.done():
+            self.area_texto.texto.after(
+                self.INTERVALO_VERIFICACAO_MS, self._verificar_conclusao, futuro)
+            return
+        _, chave, edicoes = self._em_curso
+        self._em_curso = None
+        try:
+            resultado = futuro.result()
+        except Exception as erro:  # ex.: o processo de trabalho morreu
+            self._executor = None
+            resultado = (1, 0, f"Não foi possível verificar: {erro}")
+        else:
+            # O resultado é válido para aquele conteúdo, mesmo que já tenha mudado
+            self._resultados[chave] = resultado
+            if len(self._resultados) > self.MAX_RESULTADOS_GUARDADOS:
+                self._resultados.popitem(last=False)
+        if edicoes != self._edicoes:
+            # O texto mudou entretanto: uma verificação manual é refeita,
+            # a automática já foi pedida pela própria edição
+            if self._manual:
+                self.verificar()
+            return
+        self._concluir(resultado)
+
+    def _concluir(self, resultado):
+        self.resultado = resultado
+        self._marcar()
+        if resultado is not None and self._manual:
+            linha, coluna, _ = resultado
+            posicao = self.area_texto.mostrar_posicao(f"{linha}.{coluna}")
+            if posicao is not None:
+                self.area_texto.texto.mark_set(tk.INSERT, posicao)
+            self.area_texto.texto.focus_set()
+        self._manual = False
+        if self.ao_concluir is not None:
+            self.ao_concluir(resultado)
+
+    def _marcar(self):
+        """Marca a linha do último erro (também chamado quando a janela muda)."""
+        texto = self.area_texto.texto
+        texto.tag_remove("erro_sintaxe", "1.0", tk.END)
+        if self.resultado is not None:
+            local = self.area_texto.para_local(f"{self.resultado[0]}.0")
+            if local is not None:
+                texto.tag_add("erro_sintaxe", local, f"{local} lineend")
+        self.area_texto.atualizar_numeros_linha()
+
+    def fechar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class PainelFerramentas:
+    """Gerencia o painel de ferramentas lateral."""
+    
+    def __init__(self, parent, area_texto, gestor_ficheiros, verificador_sintaxe):
+        self.parent = parent
+        self.area_texto = area_texto
+        self.gestor_ficheiros = gestor_ficheiros
+        self.verificador_sintaxe = verificador_sintaxe
+        self.verificador_sintaxe.ao_concluir = self._mostrar_resultado_sintaxe
+        self._configurar_painel()
+
+    def _configurar_painel(self):
+        self.frame = tk.Frame(self.parent, relief=tk.RAISED, bd=2)
+
+        # dicionário para criar os botões
+        botoes = {
+            "Novo": self.gestor_ficheiros.novo_ficheiro,
+            "Abrir": self.gestor_ficheiros.abrir_ficheiro,
+            "Gravar": self.gestor_ficheiros.gravar_ficheiro,
+            "Gravar Como": self.gestor_ficheiros.gravar_como,
+            "Verificar Sintaxe": self._verificar_sintaxe
+        }
+
+        # criação dos botões utilizando o dicionário
+        for i, (texto_botao, comando) in enumerate(botoes.items()):
+            botao = tk.Button(self.frame, text=texto_botao, command=comando)
+            botao.grid(row=i, column=0, padx=5, pady=5, sticky="ew")
+
+        # Checkbox para mostrar/ocultar números de linha
+        checkbox_numeros = tk.Checkbutton(
+            self.frame, text="Números de Linha",
+            variable=self.area_texto.mostrar_numeros_linha,
+            command=self.area_texto.alternar_numeros_linha
+        )
+        checkbox_numeros.grid(row=len(botoes), column=0,
+                              padx=5, pady=5, sticky="w")
+
+        # Verificação de sintaxe automática e resultado da última verificação
+        checkbox_sintaxe = tk.Checkbutton(
+            self.frame, text="Verificar ao escrever",
+            variable=self.verificador_sintaxe.automatica,
+            command=self._alternar_verificacao_automatica
+        )
+        checkbox_sintaxe.grid(row=len(botoes) + 1, column=0,
+                              padx=5, pady=(0, 5), sticky="w")
+        self.label_sintaxe = tk.Label(
+            self.frame, text="", anchor="w", justify=tk.LEFT, wraplength=180)
+        self.label_sintaxe.grid(row=len(botoes) + 2, column=0,
+                                padx=5, sticky="ew")
+
+        # Controles de formatação
+        self._configurar_controles_formatacao(len(botoes) + 3)
+
+    def _configurar_controles_formatacao(self, linha_inicial):
+        # Label e seleção de cor do texto
+        label_cor = tk.Label(self.frame, text="Cor do Texto:")
+        label_cor.grid(row=linha_inicial, column=0,
+                       padx=5, pady=(10, 0), sticky="w")
+
+        # Frame para os botões de cor
+        frame_cores = tk.Frame(self.frame)
+        frame_cores.grid(row=linha_inicial + 1, column=0,
+                         padx=5, pady=5, sticky="w")
+
+        # Dicionário com cores disponíveis
+        self.cores_disponiveis = {
+            "Preto": "black", "Azul": "blue", "Vermelho": "red",
+            "Verde": "green", "Roxo": "purple", "Laranja": "orange"
+        }
+
+        # Pre-configurar tags de cor para o texto
+        for cor in self.cores_disponiveis.values():
+            self.area_texto.texto.tag_config(f"color_{cor}", foreground=cor)
+
+        # Criar botões para cada cor
+        for i, (nome_cor, valor_cor) in enumerate(self.cores_disponiveis.items()):
+            botao_cor = tk.Button(
+                frame_cores, text=nome_cor, bg=valor_cor, width=8,
+                fg="white" if valor_cor in [
+                    "black", "blue", "purple"] else "black",
+                command=lambda cor=valor_cor: self._alterar_cor_texto(cor)
+            )
+            # Organizar em 2 colunas
+            botao_cor.grid(row=i // 2, column=i % 2, padx=2, pady=2)
+
+        # Label paraa o tamanho da fonte
+        label_tamanho_fonte = tk.Label(self.frame, text="Tamanho da Fonte:")
+        label_tamanho_fonte.grid(
+            row=linha_inicial + 2, column=0, padx=5, pady=(10, 0), sticky="w")
+
+        # Variável para controlar o tamanho da fonte
+        self.tamanho_fonte_var = tk.IntVar(value=self.area_texto.tamanho_fonte)
+
+        # Slider para alterar tamanho da fonte
+        slider_tamanho_fonte = tk.Scale(
+            # Intervalo de valores e orientação vertical
+            self.frame, from_=10, to=16, orient=tk.HORIZONTAL,
+            variable=self.tamanho_fonte_var,
+            # Função que é chamada quando se acciona o slider
+            command=self._alterar_tamanho_fonte
+        )
+        
+        slider_tamanho_fonte.grid(
+            row=linha_inicial + 3, column=0, padx=5, pady=5, sticky="ew")
+
+        # Label e combobox para a família da fonte
+        label_familia_fonte = tk.Label(self.frame, text="Família da Fonte:")
+        label_familia_fonte.grid(
+            row=linha_inicial + 4, column=0, padx=5, pady=(10, 0), sticky="w")
+
+        # Opções de família de fonte disponíveis
+        familias_fonte_disponiveis = [
+            "Arial", "Times New Roman", "Courier New"]
+
+        self.combobox_familia_fonte = ttk.Combobox(
+            self.frame, values=familias_fonte_disponiveis,
+            state="readonly", width=15  # impede edição manual
+        )
+        self.combobox_familia_fonte.set(self.area_texto.familia_fonte)
+        self.combobox_familia_fonte.bind(
+            "<<ComboboxSelected>>", self._alterar_familia_fonte)
+        self.combobox_familia_fonte.grid(
+            row=linha_inicial + 5, column=0, padx=5, pady=5, sticky="ew")
+
+    def _alterar_cor_texto(self, nova_cor):
+        """Altera a cor do texto selecionado no editor."""
+        try:
+            # Obter os índices do texto selecionado
+            start, end = self.area_texto.texto.tag_ranges(tk.SEL)
+        except ValueError:
+            return  # Nenhum texto selecionado
+
+        # Substituir a cor da seleção pela nova (o diário é avisado pela área de texto)
+        self.area_texto.aplicar_cor(start, end, nova_cor)
+
+    def _alterar_tamanho_fonte(self, novo_tamanho_str):
+        """Altera o tamanho da fonte no editor e nos números de linha."""
+        self.area_texto.definir_fonte(tamanho=int(novo_tamanho_str))
+
+    def _alterar_familia_fonte(self, event=None):
+        """Altera a família da fonte no editor e nos números de linha."""
+        self.area_texto.definir_fonte(
+            familia=self.combobox_familia_fonte.get(),
+            tamanho=self.tamanho_fonte_var.get())
+
+    # Verificação de erros no código
+    def _verificar_sintaxe(self):
+        self.label_sintaxe.config(text="A verificar...", fg="black")
+        self.verificador_sintaxe.verificar(manual=True)
+
+    def _alternar_verificacao_automatica(self):
+        if self.verificador_sintaxe.automatica.get():
+            self.verificador_sintaxe.verificar()
+
+    def _mostrar_resultado_sintaxe(self, resultado):
+        if resultado is None:
+            self.label_sintaxe.config(text="Sintaxe correta", fg="darkgreen")
+        else:
+            linha, coluna, mensagem = resultado
+            self.label_sintaxe.config(
+                text=f"Linha {linha}, col. {coluna + 1}: {mensagem}", fg="red")
+
+
+class PesquisaPasta:
+    """Pesquisa em todos os ficheiros de texto de uma pasta.
+
+    Um thread percorre a árvore (saltando pastas ignoradas e as do
+    .gitignore da raiz) e entrega os ficheiros, em lotes, a um conjunto de
+    processos; cada processo lê os seus com mmap, salta os binários e os que
+    não contêm o termo, e devolve as ocorrências. Os resultados chegam à
+    fila `resultados` como listas de (caminho, [(linha, inicio, fim, trecho)]),
+    e o fim da pesquisa é assinalado com None. As opções e as colunas são as
+    da pesquisa no documento (IndicePesquisa), com as quebras de linha
+    convertidas para '\\n' como ao abrir o ficheiro.
+    """
+
+    PASTAS_IGNORADAS = {"__pycache__", "node_modules", "venv", "env",
+                        "build", "dist", "site-packages"}
+    EXTENSOES_IGNORADAS = (".pyc", ".pyo", ".so", ".o", ".a", ".dll", ".exe",
+                           ".zip", ".gz", ".bz2", ".xz", ".tar", ".whl",
+                           ".png", ".jpg", ".jpeg", ".gif", ".ico", ".pdf")
+    # Ficheiros entregues a um processo de cada vez
+    FICHEIROS_POR_TAREFA = 64
+    # Lotes à espera por processo: o percurso não corre muito à frente
+    TAREFAS_POR_PROCESSO = 4
+    # Bytes do início do ficheiro onde um '\0' indica que é binário
+    AMOSTRA_BINARIO = 8192
+    MAX_OCORRENCIAS_FICHEIRO = 200
+    TAMANHO_TRECHO = 100
+
+    def __init__(self, pasta, termo, maiusculas=False, palavra_inteira=False,
+                 regex=False):
+        self.pasta = os.path.abspath(pasta)
+        self.opcoes = (termo, maiusculas, palavra_inteira, regex)
+        # Levanta re.error já aqui se a expressão regular for inválida
+        IndicePesquisa._criar_procura(*self.opcoes)
+        self.resultados = queue.Queue()
+        self.ficheiros_lidos = 0
+        self.erros = 0
+        self._parar = threading.Event()
+
+    def iniciar(self, executor, processos):
+        threading.Thread(target=self._percorrer_e_distribuir,
+                         args=(executor, processos), daemon=True).start()
+
+    def cancelar(self):
+        """Pára de entregar ficheiros; os lotes já entregues acabam sozinhos."""
+        self._parar.set()
+
+    @property
+    def cancelada(self):
+        return self._parar.is_set()
+
+    def _percorrer_e_distribuir(self, executor, processos):
+        maximo = processos * self.TAREFAS_POR_PROCESSO
+        livres = threading.Semaphore(maximo)
+        lote = []
+        try:
+            for caminho in self.percorrer(self.pasta, self._parar):
+                lote.append(caminho)
+                if len(lote) == self.FICHEIROS_POR_TAREFA:
+                    self._entregar(executor, lote, livres)
+                    lote = []
+            if lote and not self._parar.is_set():
+                self._entregar(executor, lote, livres)
+        except Exception:
+            # Ex.: o conjunto de processos foi fechado ou morreu
+            self.erros += 1
+        finally:
+            # Espera que todos os lotes entregues terminem
+            for _ in range(maximo):
+                livres.acquire()
+            self.resultados.put(None)
+
+    def _entregar(self, executor, lote, livres):
+        livres.acquire()
+        try:
+            futuro = executor.submit(PesquisaPasta.procurar_ficheiros, lote, self.opcoes)
+        except Exception:
+            livres.release()
+            raise
+        futuro.add_done_callback(lambda futuro: self._lote_terminado(futuro, livres))
+
+    def _lote_terminado(self, futuro, livres):
+        # Corre num thread do ProcessPoolExecutor
+        try:
+            lidos, encontrados = futuro.result()
+        except Exception:
+            self.erros += 1
+        else:
+            self.ficheiros_lidos += lidos
+            if encontrados:
+                self.resultados.put(encontrados)
+        finally:
+            livres.release()
+
+    @classmethod
+    def percorrer(cls, pasta, parar=None):
+        """Gera os caminhos dos ficheiros a pesquisar, pasta a pasta."""
+        regras = cls._ler_gitignore(pasta)
+        pendentes = [pasta]
+        while pendentes:
+            atual = pendentes.pop()
+            try:
+                with os.scandir(atual) as iterador:
+                    entradas = sorted(iterador, key=lambda entrada: entrada.name)
+            except OSError:
+                continue
+            subpastas = []
+            for entrada in entradas:
+                if parar is not None and parar.is_set():
+                    return
+                nome = entrada.name
+                relativo = entrada.path[len(pasta) + 1:].replace(os.sep, "/")
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if (nome.startswith(".") or nome in cls.PASTAS_IGNORADAS
+                                or cls._ignorado(regras, nome, relativo, True)):
+                            continue
+                        subpastas.append(entrada.path)
+                    elif entrada.is_file(follow_symlinks=False):
+                        if (nome.lower().endswith(cls.EXTENSOES_IGNORADAS)
+                                or cls._ignorado(regras, nome, relativo, False)):
+                            continue
+                        yield entrada.path
+                except OSError:
+                    continue
+            # As subpastas são visitadas por ordem alfabética
+            pendentes.extend(reversed(subpastas))
+
+    @staticmethod
+    def _ler_gitignore(pasta):
+        """Regras simples do .gitignore da raiz: (padrao, só_pastas, com_caminho)."""
+        regras = []
+        try:
+            with open(os.path.join(pasta, ".gitignore"), encoding="utf-8") as ficheiro:
+                linhas = ficheiro.read().splitlines()
+        except (OSError, ValueError):
+            return regras
+        for linha in linhas:
+            linha = linha.strip()
+            # Comentários e exceções ("!padrao") não são suportados
+            if not linha or linha.startswith(("#", "!")):
+                continue
+            so_pastas = linha.endswith("/")
+            linha = linha.rstrip("/")
+            regras.append((linha.lstrip("/"), so_pastas, "/" in linha))
+        return regras
+
+    @staticmethod
+    def _ignorado(regras, nome, relativo, e_pasta):
+        from fnmatch import fnmatchcase
+        for padrao, so_pastas, com_caminho in regras:
+            if so_pastas and not e_pasta:
+                continue
+            if fnmatchcase(relativo if com_caminho else nome, padrao):
+                return True
+        return False
+
+    @staticmethod
+    def procurar_ficheiros(caminhos, opcoes):
+        """Corre num processo à parte: devolve (lidos, [(caminho, ocorrencias)])."""
+        procura = IndicePesquisa._criar_procura(*opcoes)
+        maiusculas = opcoes[1]
+        filtro = None
+        if procura.alvo is not None and procura.alvo.isascii():
+            # Ficheiros sem o termo são postos de parte sem descodificar
+            # (em bytes, a comparação sem maiúsculas só cobre o ASCII)
+            filtro = re.compile(re.escape(procura.alvo.encode("ascii")),
+                                0 if maiusculas else re.IGNORECASE)
+        encontrados = []
+        for caminho in caminhos:
+            try:
+                texto = PesquisaPasta._ler(caminho, filtro)
+            except (OSError, ValueError):
+                continue
+            if texto is None:
+                continue
+            ocorrencias = PesquisaPasta._procurar_no_texto(texto, procura)
+            if ocorrencias:
+                encontrados.append((caminho, ocorrencias))
+        return len(caminhos), encontrados
+
+    @staticmethod
+    def _ler(caminho, filtro):
+        """Texto do ficheiro, ou None se for binário, vazio ou sem o termo."""
+        if caminho.endswith(".rtxt"):
+            leitor = rtxt.FormatoRtxt.abrir(caminho)
+            return "".join(pedaco for _, pedaco in leitor.pedacos())
+        with open(caminho, "rb") as ficheiro:
+            if os.fstat(ficheiro.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(ficheiro.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                if b"\0" in mapa[:PesquisaPasta.AMOSTRA_BINARIO]:
+                    return None
+                if filtro is not None and filtro.search(mapa) is None:
+                    return None
+                texto = mapa[:].decode("utf-8")
+        if "\r" in texto:
+            # Como o modo texto do open() (e o CarregadorFicheiro)
+            texto = texto.replace("\r\n", "\n").replace("\r", "\n")
+        return texto
+
+    @staticmethod
+    def _procurar_no_texto(texto, procura):
+        if procura.alvo is not None:
+            base = texto.lower() if procura.em_minusculas else texto
+            if procura.alvo not in base:
+                return []
+            linhas = texto.split("\n")
+            linhas_base = base.split("\n")
+            # O lower() não mexe nas quebras de linha: as listas alinham
+            candidatas = compress(range(len(linhas)), map(
+                str.__contains__, linhas_base, repeat(procura.alvo)))
+        else:
+            linhas = linhas_base = texto.split("\n")
+            candidatas = range(len(linhas))
+        ocorrencias = []
+        for i in candidatas:
+            linha = linhas[i]
+            trecho = linha.strip()[:PesquisaPasta.TAMANHO_TRECHO]
+            for inicio, fim in procura(linha, linhas_base[i]):
+                ocorrencias.append((i + 1, inicio, fim, trecho))
+                if len(ocorrencias) >= PesquisaPasta.MAX_OCORRENCIAS_FICHEIRO:
+                    return ocorrencias
+        return ocorrencias
+
+
+class PainelPesquisa:
+    """Gerencia o painel de pesquisa."""
+
+    # Número de resultados enviados ao Tk em cada chamada
+    TAMANHO_LOTE = 500
+    # Espera (ms) após a última tecla antes de pesquisar
+    ATRASO_PESQUISA_MS = 200
+    # Espera (ms) após a última edição do texto antes de atualizar os resultados
+    ATRASO_ATUALIZACAO_MS = 500
+    # Tempo máximo (s) de pesquisa em cada fatia, para não bloquear a interface
+    ORCAMENTO_FATIA = 0.015
+    # Máximo de resultados mostrados por fatia
+    MAX_RESULTADOS_FATIA = 2000
+    # Intervalo (ms) entre leituras dos resultados da pesquisa numa pasta
+    INTERVALO_PASTA_MS = 50
+    # A pesquisa numa pasta pára ao chegar a este número de resultados
+    MAX_RESULTADOS_PASTA = 20000
+
+    def __init__(self, parent, area_texto, gestor_ficheiros=None):
+        self.parent = parent
+        self.area_texto = area_texto
+        # Abre os ficheiros dos resultados de uma pesquisa numa pasta
+        self.gestor_ficheiros = gestor_ficheiros
+        # Lista para armazenar informações dos resultados
+        self.resultados_pesquisa = []
+        # Índice com as linhas do documento, mantido pelas edições
+        self.indice = self.area_texto.indice_pesquisa
+        # Uma janela nova de um ficheiro grande chega sem realces
+        self.area_texto.adicionar_ouvinte_janela(self._realcar_janela)
+        # Opções de pesquisa
+        self.maiusculas_var = tk.BooleanVar(value=False)
+        self.palavra_inteira_var = tk.BooleanVar(value=False)
+        self.regex_var = tk.BooleanVar(value=False)
+        # Substituir tudo só dentro da seleção
+        self.na_selecao_var = tk.BooleanVar(value=False)
+        # Pesquisa em todos os ficheiros de uma pasta, em vez do documento
+        self.na_pasta_var = tk.BooleanVar(value=False)
+        self.pasta = os.getcwd()
+        self._pesquisa_pasta = None
+        self._resultados_na_pasta = False
+        # Processos da pesquisa na pasta, criados na primeira
+        self._executor = None
+        self._processos = os.cpu_count() or 1
+        # Pesquisas adiadas: ao escrever o termo e depois de editar o texto
+        self.agendador = self.area_texto.agendador
+        self.agendador.registar(
+            "pesquisa", self.pesquisar_texto, prioridade=5,
+            atraso_ms=self.ATRASO_PESQUISA_MS)
+        self.agendador.registar(
+            "pesquisa_apos_edicao", self._atualizar_apos_edicao, prioridade=5,
+            atraso_ms=self.ATRASO_ATUALIZACAO_MS, apos_edicao=True)
+        # Estado da pesquisa incremental
+        self._id_fatia = None
+        self._pesquisa_em_curso = None
+        self._pendentes = []
+        self._mostrar_primeiro = True
+        self._inicio_pesquisa = 0.0
+        self._configurar_painel()
+
+    def _configurar_painel(self):
+        # Frame para o painel de pesquisa
+        self.frame = tk.Frame(self.parent, relief=tk.RAISED, bd=2)
+
+        # Campo de pesquisa e botões
+        label_termo = tk.Label(self.frame, text="Pesquisar:")
+        label_termo.grid(row=0, column=0, padx=(5, 2), pady=3, sticky="w")
+
+        # A pesquisa é feita enquanto se escreve (com um pequeno atraso)
+        self.termo_var = tk.StringVar()
+        self.termo_var.trace_add("write", self._agendar_pesquisa)
+        self.entry_pesquisa = tk.Entry(
+            self.frame, width=8, textvariable=self.termo_var)
+        self.entry_pesquisa.grid(row=0, column=1, padx=2, pady=3)
+        # tecla Enter chama a função de pesquisa de texto de imediato
+        self.entry_pesquisa.bind("<Return>", self.pesquisar_texto)
+
+        # Carregando no botão chama a mesma função
+        btn_pesquisar = tk.Button(
+            self.frame, text="Pesquisar", command=self.pesquisar_texto)
+        btn_pesquisar.grid(row=0, column=2, padx=2, pady=3)
+
+        btn_limpar = tk.Button(self.frame, text="Limpar",
+                               command=self.limpar_pesquisa)
+        btn_limpar.grid(row=0, column=3, padx=(2, 5), pady=3)
+
+        # Opções de pesquisa
+        opcoes = [
+            ("Maiúsc./minúsc.", self.maiusculas_var),
+            ("Palavra inteira", self.palavra_inteira_var),
+            ("Regex", self.regex_var),
+        ]
+        for i, (texto_opcao, variavel) in enumerate(opcoes):
+            checkbox = tk.Checkbutton(
+                self.frame, text=texto_opcao, variable=variavel,
+                command=self._agendar_pesquisa)
+            checkbox.grid(row=0, column=4 + i, padx=2, pady=3, sticky="w")
+
+        # Pesquisa numa pasta (só com Enter ou o botão: é mais pesada)
+        coluna = 4 + len(opcoes)
+        tk.Checkbutton(self.frame, text="Na pasta", variable=self.na_pasta_var,
+                       command=self._alternar_na_pasta).grid(
+            row=0, column=coluna, padx=2, pady=3, sticky="w")
+        tk.Button(self.frame, text="Pasta...", command=self._escolher_pasta).grid(
+            row=0, column=coluna + 1, padx=(2, 5), pady=3)
+
+        # Substituição (no documento aberto)
+        tk.Label(self.frame, text="Substituir:").grid(
+            row=1, column=0, padx=(5, 2), pady=3, sticky="w")
+        self.substituto_var = tk.StringVar()
+        self.entry_substituto = tk.Entry(
+            self.frame, width=8, textvariable=self.substituto_var)
+        self.entry_substituto.grid(row=1, column=1, padx=2, pady=3)
+        self.entry_substituto.bind("<Return>", self.substituir)
+        tk.Button(self.frame, text="Substituir", command=self.substituir).grid(
+            row=1, column=2, padx=2, pady=3)
+        tk.Button(self.frame, text="Substituir tudo", command=self.substituir_tudo).grid(
+            row=1, column=3, padx=(2, 5), pady=3)
+        tk.Checkbutton(self.frame, text="Na seleção", variable=self.na_selecao_var).grid(
+            row=1, column=4, padx=2, pady=3, sticky="w")
+
+        # Listbox com resultados
+        frame_listbox = tk.Frame(self.frame)
+        frame_listbox.grid(row=2, column=0, columnspan=coluna + 2,
+                           padx=5, pady=(3, 0), sticky="ew")
+
+        self.listbox_resultados = tk.Listbox(frame_listbox, height=5, width=80)
+        self.listbox_resultados.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Scrollbar para a listbox
+        scrollbar_listbox = tk.Scrollbar(
+            frame_listbox, orient=tk.VERTICAL, command=self.listbox_resultados.yview)
+        scrollbar_listbox.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox_resultados.config(yscrollcommand=scrollbar_listbox.set)
+
+        # Pasta e progresso da pesquisa na pasta
+        self.label_estado = tk.Label(self.frame, anchor="w")
+        self.label_estado.grid(row=3, column=0, columnspan=coluna + 2,
+                               padx=5, pady=(0, 3), sticky="ew")
+
+        # Bind para duplo clique na listbox
+        self.listbox_resultados.bind(
+            # Duplo clique no botão esquerdo do rato
+            "<Double-Button-1>", self.ir_para_resultado)
+
+        # Configurar expansão do frame de pesquisa
+        self.frame.columnconfigure(1, weight=0)
+
+        # Configurar cor do highlight
+        self.area_texto.texto.tag_config(
+            "search_highlight", background="yellow", foreground="black")
+
+    def _agendar_pesquisa(self, *args):
+        """Adia a pesquisa até o utilizador parar de escrever."""
+        if not self.na_pasta_var.get():
+            self.agendador.pedir("pesquisa")
+
+    def _alternar_na_pasta(self):
+        if self.na_pasta_var.get():
+            self.label_estado.config(text=f"Pasta: {self.pasta} (Enter para pesquisar)")
+        else:
+            self.label_estado.config(text="")
+            self._agendar_pesquisa()
+
+    def _escolher_pasta(self):
+        from tkinter.filedialog import askdirectory
+        pasta = askdirectory(initialdir=self.pasta, mustexist=True)
+        if not pasta:
+            return
+        self.pasta = pasta
+        self.na_pasta_var.set(True)
+        self._alternar_na_pasta()
+
+    def _atualizar_apos_edicao(self):
+        """Refaz a pesquisa atual com o texto editado, sem mexer na vista."""
+        if self.entry_pesquisa.get().strip() and not self._resultados_na_pasta:
+            self.pesquisar_texto(mostrar_primeiro=False)
+
+    def _cancelar_pesquisa(self):
+        """Interrompe a pesquisa em curso, se houver."""
+        if self._id_fatia is not None:
+            self.frame.after_cancel(self._id_fatia)
+            self._id_fatia = None
+        if self._pesquisa_em_curso is not None:
+            self._pesquisa_em_curso.close()
+            self._pesquisa_em_curso = None
+        if self._pesquisa_pasta is not None:
+            self._pesquisa_pasta.cancelar()
+            self._pesquisa_pasta = None
+        self._pendentes = []
+
+    @medidor.medir("pesquisa (início)")
+    def pesquisar_texto(self, event=None, mostrar_primeiro=True):
+        """Pesquisa o texto no editor e mostra os resultados na listbox.
+
+        A pesquisa corre em fatias curtas via after(), e os resultados vão
+        aparecendo na listbox à medida que são encontrados. Com
+        mostrar_primeiro, a vista salta para o primeiro resultado.
+        """
+        self.agendador.cancelar("pesquisa")
+        self.agendador.cancelar("pesquisa_apos_edicao")
+        # Uma pesquisa anterior ainda a decorrer deixou de interessar
+        self._cancelar_pesquisa()
+        self._mostrar_primeiro = mostrar_primeiro
+
+        # Limpar resultados anteriores
+        self.listbox_resultados.delete(0, tk.END)
+        self.resultados_pesquisa.clear()
+        self._resultados_na_pasta = False
+        # Remove realces anteriores
+        self.area_texto.texto.tag_remove("search_highlight", "1.0", tk.END)
+
+        # Obtem o termo de pesquisa da caixa de texto
+        termo_pesquisa = self.entry_pesquisa.get().strip()
+        # Se nenhuma palavra foi digitada, sai da função
+        if not termo_pesquisa:
+            return
+        if self.na_pasta_var.get():
+            self._pesquisar_na_pasta(termo_pesquisa)
+            return
+
+        # Ocorrências vindas do índice (só as linhas editadas desde a
+        # última pesquisa são analisadas de novo)
+        try:
+            self._pesquisa_em_curso = self.indice.procurar_por_partes(
+                termo_pesquisa,
+                maiusculas=self.maiusculas_var.get(),
+                palavra_inteira=self.palavra_inteira_var.get(),
+                regex=self.regex_var.get())
+        except re.error as erro:
+            self.listbox_resultados.insert(
+                tk.END, f"Expressão regular inválida: {erro}")
+            return
+        self._inicio_pesquisa = time.perf_counter()
+        self._processar_fatia()
+
+    @medidor.medir("pesquisa (fatia)")
+    def _processar_fatia(self):
+        """Pesquisa durante um curto intervalo e mostra o que foi encontrado."""
+        self._id_fatia = None
+        limite = time.perf_counter() + self.ORCAMENTO_FATIA
+        try:
+            while (self._pesquisa_em_curso is not None
+                   and time.perf_counter() < limite
+                   and len(self._pendentes) < self.MAX_RESULTADOS_FATIA):
+                self._pendentes += next(self._pesquisa_em_curso)
+        except StopIteration as fim:
+            self._pesquisa_em_curso = None
+            if fim.value is False:
+                # O texto foi editado a meio: recomeçar com o texto atual
+                self._pendentes = []
+                self.agendador.pedir("pesquisa_apos_edicao")
+                return
+        terminada = self._pesquisa_em_curso is None
+
+        lote = self._pendentes[:self.MAX_RESULTADOS_FATIA]
+        del self._pendentes[:self.MAX_RESULTADOS_FATIA]
+        self._mostrar_resultados(lote)
+
+        if not terminada or self._pendentes:
+            self._id_fatia = self.frame.after(1, self._processar_fatia)
+            return
+        medidor.registar("pesquisa (total)", time.perf_counter() - self._inicio_pesquisa)
+        if len(self.resultados_pesquisa) == 0:
+            # Se não houve resultados, mostra uma mensagem indicativa
+            self.listbox_resultados.insert(
+                tk.END, "Nenhum resultado encontrado")
+
+    def _mostrar_resultados(self, ocorrencias):
+        """Acrescenta um lote de ocorrências à listbox e ao realce."""
+        if not ocorrencias:
+            return
+        primeiro_lote = not self.resultados_pesquisa
+        linhas_listbox = []
+        indices_realce = []
+        for num_linha, inicio, fim in ocorrencias:
+            linha_pos = f"{num_linha}.{inicio}"
+            fim_pos = f"{num_linha}.{fim}"
+            indices_realce += (linha_pos, fim_pos)
+
+            # Preparar texto para mostrar na listbox (limitado a 60 caracteres)
+            contexto = self.indice.linha(num_linha).strip()
+            if len(contexto) > 60:
+                contexto = contexto[:60] + "..."
+            linhas_listbox.append(
+                f"Linha {num_linha}, col. {inicio + 1}: {contexto}")
+
+            # Armazena informações de cada resultado num dicionário
+            # 'posicao' obtida da linha E coluna (inicio da palavra pesquisada)
+            # 'fim_posicao' permite definir o fim do realce
+            self.resultados_pesquisa.append({
+                'linha': num_linha, 'coluna': inicio,
+                'posicao': linha_pos, 'fim_posicao': fim_pos
+            })
+
+        # Realce e listbox atualizados em lotes, em vez de uma chamada por resultado
+        self._realcar(indices_realce)
+        for i in range(0, len(linhas_listbox), self.TAMANHO_LOTE):
+            self.listbox_resultados.insert(
+                tk.END, *linhas_listbox[i:i + self.TAMANHO_LOTE])
+
+        if primeiro_lote and self._mostrar_primeiro:
+            # Faz o scroll para a posição do primeiro resultado
+            self.area_texto.mostrar_posicao(self.resultados_pesquisa[0]['posicao'])
+
+    def _pesquisar_na_pasta(self, termo):
+        """Começa a pesquisa em todos os ficheiros de self.pasta."""
+        try:
+            pesquisa = PesquisaPasta(
+                self.pasta, termo, maiusculas=self.maiusculas_var.get(),
+                palavra_inteira=self.palavra_inteira_var.get(),
+                regex=self.regex_var.get())
+        except re.error as erro:
+            self.listbox_resultados.insert(
+                tk.END, f"Expressão regular inválida: {erro}")
+            return
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._processos,
+                mp_context=multiprocessing.get_context("spawn"))
+        self._pesquisa_pasta = pesquisa
+        self._resultados_na_pasta = True
+        self._inicio_pesquisa = time.perf_counter()
+        pesquisa.iniciar(self._executor, self._processos)
+        self.label_estado.config(text=f"A pesquisar em {self.pasta}...")
+        self._id_fatia = self.frame.after(self.INTERVALO_PASTA_MS, self._receber_da_pasta)
+
+    def _receber_da_pasta(self):
+        """Mostra os resultados que chegaram dos processos desde a última vez."""
+        self._id_fatia = None
+        pesquisa = self._pesquisa_pasta
+        linhas_listbox = []
+        terminada = False
+        limite = time.perf_counter() + self.ORCAMENTO_FATIA
+        while time.perf_counter() < limite:
+            try:
+                encontrados = pesquisa.resultados.get_nowait()
+            except queue.Empty:
+                break
+            if encontrados is None:
+                terminada = True
+                break
+            for caminho, ocorrencias in encontrados:
+                relativo = os.path.relpath(caminho, pesquisa.pasta)
+                for num_linha, inicio, fim, trecho in ocorrencias:
+                    linhas_listbox.append(f"{relativo}:{num_linha}: {trecho}")
+                    self.resultados_pesquisa.append({
+                        'caminho': caminho, 'linha': num_linha, 'coluna': inicio,
+                        'posicao': f"{num_linha}.{inicio}",
+                        'fim_posicao': f"{num_linha}.{fim}"
+                    })
+        for i in range(0, len(linhas_listbox), self.TAMANHO_LOTE):
+            self.listbox_resultados.insert(
+                tk.END, *linhas_listbox[i:i + self.TAMANHO_LOTE])
+
+        excedida = len(self.resultados_pesquisa) >= self.MAX_RESULTADOS_PASTA
+        if excedida:
+            pesquisa.cancelar()
+        if terminada or excedida:
+            self._pesquisa_pasta = None
+            medidor.registar("pesquisa na pasta (total)",
+                             time.perf_counter() - self._inicio_pesquisa)
+        if not self.resultados_pesquisa and terminada:
+            self.listbox_resultados.insert(tk.END, "Nenhum resultado encontrado")
+        estado = (f"{len(self.resultados_pesquisa)} resultados em "
+                  f"{pesquisa.ficheiros_lidos} ficheiros lidos")
+        if excedida:
+            estado += " (limite atingido, pesquisa parada)"
+        elif not terminada:
+            estado += "..."
+        if pesquisa.erros:
+            estado += f"; {pesquisa.erros} lotes com erro"
+        self.label_estado.config(text=estado)
+        if self._pesquisa_pasta is not None:
+            self._id_fatia = self.frame.after(
+                self.INTERVALO_PASTA_MS, self._receber_da_pasta)
+
+    def fechar(self):
+        """Cancela a pesquisa em curso e fecha os processos da pesquisa na pasta."""
+        self._cancelar_pesquisa()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _realcar(self, indices):
+        """Aplica o realce a uma lista plana [inicio1, fim1, inicio2, fim2, ...]
+        de índices do documento (os que não estão no widget são ignorados)."""
+        if self.area_texto.modo_grande:
+            locais = list(map(self.area_texto.para_local, indices))
+            indices = [indice for par in zip(locais[::2], locais[1::2])
+                       if None not in par for indice in par]
+        passo = 2 * self.TAMANHO_LOTE
+        for i in range(0, len(indices), passo):
+            self.area_texto.texto.tag_add(
+                "search_highlight", *indices[i:i + passo])
+
+    def _realcar_janela(self):
+        """Realça os resultados que ficaram na janela nova de um ficheiro grande."""
+        janela = self.area_texto.janela
+        if janela is None or not self.resultados_pesquisa or self._resultados_na_pasta:
+            return
+        # Os resultados estão por ordem de linha
+        inicio = bisect_left(self.resultados_pesquisa, janela.inicio + 1,
+                             key=lambda resultado: resultado['linha'])
+        fim = bisect_right(self.resultados_pesquisa, janela.inicio + janela.linhas,
+                           key=lambda resultado: resultado['linha'])
+        self._realcar([indice for resultado in self.resultados_pesquisa[inicio:fim]
+                       for indice in (resultado['posicao'], resultado['fim_posicao'])])
+
+    def limpar_pesquisa(self):
+        """Limpa os resultados da pesquisa e remove os highlights."""
+        self._cancelar_pesquisa()
+        # Limpar campos de pesquisa e resultados
+        self.entry_pesquisa.delete(0, tk.END)
+        # Apagar o termo agendou uma pesquisa que já não é precisa
+        self.agendador.cancelar("pesquisa")
+        self.listbox_resultados.delete(0, tk.END)
+        self.resultados_pesquisa.clear()
+        self._resultados_na_pasta = False
+        # Remove os realces
+        self.area_texto.texto.tag_remove("search_highlight", "1.0", tk.END)
+        self._alternar_na_pasta()
+
+    def ir_para_resultado(self, event=None):
+        """Vai para o resultado selecionado na listbox."""
+        selecao = self.listbox_resultados.curselection()
+        # Se nada estiver selecionado, sai da função
+        if not selecao or selecao[0] >= len(self.resultados_pesquisa):
+            return
+        #
+        resultado = self.resultados_pesquisa[selecao[0]]
+        if 'caminho' in resultado:
+            # Resultado de outro ficheiro: é aberto (se preciso) e depois mostrado
+            if self.gestor_ficheiros is not None:
+                self.gestor_ficheiros.abrir_e_mostrar(
+                    resultado['caminho'], lambda: self._selecionar(resultado))
+            return
+        self._selecionar(resultado)
+
+    def _selecionar(self, resultado):
+        """Mostra e seleciona um resultado do documento aberto."""
+        # Move o scroll para tornar o resultado visível
+        # (num ficheiro grande, carregando a parte do documento onde está)
+        posicao = self.area_texto.mostrar_posicao(resultado['posicao'])
+        fim_posicao = self.area_texto.para_local(resultado['fim_posicao'])
+        if posicao is None or fim_posicao is None:
+            return
+        # Move o cursor para o resultado
+        self.area_texto.texto.mark_set(tk.INSERT, posicao)
+
+        # Remove seleções
+        self.area_texto.texto.tag_remove(tk.SEL, "1.0", tk.END)
+        # Adiciona seleções, com base nos resultados
+        self.area_texto.texto.tag_add(tk.SEL, posicao, fim_posicao)
+
+        # Focar no texto
+        self.area_texto.texto.focus_set()
+
+    def _opcoes(self):
+        return {"maiusculas": self.maiusculas_var.get(),
+                "palavra_inteira": self.palavra_inteira_var.get(),
+                "regex": self.regex_var.get()}
+
+    def _calcular_substituicoes(self):
+        """Ocorrências do termo no documento com o texto novo de cada uma
+        (ver IndicePesquisa.substituicoes), ou None se não for possível."""
+        termo = self.entry_pesquisa.get().strip()
+        if not termo:
+            return None
+        if self.area_texto.modo_grande:
+            tk.messagebox.showinfo(
+                "Substituir",
+                "A substituição não está disponível no modo de ficheiro grande.")
+            return None
+        try:
+            return self.indice.substituicoes(
+                termo, self.substituto_var.get(), **self._opcoes())
+        except re.error as erro:
+            tk.messagebox.showerror("Substituir", f"Expressão regular inválida: {erro}")
+            return None
+
+    def substituir(self, event=None):
+        """Substitui a ocorrência selecionada e seleciona a seguinte.
+
+        Sem uma ocorrência selecionada, só seleciona a primeira a partir do cursor.
+        """
+        ocorrencias = self._calcular_substituicoes()
+        if not ocorrencias:
+            if ocorrencias is not None:
+                self.label_estado.config(text="Nenhuma ocorrência para substituir")
+            return
+        texto = self.area_texto.texto
+        selecao = texto.tag_ranges(tk.SEL)
+        if selecao:
+            linha, inicio = map(int, str(selecao[0]).split('.'))
+            i = bisect_left(ocorrencias, (linha, inicio),
+                            key=lambda ocorrencia: ocorrencia[:2])
+            if (i < len(ocorrencias) and ocorrencias[i][:2] == (linha, inicio)
+                    and texto.compare(selecao[1], "==", f"{linha}.{ocorrencias[i][2]}")):
+                novo = ocorrencias[i][3]
+                self.area_texto.substituir_ocorrencias(ocorrencias[i:i + 1])
+                # A seguinte é procurada depois do texto novo
+                texto.mark_set(tk.INSERT, f"{linha}.{inicio}+{len(novo)}c")
+                ocorrencias = self.indice.procurar(
+                    self.entry_pesquisa.get().strip(), **self._opcoes())
+                if not ocorrencias:
+                    texto.tag_remove(tk.SEL, "1.0", tk.END)
+                    self.label_estado.config(text="Não há mais ocorrências")
+                    return
+        linha, coluna = map(int, texto.index(tk.INSERT).split('.'))
+        i = bisect_left(ocorrencias, (linha, coluna), key=lambda ocorrencia: ocorrencia[:2])
+        # Depois da última, recomeça no início do documento
+        linha, inicio, fim = ocorrencias[i % len(ocorrencias)][:3]
+        self._selecionar({'posicao': f"{linha}.{inicio}", 'fim_posicao': f"{linha}.{fim}"})
+
+    def substituir_tudo(self, event=None):
+        """Substitui todas as ocorrências (ou só as da seleção) num só passo de undo."""
+        ocorrencias = self._calcular_substituicoes()
+        if ocorrencias is None:
+            return
+        texto = self.area_texto.texto
+        na_selecao = self.na_selecao_var.get()
+        if na_selecao:
+            selecao = texto.tag_ranges(tk.SEL)
+            if not selecao:
+                self.label_estado.config(text="Não há texto selecionado")
+                return
+            (linha0, coluna0), (linha1, coluna1) = (
+                map(int, str(indice).split('.')) for indice in selecao)
+            # Só as ocorrências que estão inteiras dentro da seleção
+            inicio = bisect_left(ocorrencias, (linha0, coluna0),
+                                 key=lambda ocorrencia: ocorrencia[:2])
+            fim = bisect_right(ocorrencias, (linha1, coluna1),
+                               key=lambda ocorrencia: (ocorrencia[0], ocorrencia[2]))
+            ocorrencias = ocorrencias[inicio:fim]
+            # A seleção passa a abranger o texto novo
+            texto.mark_set("selecao_inicio", selecao[0])
+            texto.mark_gravity("selecao_inicio", tk.LEFT)
+            texto.mark_set("selecao_fim", selecao[1])
+            texto.mark_gravity("selecao_fim", tk.RIGHT)
+        if ocorrencias:
+            self.area_texto.substituir_ocorrencias(ocorrencias)
+            self.label_estado.config(text=f"{len(ocorrencias)} ocorrências substituídas")
+        else:
+            self.label_estado.config(text="Nenhuma ocorrência para substituir")
+        if na_selecao:
+            texto.tag_remove(tk.SEL, "1.0", tk.END)
+            texto.tag_add(tk.SEL, "selecao_inicio", "selecao_fim")
+            texto.mark_unset("selecao_inicio", "selecao_fim")
+
+    def focar_pesquisa(self, event=None):
+        """Foca no campo de pesquisa quando Ctrl+F é pressionado."""
+        self.entry_pesquisa.focus_set()
+        self.entry_pesquisa.select_range(0, tk.END)
+
+
+class PainelEstrutura:
+    """Painel com a estrutura do código (classes, funções e atribuições).
+
+    A árvore só é refeita quando a lista de símbolos muda (IndiceSimbolos.versao);
+    as linhas são pedidas ao índice no momento de saltar. Também faz o
+    "ir para a definição" (F12) do nome que está no cursor.
+    """
+
+    # Espera (ms) após a última edição antes de atualizar a árvore
+    ATRASO_ATUALIZACAO_MS = 300
+    PREFIXOS = {"class": "class ", "def": "def ", "var": ""}
+
+    def __init__(self, parent, area_texto):
+        self.parent = parent
+        self.area_texto = area_texto
+        self.indice = self.area_texto.indice_simbolos
+        # Versão do índice mostrada na árvore
+        self._versao = None
+        self._configurar_painel()
+        self.area_texto.agendador.registar(
+            "estrutura", self.atualizar, prioridade=6,
+            atraso_ms=self.ATRASO_ATUALIZACAO_MS, apos_edicao=True)
+        self.atualizar()
+
+    def _configurar_painel(self):
+        self.frame = tk.Frame(self.parent, relief=tk.RAISED, bd=2)
+        tk.Label(self.frame, text="Estrutura").pack(anchor="w", padx=5, pady=(3, 0))
+        scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=(0, 5))
+        self.arvore = ttk.Treeview(self.frame, show="tree", selectmode="browse",
+                                   yscrollcommand=scrollbar.set)
+        self.arvore.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0), pady=(0, 5))
+        scrollbar.config(command=self.arvore.yview)
+        # Duplo clique (ou Enter) vai para o símbolo
+        self.arvore.bind("<Double-Button-1>", self.ir_para_simbolo)
+        self.arvore.bind("<Return>", self.ir_para_simbolo)
+
+    def atualizar(self):
+        """Atualiza o índice (só os blocos editados) e, se a estrutura mudou, a árvore."""
+        if self.area_texto.modo_grande:
+            # Os ficheiros grandes não são analisados
+            if self._versao is not None:
+                self.arvore.delete(*self.arvore.get_children())
+                self._versao = None
+            return
+        self.indice.atualizar()
+        if self.indice.versao == self._versao:
+            return
+        self._versao = self.indice.versao
+        self.arvore.delete(*self.arvore.get_children())
+        # Último item de cada nível, pai dos do nível seguinte
+        pais = {}
+        for i, (_, _, tipo, nome, nivel) in enumerate(self.indice.simbolos()):
+            pai = pais.get(nivel - 1, "") if nivel else ""
+            pais[nivel] = self.arvore.insert(
+                pai, tk.END, iid=str(i), text=self.PREFIXOS[tipo] + nome, open=True)
+
+    def ir_para_simbolo(self, event=None):
+        """Vai para o símbolo selecionado na árvore."""
+        selecao = self.arvore.selection()
+        if not selecao or self.area_texto.modo_grande:
+            return
+        self.indice.atualizar()
+        simbolos = self.indice.simbolos()
+        i = int(selecao[0])
+        if i < len(simbolos):
+            linha, coluna = simbolos[i][:2]
+            self._mostrar(f"{linha}.{coluna}")
+
+    def ir_para_definicao(self, event=None):
+        """Vai para a definição do nome que está no cursor (F12).
+
+        Com o cursor já numa das definições, vai para a seguinte.
+        """
+        texto = self.area_texto.texto
+        nome = texto.get("insert wordstart", "insert wordend")
+        if not nome.isidentifier():
+            # Cursor logo a seguir ao nome
+            nome = texto.get("insert -1c wordstart", "insert -1c wordend")
+        if self.area_texto.modo_grande or not nome.isidentifier():
+            texto.bell()
+            return "break"
+        self.indice.atualizar()
+        posicoes = self.indice.definicoes(nome)
+        if not posicoes:
+            texto.bell()
+            return "break"
+        linhas = [posicao.split('.')[0] for posicao in posicoes]
+        linha_atual = texto.index(tk.INSERT).split('.')[0]
+        if linha_atual in linhas:
+            destino = posicoes[(linhas.index(linha_atual) + 1) % len(posicoes)]
+        else:
+            destino = posicoes[0]
+        self._mostrar(destino)
+        return "break"
+
+    def _mostrar(self, posicao):
+        texto = self.area_texto.texto
+        # Move o cursor e o scroll para a definição, como nos resultados da pesquisa
+        texto.mark_set(tk.INSERT, posicao)
+        texto.see(posicao)
+        texto.tag_remove(tk.SEL, "1.0", tk.END)
+        texto.tag_add(tk.SEL, posicao, f"{posicao} lineend")
+        texto.focus_set()
+
+
+class CompletarPalavras:
+    """Lista de palavras para completar o identificador que está a ser escrito.
+
+    Abre sozinha depois de MIN_PREFIXO caracteres de um identificador (ou com
+    Ctrl+Espaço); Cima/Baixo escolhem, Enter ou Tab completam e Escape fecha.
+    As palavras vêm do IndicePalavras da área de texto. Num documento com
+    mais de LINHAS_LEITURA_IMEDIATA linhas o índice é lido aos bocados, sem
+    bloquear a escrita; até estar pronto só há palavras-chave e builtins.
+    """
+
+    MIN_PREFIXO = 2
+    MAX_SUGESTOES = 12
+    LINHAS_LEITURA_IMEDIATA = 20000
+    # Tempo máximo (s) de cada fatia da leitura do índice
+    ORCAMENTO_FATIA = 0.015
+    # Identificador que acaba no cursor
+    PREFIXO = re.compile(r"[^\W\d]\w*$")
+    # Teclas que tiram o cursor da palavra
+    TECLAS_MOVIMENTO = ("Left", "Right", "Home", "End", "Prior", "Next")
+
+    def __init__(self, area_texto):
+        self.area_texto = area_texto
+        self.texto = area_texto.texto
+        self.indice = area_texto.indice_palavras
+        # Janela com a lista, criada na primeira vez que é mostrada
+        self.janela = None
+        self.lista = None
+        self._aberta = False
+        self._sugestoes = []
+        # Início do prefixo que está a ser completado
+        self._inicio = None
+        self._id_atualizar = None
+        self._leitura = None
+        self._id_leitura = None
+        self.texto.bind("<KeyPress>", self._ao_premir_tecla, add="+")
+        self.texto.bind("<Control-space>", self.abrir)
+        self.texto.bind("<Button-1>", lambda e: self.fechar(), add="+")
+        self.texto.bind("<FocusOut>", self._ao_perder_foco, add="+")
+
+    def _ao_premir_tecla(self, event):
+        if self._aberta:
+            if event.keysym in ("Up", "Down"):
+                self._mover(-1 if event.keysym == "Up" else 1)
+                return "break"
+            if event.keysym in ("Return", "KP_Enter"):
+                self.aceitar()
+                return "break"
+            if event.keysym == "Escape":
+                self.fechar()
+                return "break"
+        if (event.char and ("a" + event.char).isidentifier()) or (
+                event.keysym == "BackSpace" and self._aberta):
+            # A tecla só chega ao texto depois desta função
+            if self._id_atualizar is None:
+                self._id_atualizar = self.texto.after_idle(self._atualizar)
+        elif event.char or event.keysym in self.TECLAS_MOVIMENTO:
+            self.fechar()
+
+    def abrir(self, event=None):
+        """Ctrl+Espaço: mostra as sugestões já a partir de um caractere."""
+        self._atualizar(minimo=1)
+        return "break"
+
+    @medidor.medir("completar")
+    def _atualizar(self, minimo=None):
+        self._id_atualizar = None
+        if minimo is None:
+            minimo = 1 if self._aberta else self.MIN_PREFIXO
+        antes = self.texto.get("insert linestart", tk.INSERT)[-100:]
+        encontrado = self.PREFIXO.search(antes)
+        prefixo = encontrado.group() if encontrado else ""
+        if len(prefixo) < minimo:
+            self.fechar()
+            return
+        sugestoes = self.indice.completar(
+            prefixo, self.MAX_SUGESTOES, documento=self._documento_pronto())
+        caixa = self.texto.bbox(f"insert-{len(prefixo)}c")
+        if not sugestoes or caixa is None:
+            self.fechar()
+            return
+        self._inicio = self.texto.index(f"insert-{len(prefixo)}c")
+        self._mostrar(sugestoes, caixa)
+
+    def _documento_pronto(self):
+        """Se as palavras do documento podem ser usadas já (senão, começa a lê-las)."""
+        if self.area_texto.modo_grande:
+            return False  # Os ficheiros grandes não são lidos
+        if self.indice.pronto:
+            return True
+        linhas = int(self.texto.index("end-1c").split('.')[0])
+        if linhas <= self.LINHAS_LEITURA_IMEDIATA:
+            return True
+        if self._id_leitura is None:
+            self._leitura = self.indice.carregar_por_partes()
+            self._id_leitura = self.texto.after(1, self._continuar_leitura)
+        return False
+
+    def _continuar_leitura(self):
+        self._id_leitura = None
+        limite = time.perf_counter() + self.ORCAMENTO_FATIA
+        try:
+            while time.perf_counter() < limite:
+                next(self._leitura)
+        except StopIteration:
+            self._leitura = None
+            return
+        self._id_leitura = self.texto.after(1, self._continuar_leitura)
+
+    def _mostrar(self, sugestoes, caixa):
+        if self.janela is None:
+            self.janela = tk.Toplevel(self.texto)
+            self.janela.wm_overrideredirect(True)
+            self.lista = tk.Listbox(
+                self.janela, font=self.area_texto.fonte, exportselection=False,
+                activestyle="none", takefocus=0)
+            self.lista.pack(fill=tk.BOTH, expand=True)
+            self.lista.bind("<ButtonRelease-1>", lambda e: self.aceitar())
+        self._sugestoes = sugestoes
+        self.lista.delete(0, tk.END)
+        self.lista.insert(tk.END, *sugestoes)
+        self.lista.config(height=len(sugestoes),
+                          width=max(map(len, sugestoes)) + 2)
+        self.lista.selection_set(0)
+        x, y, _, altura = caixa
+        self.janela.geometry(
+            f"+{self.texto.winfo_rootx() + x}+{self.texto.winfo_rooty() + y + altura}")
+        self.janela.deiconify()
+        self.janela.lift()
+        self._aberta = True
+
+    def _mover(self, passo):
+        selecao = self.lista.curselection()
+        i = ((selecao[0] if selecao else -passo) + passo) % len(self._sugestoes)
+        self.lista.selection_clear(0, tk.END)
+        self.lista.selection_set(i)
+        self.lista.see(i)
+
+    def aceitar(self):
+        """Completa com a palavra escolhida; devolve False se a lista não estava aberta."""
+        if not self._aberta:
+            return False
+        selecao = self.lista.curselection()
+        palavra = self._sugestoes[selecao[0] if selecao else 0]
+        self.fechar()
+        # Só o que falta é inserido (o prefixo pode ter mudado entretanto)
+        escrito = self.texto.get(self._inicio, tk.INSERT)
+        if palavra.startswith(escrito):
+            self.texto.insert(tk.INSERT, palavra[len(escrito):])
+        self.texto.focus_set()
+        return True
+
+    def _ao_perder_foco(self, event=None):
+        # Um clique na lista tira o foco ao texto, mas não a deve fechar
+        self.texto.after(1, self._verificar_foco)
+
+    def _verificar_foco(self):
+        try:
+            foco = self.texto.focus_get()
+        except KeyError:  # Foco numa janela interna do Tk (ex.: lista de um Combobox)
+            foco = None
+        if foco is not self.lista and foco is not self.texto:
+            self.fechar()
+
+    def fechar(self):
+        if self._id_atualizar is not None:
+            self.texto.after_cancel(self._id_atualizar)
+            self._id_atualizar = None
+        if self._aberta:
+            self.janela.withdraw()
+            self._aberta = False
+
+
+class PainelDesempenho:
+    """Janela (Ctrl+Shift+D) com as latências recolhidas pelo medidor.
+
+    A tabela é refeita uma vez por segundo enquanto a janela está aberta;
+    cada linha tem um pequeno histograma com os baldes do medidor.
+    """
+
+    INTERVALO_MS = 1000
+    BARRAS = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, master, agendador):
+        self.master = master
+        self.agendador = agendador
+        self.janela = None
+        self._id_atualizacao = None
+
+    def alternar(self, event=None):
+        """Abre ou fecha a janela."""
+        if self.janela is None:
+            self._criar_janela()
+        else:
+            self.fechar()
+
+    def _criar_janela(self):
+        self.janela = tk.Toplevel(self.master)
+        self.janela.title("Desempenho - PyCharmoso")
+        self.janela.protocol("WM_DELETE_WINDOW", self.fechar)
+        self.janela.bind("<Control-D>", self.alternar)
+
+        barra = tk.Frame(self.janela)
+        barra.pack(fill="x", padx=5, pady=5)
+        self.medir_var = tk.BooleanVar(value=medidor.ativo)
+        tk.Checkbutton(barra, text="Medir", variable=self.medir_var,
+                       command=self._alternar_medicao).pack(side="left")
+        tk.Button(barra, text="Limpar", command=self._limpar).pack(side="left", padx=2)
+        tk.Button(barra, text="Exportar JSON...",
+                  command=self._exportar).pack(side="left", padx=2)
+        self.botao_perfil = tk.Button(barra, command=self._alternar_perfil)
+        self.botao_perfil.pack(side="left", padx=2)
+
+        self.tabela = tk.Text(self.janela, width=110, height=24, wrap="none",
+                              font=("Courier", 10))
+        self.tabela.pack(fill="both", expand=True, padx=5, pady=(0, 5))
+        self._atualizar()
+
+    def fechar(self):
+        if self._id_atualizacao is not None:
+            self.janela.after_cancel(self._id_atualizacao)
+            self._id_atualizacao = None
+        self.janela.destroy()
+        self.janela = None
+
+    def _alternar_medicao(self):
+        medidor.ativo = self.medir_var.get()
+        self._atualizar()
+
+    def _limpar(self):
+        medidor.limpar()
+        self._atualizar()
+
+    def _exportar(self):
+        from tkinter.filedialog import asksaveasfilename
+        caminho = asksaveasfilename(
+            parent=self.janela, defaultextension=".json",
+            filetypes=[("JSON", "*.json")], initialfile="desempenho.json")
+        if not caminho:
+            return
+        try:
+            medidor.exportar(caminho, {"agendador": self.agendador.estatisticas})
+        except OSError as erro:
+            tk.messagebox.showerror(
+                "Erro ao Exportar", f"Não foi possível gravar o ficheiro:\n{erro}",
+                parent=self.janela)
+
+    def _alternar_perfil(self):
+        if not medidor.a_perfilar:
+            medidor.iniciar_perfil()
+            self._atualizar()
+            return
+        from tkinter.filedialog import asksaveasfilename
+        caminho = asksaveasfilename(
+            parent=self.janela, defaultextension=".prof",
+            filetypes=[("Perfil do cProfile", "*.prof")], initialfile="perfil.prof")
+        try:
+            relatorio = medidor.parar_perfil(caminho or None)
+        except OSError as erro:
+            tk.messagebox.showerror(
+                "Erro ao Exportar", f"Não foi possível gravar o perfil:\n{erro}",
+                parent=self.janela)
+            return
+        finally:
+            self._atualizar()
+        janela = tk.Toplevel(self.janela)
+        janela.title("cProfile - funções mais caras")
+        texto = tk.Text(janela, width=120, height=35, wrap="none", font=("Courier", 9))
+        texto.pack(fill="both", expand=True)
+        texto.insert("1.0", relatorio)
+        texto.config(state="disabled")
+
+    def _atualizar(self):
+        self._id_atualizacao = None
+        self.botao_perfil.config(
+            text="Parar cProfile..." if medidor.a_perfilar else "Iniciar cProfile")
+        linhas = [f"{'operação':<34}{'n':>7}{'média':>9}{'p50':>8}{'p95':>8}"
+                  f"{'máx.':>9}  histograma (ms: "
+                  f"{medidor.LIMITES_MS[0]} ... >{medidor.LIMITES_MS[-1]})"]
+        for nome, e in medidor.resumo().items():
+            baldes = list(e["baldes_ms"].values())
+            maior = max(baldes)
+            histograma = "".join(
+                self.BARRAS[-(-contagem * (len(self.BARRAS) - 1) // maior)]
+                for contagem in baldes)
+            linhas.append(
+                f"{nome[:33]:<34}{e['n']:>7}{e['media_ms']:>9.2f}{e['p50_ms']:>8}"
+                f"{e['p95_ms']:>8}{e['maximo_ms']:>9.1f}  {histograma}")
+        if not medidor.ativo:
+            linhas.append("\n(medição desligada)")
+        self.tabela.config(state="normal")
+        self.tabela.delete("1.0", tk.END)
+        self.tabela.insert("1.0", "\n".join(linhas))
+        self.tabela.config(state="disabled")
+        self._id_atualizacao = self.janela.after(self.INTERVALO_MS, self._atualizar)
+
+
+class CarregadorFicheiro:
+    """Insere o conteúdo de um ficheiro na área de texto aos bocados.
+
+    Cada fatia é inserida num callback do after(), por isso a janela continua
+    a responder (e a parte já carregada pode ser percorrida) enquanto o resto
+    do ficheiro é lido. O texto fica só de leitura até o carregamento acabar.
+    """
+
+    # Tamanho (bytes) de cada bloco lido do disco
+    TAMANHO_BLOCO = 256 * 1024
+    # Tempo máximo (s) gasto a inserir texto em cada fatia
+    ORCAMENTO_FATIA = 0.03
+
+    def __init__(self, area_texto, pedacos, tamanho_total, ao_terminar, destino=None):
+        self.area_texto = area_texto
+        # Iterador de tuplos (posicao_lida, texto)
+        self.pedacos = pedacos
+        # Função que recebe cada pedaço, em vez de o inserir no widget
+        # (ex.: o documento do modo de ficheiro grande)
+        self.destino = destino
+        self.tamanho_total = max(tamanho_total, 1)
+        # Chamado com None no fim, com a exceção em caso de erro
+        # ou com False se o carregamento for cancelado
+        self.ao_terminar = ao_terminar
+        self.mensagem = "A carregar..."
+        self._id_fatia = None
+
+    @classmethod
+    def ler_texto_simples(cls, caminho):
+        """Abre um ficheiro de texto e devolve um iterador dos seus pedaços."""
+        return rtxt.ler_texto(caminho, cls.TAMANHO_BLOCO)
+
+    @classmethod
+    def partir_texto(cls, conteudo):
+        """Iterador dos pedaços de um texto que já está em memória."""
+        return rtxt.partir_texto(conteudo, cls.TAMANHO_BLOCO)
+
+    def iniciar(self):
+        texto = self.area_texto.texto
+        texto.delete("1.0", tk.END)
+        texto.config(state="disabled")
+        self._proxima_fatia()
+
+    @medidor.medir("abrir (fatia)")
+    def _proxima_fatia(self):
+        self._id_fatia = None
+        texto = self.area_texto.texto
+        lidos = 0
+        limite = time.perf_counter() + self.ORCAMENTO_FATIA
+        try:
+            while time.perf_counter() < limite:
+                lidos, pedaco = next(self.pedacos)
+                if self.destino is not None:
+                    self.destino(pedaco)
+                    continue
+                texto.config(state="normal")
+                texto.insert(tk.END, pedaco)
+                texto.config(state="disabled")
+                # O carregamento não faz parte do histórico de undo
+                self.area_texto.undo.reset_undo()
+        except StopIteration:
+            self._terminar(None)
+            return
+        except (OSError, ValueError) as erro:
+            # ValueError inclui os erros de descodificação (UnicodeDecodeError)
+            self._terminar(erro)
+            return
+
+        fracao = lidos / self.tamanho_total
+        self.area_texto.mostrar_progresso(
+            f"{self.mensagem} {fracao:.0%}", fracao, self.cancelar)
+        self._id_fatia = texto.after(1, self._proxima_fatia)
+
+    def cancelar(self):
+        """Interrompe o carregamento."""
+        if self._id_fatia is not None:
+            self.area_texto.texto.after_cancel(self._id_fatia)
+            self._id_fatia = None
+        self.pedacos.close()
+        self._terminar(False)
+
+    def _terminar(self, resultado):
+        self.area_texto.texto.config(state="normal")
+        self.area_texto.esconder_progresso()
+        self.ao_terminar(resultado)
+
+
+class DiarioEdicoes:
+    """Diário (só de acrescento) das edições ainda não gravadas.
+
+    Cada documento aberto escreve no seu ficheiro, uma linha JSON por registo:
+        {"t": "b", "caminho", "id"}     base: o ficheiro em disco (tamanho, mtime)
+        {"t": "s", "caminho", "x", "tags"}  base: cópia completa (compactação)
+        {"t": "i", "p", "x"}            inserção de x na posição p
+        {"t": "d", "p", "f"}            remoção de [p, f)
+        {"t": "c", "p", "f", "c"}       cor aplicada a [p, f)
+        {"t": "g", "n"} / {"t": "ok", "n", "caminho", "id"}
+                                        início / fim com sucesso da gravação n
+    As edições ficam em memória e são escritas em lotes; se o processo
+    morrer, o diário é reaplicado no arranque seguinte sobre a última base
+    válida. Quando o ficheiro cresce demasiado é compactado num thread à parte.
+    """
+
+    PASTA = os.path.join(os.path.expanduser("~"), ".pycharmoso", "diario")
+    # Intervalo (ms) entre escritas dos registos pendentes
+    INTERVALO_ESCRITA_MS = 1000
+    # Número de registos pendentes que obriga a escrever logo
+    MAX_PENDENTES = 1000
+    # Tamanho (bytes) a partir do qual o diário é compactado
+    LIMITE_COMPACTACAO = 8 * 1024 * 1024
+    # Diários criados por este processo
+    _instancias = 0
+
+    def __init__(self, texto, coletar_tags, pasta=None):
+        self.texto = texto
+        # Função que devolve {tag: [inicio, fim, ...]} das cores do utilizador
+        self.coletar_tags = coletar_tags
+        self.pasta = pasta or self.PASTA
+        # Um diário por documento aberto (ver GestorSeparadores)
+        DiarioEdicoes._instancias += 1
+        sufixo = "" if DiarioEdicoes._instancias == 1 else f"-{DiarioEdicoes._instancias}"
+        self.caminho = os.path.join(self.pasta, f"diario-{os.getpid()}{sufixo}.jrnl")
+        self.caminho_documento = None
+        self.ativo = False
+        self._ficheiro = None
+        self._pendentes = []
+        self._id_escrita = None
+        self._gravacoes = 0
+        # Registos feitos depois da última marca de gravação
+        self._desde_marca = 0
+        self._limite = self.LIMITE_COMPACTACAO
+        # Compactação em curso: (thread, ficheiro temporário, resultado)
+        self._compactacao = None
+        self._desde_copia = []
+        self._ativo_antes_pausa = False
+
+    @staticmethod
+    def identidade(caminho):
+        """Identifica o conteúdo de um ficheiro em disco (tamanho e mtime)."""
+        if caminho is None:
+            return None
+        try:
+            estado = os.stat(caminho)
+        except OSError:
+            return None
+        return [estado.st_size, estado.st_mtime_ns]
+
+    def iniciar(self, caminho_documento):
+        """Começa um diário novo, tendo como base o ficheiro tal como está em disco."""
+        self.caminho_documento = caminho_documento
+        self._recomecar({"t": "b", "caminho": caminho_documento,
+                         "id": self.identidade(caminho_documento)})
+
+    def _recomecar(self, primeiro_registo):
+        self._cancelar_compactacao()
+        self._pendentes = []
+        self._desde_marca = 0
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            if self._ficheiro is not None:
+                self._ficheiro.close()
+            self._ficheiro = open(self.caminho, "wb")
+            self._escrever([primeiro_registo])
+            self._limite = max(self.LIMITE_COMPACTACAO, 2 * self._ficheiro.tell())
+            self.ativo = True
+        except OSError:
+            # Sem diário não há recuperação, mas o editor continua a funcionar
+            self.ativo = False
+
+    def suspender(self):
+        """Deixa de registar edições (ex.: enquanto um ficheiro é carregado)."""
+        self.ativo = False
+
+    def pausar(self):
+        """O documento deixa o widget: escreve o pendente e ignora as edições até retomar()."""
+        self.escrever_pendentes()
+        self._ativo_antes_pausa = self.ativo
+        self.ativo = False
+
+    def retomar(self):
+        self.ativo = self._ativo_antes_pausa
+
+    def ao_editar(self, inicio, fim, texto):
+        """Ouvinte do ObservadorEdicoes."""
+        if not self.ativo:
+            return
+        if texto:
+            ultimo = self._pendentes[-1] if self._pendentes else None
+            # Escrita seguida: junta ao registo anterior em vez de criar outro
+            if (ultimo is not None and ultimo["t"] == "i"
+                    and ultimo.get("_fim") == inicio):
+                ultimo["x"] += texto
+                ultimo["_fim"] = self._avancar(inicio, texto)
+                return
+            self._registar({"t": "i", "p": inicio, "x": texto,
+                            "_fim": self._avancar(inicio, texto)})
+        else:
+            self._registar({"t": "d", "p": inicio, "f": fim})
+
+    @staticmethod
+    def _avancar(indice, texto):
+        """Índice do fim de `texto` inserido em `indice`."""
+        linha, coluna = map(int, indice.split('.'))
+        quebras = texto.count('\n')
+        if quebras:
+            coluna = len(texto) - texto.rfind('\n') - 1
+            return f"{linha + quebras}.{coluna}"
+        return f"{linha}.{coluna + len(texto)}"
+
+    def registar_cor(self, inicio, fim, cor):
+        if self.ativo:
+            self._registar({"t": "c", "p": str(inicio), "f": str(fim), "c": cor})
+
+    def marcar_gravacao(self):
+        """Regista o momento da cópia feita para gravar; devolve o número da marca."""
+        self._gravacoes += 1
+        self._desde_marca = 0
+        if self.ativo:
+            self._registar({"t": "g", "n": self._gravacoes}, contar=False)
+        return self._gravacoes
+
+    def gravacao_concluida(self, marca, caminho_documento):
+        """A gravação da marca indicada chegou ao disco."""
+        if marca != self._gravacoes:
+            return  # Entretanto já foi feita outra cópia para gravar
+        if not self._desde_marca:
+            # Nada mudou desde a cópia gravada: o ficheiro é a nova base
+            self.iniciar(caminho_documento)
+            return
+        self.caminho_documento = caminho_documento
+        self._registar({"t": "ok", "n": marca, "caminho": caminho_documento,
+                        "id": self.identidade(caminho_documento)}, contar=False)
+
+    def _registar(self, registo, contar=True):
+        if not self.ativo:
+            return
+        if contar:
+            self._desde_marca += 1
+        self._pendentes.append(registo)
+        if len(self._pendentes) >= self.MAX_PENDENTES:
+            self.escrever_pendentes()
+        elif self._id_escrita is None:
+            self._id_escrita = self.texto.after(
+                self.INTERVALO_ESCRITA_MS, self.escrever_pendentes)
+
+    def escrever_pendentes(self):
+        """Escreve de uma vez no disco os registos acumulados."""
+        if self._id_escrita is not None:
+            self.texto.after_cancel(self._id_escrita)
+            self._id_escrita = None
+        if not self._pendentes or not self.ativo:
+            return
+        registos, self._pendentes = self._pendentes, []
+        if self._compactacao is not None:
+            # Também vão para o diário compactado, quando este ficar pronto
+            self._desde_copia += registos
+        try:
+            self._escrever(registos)
+        except OSError:
+            self.ativo = False
+            return
+        if self._ficheiro.tell() > self._limite and self._compactacao is None:
+            self._compactar()
+
+    def _escrever(self, registos):
+        self._ficheiro.write(self._codificar(registos))
+        self._ficheiro.flush()
+
+    @staticmethod
+    def _codificar(registos):
+        # As chaves começadas por "_" são só para uso interno
+        return "".join(
+            json.dumps({k: v for k, v in registo.items() if not k.startswith("_")},
+                       ensure_ascii=False, separators=(",", ":")) + "\n"
+            for registo in registos).encode("utf-8")
+
+    def _compactar(self):
+        """Substitui o diário por uma cópia do documento, escrita num thread."""
+        copia = {"t": "s", "caminho": self.caminho_documento,
+                 "x": self.texto.get("1.0", "end-1c"), "tags": self.coletar_tags()}
+        resultado = queue.Queue()
+
+        def escrever_copia():
+            import tempfile
+            try:
+                descritor, temporario = tempfile.mkstemp(
+                    suffix=".jrnl", dir=self.pasta)
+                with os.fdopen(descritor, "wb") as fich:
+                    fich.write(self._codificar([copia]))
+                    fich.flush()
+                    os.fsync(fich.fileno())
+                resultado.put(temporario)
+            except OSError:
+                resultado.put(None)
+
+        thread = threading.Thread(target=escrever_copia, daemon=True)
+        self._compactacao = (thread, resultado)
+        self._desde_copia = []
+        thread.start()
+        self.texto.after(100, self._verificar_compactacao)
+
+    def _verificar_compactacao(self):
+        if self._compactacao is None:
+            return
+        thread, resultado = self._compactacao
+        try:
+            temporario = resultado.get_nowait()
+        except queue.Empty:
+            self.texto.after(100, self._verificar_compactacao)
+            return
+        self._compactacao = None
+        if temporario is None:
+            self._limite *= 2  # Tenta outra vez mais tarde
+            return
+        try:
+            with open(temporario, "ab") as fich:
+                fich.write(self._codificar(self._desde_copia))
+            os.replace(temporario, self.caminho)
+            self._ficheiro.close()
+            self._ficheiro = open(self.caminho, "ab")
+            self._limite = max(self.LIMITE_COMPACTACAO, 2 * self._ficheiro.tell())
+        except OSError:
+            self._limite *= 2
+        self._desde_copia = []
+
+    def _cancelar_compactacao(self):
+        if self._compactacao is not None:
+            thread, resultado = self._compactacao
+            thread.join()
+            temporario = resultado.get()
+            if temporario is not None:
+                try:
+                    os.unlink(temporario)
+                except OSError:
+                    pass
+            self._compactacao = None
+            self._desde_copia = []
+
+    def fechar(self):
+        """Saída normal: o diário deixa de ser necessário."""
+        self.ativo = False
+        self._cancelar_compactacao()
+        if self._id_escrita is not None:
+            self.texto.after_cancel(self._id_escrita)
+            self._id_escrita = None
+        if self._ficheiro is not None:
+            self._ficheiro.close()
+            self._ficheiro = None
+        try:
+            os.unlink(self.caminho)
+        except OSError:
+            pass
 
-        btn_limpar = tk.Button(self.frame, text="Limpar",
-                               command=self.limpar_pesquisa)
-        btn_limpar.grid(row=0, column=3, padx=(2, 5), pady=3)
+    @classmethod
+    def procurar_orfaos(cls, pasta=None):
+        """Diários deixados por processos que já terminaram (mais recente primeiro)."""
+        pasta = pasta or cls.PASTA
+        try:
+            nomes = os.listdir(pasta)
+        except OSError:
+            return []
+        orfaos = []
+        for nome in nomes:
+            correspondencia = re.fullmatch(r"diario-(\d+)(?:-\d+)?\.jrnl", nome)
+            if not correspondencia:
+                continue
+            pid = int(correspondencia.group(1))
+            if pid == os.getpid():
+                continue  # O diário deste processo
+            try:
+                os.kill(pid, 0)
+                continue  # Processo ainda a correr
+            except ProcessLookupError:
+                pass
+            except OSError:
+                continue  # Existe, mas pertence a outro utilizador
+            orfaos.append(os.path.join(pasta, nome))
+        return sorted(orfaos, key=os.path.getmtime, reverse=True)
 
-        # Listbox com resultados
-        frame_listbox = tk.Frame(self.frame)
-        frame_listbox.grid(row=1, column=0, columnspan=4,
-                           padx=5, pady=(3, 5), sticky="ew")
+    @classmethod
+    def ler_plano(cls, caminho_diario):
+        """Lê um diário e devolve (base, caminho_documento, edições).
 
-        self.listbox_resultados = tk.Listbox(frame_listbox, height=5, width=80)
-        self.listbox_resultados.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        `base` é o registo a partir do qual as edições se aplicam (um "b"/"ok"
+        cujo ficheiro não mudou, ou uma cópia "s"), ou None se não houver
+        nenhuma base válida.
+        """
+        registos = []
+        with open(caminho_diario, encoding="utf-8") as fich:
+            for linha in fich:
+                try:
+                    registos.append(json.loads(linha))
+                except ValueError:
+                    break  # Última linha escrita só em parte
+        base, inicio, caminho = None, 0, None
+        marcas = {}
+        for i, registo in enumerate(registos):
+            tipo = registo.get("t")
+            if "caminho" in registo:
+                caminho = registo["caminho"]
+            if tipo == "g":
+                marcas[registo["n"]] = i
+            elif tipo == "s":
+                base, inicio = registo, i + 1
+            elif tipo == "b":
+                if cls.identidade(registo["caminho"]) == registo["id"]:
+                    base, inicio = registo, i + 1
+            elif tipo == "ok":
+                # Sem a marca (removida por uma compactação), a cópia "s"
+                # que está antes é uma base mais recente do que esta gravação
+                if (registo["n"] in marcas
+                        and cls.identidade(registo["caminho"]) == registo["id"]):
+                    base, inicio = registo, marcas[registo["n"]] + 1
+        edicoes = [r for r in registos[inicio:] if r.get("t") in ("i", "d", "c")]
+        return base, caminho, edicoes
 
-        # Scrollbar para a listbox
-        scrollbar_listbox = tk.Scrollbar(
-            frame_listbox, orient=tk.VERTICAL, command=self.listbox_resultados.yview)
-        scrollbar_listbox.pack(side=tk.RIGHT, fill=tk.Y)
-        self.listbox_resultados.config(yscrollcommand=scrollbar_listbox.set)
+    def iniciar_com_copia(self, caminho_documento):
+        """Começa um diário novo cuja base é uma cópia do texto atual."""
+        self.caminho_documento = caminho_documento
+        self._recomecar({"t": "s", "caminho": caminho_documento,
+                         "x": self.texto.get("1.0", "end-1c"),
+                         "tags": self.coletar_tags()})
 
-        # Bind para duplo clique na listbox
-        self.listbox_resultados.bind(
-            # Duplo clique no botão esquerdo do rato
-            "<Double-Button-1>", self.ir_para_resultado)
 
-        # Configurar expansão do frame de pesquisa
-        self.frame.columnconfigure(1, weight=0)
+class VigilanteFicheiro:
+    """Avisa quando o ficheiro do documento pode ter mudado no disco.
 
-    def pesquisar_texto(self, event=None):
-        """Pesquisa o texto no editor e mostra os resultados na listbox."""
-        # Obtem o termo de pesquisa da caixa de texto
-        termo_pesquisa = self.entry_pesquisa.get().strip()
-        # Se nenhuma palavra foi digitada, sai da função
-        if not termo_pesquisa:
-            return
-        # Se alguma palavra foi digitada, prosseegue:
-        # Limpar resultados anteriores
-        self.listbox_resultados.delete(0, tk.END)
-        self.resultados_pesquisa.clear()
+    Em Linux usa o inotify sobre a pasta do ficheiro (para apanhar também
+    as substituições por mudança de nome, como as do git ou dos
+    formatadores), com o descritor vigiado pelo próprio ciclo do Tk: sem
+    mudanças não corre nada. Noutros sistemas faz um stat a cada
+    INTERVALO_MS. `ao_mudar()` é chamado uma vez por cada rajada de eventos.
+    """
 
-        # Remove realces anteriores
-        self.area_texto.texto.tag_remove("search_highlight", "1.0", tk.END)
+    INTERVALO_MS = 2000
+    # Espera (ms) para juntar os eventos de uma mesma escrita
+    ESPERA_MS = 100
+    # IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENTOS_INOTIFY = 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
 
-        # Obtem todo o conteúdo do texto
-        conteudo = self.area_texto.texto.get("1.0", tk.END)
-        # Divide o conteúdo por linhas, o que vai permitir mostrar os números de linha no resultado
-        linhas = conteudo.split('\n')
-
-        # Pesquisar em cada linha
-        for num_linha, linha in enumerate(linhas, 1):
-            # Se o termo da pesquisa for encontrado na linha
-            if termo_pesquisa.lower() in linha.lower():
-                # Define as "coordenadas" desse termo no texto
-                pos = linha.lower().find(termo_pesquisa.lower())
-                linha_pos = f"{num_linha}.{pos}"
-                fim_pos = f"{num_linha}.{pos + len(termo_pesquisa)}"
-
-                # Adicionar realce ao texto pesquisado
-                # Adiciona um tag específica (search_highlight)
-                self.area_texto.texto.tag_add(
-                    "search_highlight", linha_pos, fim_pos)
-
-                # Preparar texto para mostrar na listbox (limitado a 60 caracteres)
-                contexto = linha.strip()
-                if len(contexto) > 60:
-                    contexto = contexto[:60] + "..."
-
-                # String com o resultado
-                resultado_texto = f"Linha {num_linha}: {contexto}"
-                # Adiciona resultado à listbox
-                self.listbox_resultados.insert(tk.END, resultado_texto)
-
-                # Armazena informações de cada resultado num dicionário
-                # 'posicao' obtida da linha E coluna (inicio da palavra pesquisada)
-                # 'fim_posicao' permite definir o fim do realce
-                self.resultados_pesquisa.append({
-                    'linha': num_linha, 'coluna': pos,
-                    'posicao': linha_pos, 'fim_posicao': fim_pos
-                })
+    def __init__(self, widget, ao_mudar):
+        self.widget = widget
+        self.ao_mudar = ao_mudar
+        self.caminho = None
+        self._identidade = None
+        self._id_espera = None
+        self._id_sondagem = None
+        self._vigia = None
+        # (libc, descritor), criado só quando houver um ficheiro a vigiar
+        self._inotify = None
+        self._inotify_tentado = False
 
-        # Configurar cor do highlight
-        self.area_texto.texto.tag_config(
-            "search_highlight", background="yellow", foreground="black")
+    def _iniciar_inotify(self):
+        """(libc, descritor) do inotify, ou None onde não existir."""
+        if not sys.platform.startswith("linux"):
+            return None
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                               use_errno=True)
+            descritor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if descritor < 0:
+            return None
+        try:
+            self.widget.tk.createfilehandler(
+                descritor, tk.READABLE, self._ler_eventos)
+        except (AttributeError, tk.TclError):
+            # Sem suporte para descritores no ciclo do Tk: fica a sondagem
+            os.close(descritor)
+            return None
+        return libc, descritor
 
-        # Mostra os resultados
-        if len(self.resultados_pesquisa) == 0:
-            # Se o dicionãrio está vazio, mostra uma mensagem indicativa
-            self.listbox_resultados.insert(
-                tk.END, "Nenhum resultado encontrado")
-        # Se o dicionário tiver dados:
-        elif self.resultados_pesquisa:
-            # Obtem o primeiro resultado
-            primeiro_resultado = self.resultados_pesquisa[0]
-            # e faz o scroll para a posição desse resultado
-            self.area_texto.texto.see(primeiro_resultado['posicao'])
+    def vigiar(self, caminho):
+        """Passa a vigiar `caminho` (None: deixa de vigiar)."""
+        caminho = os.path.abspath(caminho) if caminho else None
+        if caminho == self.caminho:
+            return
+        self._parar()
+        self.caminho = caminho
+        if caminho is None:
+            return
+        if not self._inotify_tentado:
+            self._inotify_tentado = True
+            self._inotify = self._iniciar_inotify()
+        if self._inotify is not None:
+            libc, descritor = self._inotify
+            pasta = os.path.dirname(caminho)
+            vigia = libc.inotify_add_watch(
+                descritor, os.fsencode(pasta), self.EVENTOS_INOTIFY)
+            if vigia >= 0:
+                self._vigia = vigia
+                return
+        self._identidade = DiarioEdicoes.identidade(caminho)
+        self._id_sondagem = self.widget.after(self.INTERVALO_MS, self._sondar)
 
-    def limpar_pesquisa(self):
-        """Limpa os resultados da pesquisa e remove os highlights."""
-        # Limpar campos de pesquisa e resultados
-        self.entry_pesquisa.delete(0, tk.END)
-        self.listbox_resultados.delete(0, tk.END)
-        self.resultados_pesquisa.clear()
-        # Remove os realces
-        self.area_texto.texto.tag_remove("search_highlight", "1.0", tk.END)
+    def _parar(self):
+        if self._vigia is not None:
+            libc, descritor = self._inotify
+            libc.inotify_rm_watch(descritor, self._vigia)
+            self._vigia = None
+        for id_after in (self._id_sondagem, self._id_espera):
+            if id_after is not None:
+                self.widget.after_cancel(id_after)
+        self._id_sondagem = self._id_espera = None
 
-    def ir_para_resultado(self, event=None):
-        """Vai para o resultado selecionado na listbox."""
-        selecao = self.listbox_resultados.curselection()
-        # Se nada estiver selecionado, sai da função
-        if not selecao or selecao[0] >= len(self.resultados_pesquisa):
+    def _ler_eventos(self, descritor, mascara):
+        try:
+            dados = os.read(descritor, 64 * 1024)
+        except BlockingIOError:
             return
-        #
-        resultado = self.resultados_pesquisa[selecao[0]]
+        nome = os.fsencode(os.path.basename(self.caminho)) if self.caminho else None
+        posicao = 0
+        relevante = False
+        # struct inotify_event: wd, mask, cookie, len, seguido do nome
+        while posicao + 16 <= len(dados):
+            vigia, _, _, tamanho = struct.unpack_from("iIII", dados, posicao)
+            nome_evento = dados[posicao + 16:posicao + 16 + tamanho].rstrip(b"\0")
+            posicao += 16 + tamanho
+            if vigia == self._vigia and nome_evento == nome:
+                relevante = True
+        if relevante and self._id_espera is None:
+            self._id_espera = self.widget.after(self.ESPERA_MS, self._avisar)
 
-        # Move o scroll para tornar o resultado visível
-        self.area_texto.texto.see(resultado['posicao'])
-        # Move o cursor para o resultado
-        self.area_texto.texto.mark_set(tk.INSERT, resultado['posicao'])
+    def _sondar(self):
+        self._id_sondagem = self.widget.after(self.INTERVALO_MS, self._sondar)
+        identidade = DiarioEdicoes.identidade(self.caminho)
+        if identidade != self._identidade:
+            self._identidade = identidade
+            self.ao_mudar()
 
-        # Remove seleções
-        self.area_texto.texto.tag_remove(tk.SEL, "1.0", tk.END)
-        # Adiciona seleções, com base nos resultados
-        self.area_texto.texto.tag_add(
-            tk.SEL, resultado['posicao'], resultado['fim_posicao'])
+    def _avisar(self):
+        self._id_espera = None
+        self.ao_mudar()
 
-        # Focar no texto
-        self.area_texto.texto.focus_set()
+    @staticmethod
+    def resumo(caminho):
+        """Hash do conteúdo do ficheiro (None se não puder ser lido)."""
+        import hashlib
+        try:
+            with open(caminho, "rb") as fich:
+                resumo = hashlib.blake2b()
+                for bloco in iter(lambda: fich.read(1024 * 1024), b""):
+                    resumo.update(bloco)
+                return resumo.hexdigest()
+        except OSError:
+            return None
 
-    def focar_pesquisa(self, event=None):
-        """Foca no campo de pesquisa quando Ctrl+F é pressionado."""
-        self.entry_pesquisa.focus_set()
-        self.entry_pesquisa.select_range(0, tk.END)
+    def fechar(self):
+        self._parar()
+        if self._inotify is not None:
+            libc, descritor = self._inotify
+            self.widget.tk.deletefilehandler(descritor)
+            os.close(descritor)
+            self._inotify = None
 
 
 class GestorFicheiros:
@@ -464,18 +4807,122 @@ class GestorFicheiros:
         self.caminho_ficheiro = None
         # inicia a variável como "texto sem modificações"
         self.modificado = False
+        # Carregamento de ficheiro em curso (CarregadorFicheiro), se houver
+        self.carregador = None
+        # Gravação em segundo plano: thread em curso, resultados devolvidos
+        # por ela (lidos no thread do Tk) e pedido de nova gravação pendente
+        self._thread_gravacao = None
+        self._resultados_gravacao = queue.Queue()
+        self._gravar_de_novo = False
+        # Chamado quando o ficheiro que está a ser aberto acabar de carregar
+        self._ao_abrir = None
+        # Início (perf_counter) da última abertura e da última gravação
+        self._inicio_abertura = 0.0
+        self._inicio_gravacao = 0.0
+        # Contador de edições, para saber se o texto mudou durante a gravação
+        self._edicoes = 0
+        self._edicoes_gravadas = 0
+        # Marca no diário e caminho da última cópia mandada gravar
+        self._marca_gravacao = 0
+        self._caminho_gravado = None
+        self.area_texto.observador.adicionar_ouvinte(self._ao_editar)
+        # Diário das edições não gravadas, para recuperar após um crash
+        self.diario = self._criar_diario()
+        self.area_texto.observador.adicionar_ouvinte_texto(self._registar_no_diario)
+        # As cores não passam pelo Percolator, por isso são registadas à parte
+        self.area_texto.adicionar_ouvinte_cor(self._registar_cor_no_diario)
+        # Documentos em separadores (GestorSeparadores), se houver
+        self.separadores = None
+        # [identidade, resumo] do ficheiro tal como foi lido ou gravado, e o
+        # vigilante que avisa quando ele muda no disco
+        self._disco = None
+        self._a_perguntar = False
+        self.vigilante = VigilanteFicheiro(self.area_texto.texto, self.verificar_disco)
+
+    # Estado que pertence a cada documento; trocado com o dos outros
+    # separadores por exportar_estado() / importar_estado()
+    CAMPOS_DOCUMENTO = ("caminho_ficheiro", "modificado", "diario", "_edicoes",
+                        "_edicoes_gravadas", "_marca_gravacao", "_caminho_gravado",
+                        "_disco")
+
+    def _criar_diario(self):
+        diario = DiarioEdicoes(self.area_texto.texto, self._coletar_tags_formatacao)
+        diario.iniciar(None)
+        return diario
+
+    def _registar_no_diario(self, inicio, fim, texto):
+        # O diário é o do documento que está no widget
+        self.diario.ao_editar(inicio, fim, texto)
+
+    def _registar_cor_no_diario(self, inicio, fim, cor):
+        self.diario.registar_cor(inicio, fim, cor)
+
+    def exportar_estado(self):
+        """Estado do documento atual, que vai deixar o widget.
+
+        Não pode haver um carregamento em curso; uma gravação em curso é
+        esperada, porque o seu fim atualiza o estado do documento.
+        """
+        while self.a_gravar:
+            self.esperar_gravacao()
+        self.diario.pausar()
+        return {campo: getattr(self, campo) for campo in self.CAMPOS_DOCUMENTO}
+
+    def importar_estado(self, estado=None):
+        """Passa ao estado de outro documento (None: um documento novo, vazio)."""
+        if estado is None:
+            estado = {"caminho_ficheiro": None, "modificado": False,
+                      "diario": self._criar_diario(), "_edicoes": 0,
+                      "_edicoes_gravadas": 0, "_marca_gravacao": 0,
+                      "_caminho_gravado": None, "_disco": None}
+        else:
+            estado["diario"].retomar()
+        for campo, valor in estado.items():
+            setattr(self, campo, valor)
+        self.callback_titulo()
+        self.vigilante.vigiar(self.caminho_ficheiro if self._disco else None)
+        # O ficheiro pode ter mudado enquanto o separador estava inativo
+        self.area_texto.texto.after_idle(self.verificar_disco)
+
+    @property
+    def a_gravar(self):
+        return self._thread_gravacao is not None
+
+    def _ao_editar(self, linha, removidas, inseridas):
+        self._edicoes += 1
+
+    @property
+    def a_carregar(self):
+        return self.carregador is not None
+
+    def cancelar_carregamento(self):
+        if self.carregador is not None:
+            self.carregador.cancelar()
 
     def novo_ficheiro(self, event=None):
         """ Cria um novo documento de texto. """
+        if self.separadores is not None:
+            # Num separador novo
+            self.separadores.novo()
+            return
         # Se existem mofificações não gravadas
         if not self._verificar_modificacoes():
             # sai da função
             return
-        # Se não existem modificações não gravadas prossegue:
+        self.cancelar_carregamento()
+        self._limpar_documento()
+
+    def _limpar_documento(self):
+        """Deixa o editor com um documento vazio e sem título."""
         # Apaga o texto todo
+        self.diario.suspender()
+        self.area_texto.sair_modo_grande()
         self.area_texto.texto.delete(1.0, tk.END)
+        self.area_texto.undo.reset_undo()
+        self.diario.iniciar(None)
         # Desassocia o caminho do ficheiro: Documento "Sem título"
         self.caminho_ficheiro = None
+        self._conhecer_disco(None)
         # Não existem modificações não gravadas
         self.modificado = False
         # Altera a flag (de modificações) interna
@@ -487,10 +4934,11 @@ class GestorFicheiros:
 
     def abrir_ficheiro(self, event=None):
         """ Abre um um documento de texto """
-        # Mesmo que na função acima
-        if not self._verificar_modificacoes():
+        # Mesmo que na função acima (com separadores, o atual fica aberto)
+        if self.separadores is None and not self._verificar_modificacoes():
             return
         # Abre uma caixa de diálogo para escolher o ficheiro a abrir
+        from tkinter.filedialog import askopenfilename
         caminho = askopenfilename(
             # Tipos de ficheiro possíveis de selecionar
             filetypes=[
@@ -502,97 +4950,402 @@ class GestorFicheiros:
         # SE None ou falso saí da função
         if not caminho:
             return
-        # Lê o conteúdo do ficheiro
+        if self.separadores is not None:
+            self.separadores.abrir(caminho)
+        else:
+            self.abrir_caminho(caminho)
+
+    def abrir_e_mostrar(self, caminho, ao_abrir):
+        """Abre `caminho`, se ainda não for o documento atual, e chama ao_abrir()
+        com o conteúdo já carregado (ex.: para ir para um resultado)."""
+        if self.separadores is not None:
+            return self.separadores.abrir(caminho, ao_abrir)
+        if self.mesmo_ficheiro(caminho):
+            ao_abrir()
+            return True
+        if not self._verificar_modificacoes():
+            return False
+        return self.abrir_caminho(caminho, ao_abrir)
+
+    def mesmo_ficheiro(self, caminho):
+        """O documento atual é o ficheiro `caminho`, já carregado."""
+        return bool(self.caminho_ficheiro and not self.a_carregar
+                    and os.path.realpath(self.caminho_ficheiro) == os.path.realpath(caminho))
+
+    @medidor.medir("abrir (início)")
+    def abrir_caminho(self, caminho, ao_abrir=None):
+        """Abre o ficheiro indicado, carregando-o aos bocados sem bloquear a janela.
+
+        ao_abrir() é chamado quando o conteúdo estiver todo carregado.
+        """
+        self.cancelar_carregamento()
+        self._ao_abrir = None
+        # Prepara a leitura do conteúdo do ficheiro
         try:
-            with open(caminho, "r", encoding='utf-8') as ficheiro:
-                if caminho.endswith('.rtxt'):
-                    # Tenta carregar como JSON (formato formatado)
-                    dados = json.load(ficheiro)
-                    conteudo = dados.get('content', '')
-                    tags = dados.get('tags', [])
-                else:
-                    # Carrega como texto simples
-                    conteudo = ficheiro.read()
-                    tags = []
-        except (IOError, json.JSONDecodeError) as erro:
+            if caminho.endswith('.rtxt'):
+                # Formato formatado (v2, ou v1 em JSON); as formatações
+                # só ficam disponíveis depois de lido o conteúdo
+                leitor = rtxt.FormatoRtxt.abrir(caminho)
+                pedacos = leitor.pedacos()
+                tamanho = leitor.tamanho
+                obter_tags = leitor.indices_spans
+            else:
+                # Carrega como texto simples, lido diretamente do disco
+                pedacos = CarregadorFicheiro.ler_texto_simples(caminho)
+                tamanho = os.path.getsize(caminho)
+                obter_tags = dict
+        except (IOError, ValueError) as erro:
             tk.messagebox.showerror(
                 "Erro ao Abrir", f"Não foi possível abrir o ficheiro:\n{erro}")
-            return
+            return False
 
-        # Limpa a área de texto e insere o novo conteúdo
-        self.area_texto.texto.delete(1.0, tk.END)
-        self.area_texto.texto.insert(tk.END, conteudo)
+        # O conteúdo carregado não é uma edição: o diário recomeça no fim
+        self.diario.suspender()
+        destino = None
+        if tamanho > AreaTexto.LIMITE_MODO_GRANDE:
+            # O widget só recebe a parte do documento que está à vista
+            destino = self.area_texto.entrar_modo_grande().acrescentar
+        else:
+            self.area_texto.sair_modo_grande()
+        self.carregador = CarregadorFicheiro(
+            self.area_texto, pedacos, tamanho,
+            lambda resultado: self._ao_terminar_carregamento(caminho, obter_tags, resultado),
+            destino)
+        self.carregador.mensagem = f"A carregar {os.path.basename(caminho)}..."
+        self._ao_abrir = ao_abrir
+        self._inicio_abertura = time.perf_counter()
+        self.carregador.iniciar()
+        return True
+
+    def _ao_terminar_carregamento(self, caminho, obter_tags, resultado):
+        """Termina a abertura; obter_tags() devolve {tag: [inicio, fim, ...]}."""
+        self.carregador = None
+        if resultado is not None:
+            self._ao_abrir = None
+            # Cancelado ou com erro: não fica um ficheiro carregado pela metade,
+            # que poderia ser gravado por cima do original
+            if resultado is not False:
+                tk.messagebox.showerror(
+                    "Erro ao Abrir", f"Não foi possível abrir o ficheiro:\n{resultado}")
+            self._limpar_documento()
+            return
 
-        # Aplicar as tags de formatação guardadas
-        for tag in tags:
-            if 'name' in tag and 'start' in tag and 'end' in tag:
-                self.area_texto.texto.tag_add(
-                    tag['name'], tag['start'], tag['end'])
+        janela = self.area_texto.janela
+        if janela is not None:
+            # As formatações ficam no documento; a janela recebe as suas
+            janela.terminar_carregamento(obter_tags())
+        else:
+            # Aplicar as tags de formatação guardadas, uma chamada por cor
+            self.area_texto.formatacao.carregar(obter_tags())
+            self.area_texto.formatacao.empurrar()
+            self.area_texto.usar_realce_em_cache()
 
         # Atualiza o estado do editor
+        self.area_texto.texto.mark_set(tk.INSERT, "1.0")
+        if janela is None:
+            # Num ficheiro grande, o diário copiaria o documento inteiro a
+            # cada compactação, e os seus índices seriam os da janela
+            self.diario.iniciar(caminho)
         self.caminho_ficheiro = caminho
+        self._conhecer_disco(caminho)
         self.modificado = False
         self.area_texto.texto.edit_modified(False)
         self.callback_titulo()
         self.area_texto.atualizar_numeros_linha()
+        medidor.registar("abrir (total)", time.perf_counter() - self._inicio_abertura)
+        ao_abrir, self._ao_abrir = self._ao_abrir, None
+        if ao_abrir is not None:
+            ao_abrir()
 
     def _coletar_tags_formatacao(self):
-        """Coleta apenas as tags de formatação aplicadas pelo usuário (cores)."""
-        # Lista de dicionários. Cada dicionário corresponde a uma tag (com a respetiva informação, abaixo)
-        tags = []
-        # As tags de cor são prefixadas com "color_"
-        tag_names = [t for t in self.area_texto.texto.tag_names()
-                     if t.startswith("color_")]
-
-        for tag_name in tag_names:
-            ranges = self.area_texto.texto.tag_ranges(tag_name)
-            for i in range(0, len(ranges), 2):
-                # Acrescenta cada dicionário com a informação de cada tag
-                tags.append({
-                    # Nome da tag, ex: color_{cor}
-                    "name": tag_name,
-                    # Início e fim da formatação
-                    "start": str(ranges[i]),
-                    "end": str(ranges[i+1])
-                })
-        return tags
-
-    def gravar_ficheiro(self, event=None):
+        """Coleta apenas as tags de formatação aplicadas pelo usuário (cores).
+
+        Devolve {tag: [inicio1, fim1, ...]} em índices "linha.coluna", já
+        sem intervalos partidos ou sobrepostos (vêm do ModeloFormatacao).
+        """
+        return self.area_texto.formatacao.indices_por_tag()
+
+    @medidor.medir("gravar (cópia)")
+    def gravar_ficheiro(self, event=None, esperar=False):
+        """Grava o documento num thread à parte.
+
+        No thread do Tk só é tirada uma cópia do texto e das formatações;
+        a codificação e a escrita (ficheiro temporário + fsync + rename
+        atómico) são feitas no thread de gravação. Com esperar=True a função
+        só volta no fim e devolve se a gravação correu bem.
+        """
         # Se não tiver caminho (ficheiro novo) redireciona para a função gravar_como
         if not self.caminho_ficheiro:
-            return self.gravar_como()
-        # Se tiver caminho, grava normalmente
-        try:  # Se tudo correr bem executa o trecho centro do try
-            # Se for um ficheiro .txt, grava como texto simples para compatibilidade
-            if self.caminho_ficheiro.endswith(".txt"):
-                # "end-1c" exclui o último caracter ('\n') que é adicionado automaticamente pelo Tkinter
-                conteudo = self.area_texto.texto.get(1.0, "end-1c")
-                # Grava sem as tags
-                with open(self.caminho_ficheiro, "w", encoding='utf-8') as fich:
-                    fich.write(conteudo)
-            else:  # Para .rtxt ou outros, guarda com formatação (JSON)
-                # Define o conteudo e as tags para colocar no ficheiro gravado
-                conteudo = self.area_texto.texto.get(1.0, "end-1c")
-                # Usa a função para coletar apenas tags de formatação do utilizador
-                tags = self._coletar_tags_formatacao()
-                # Define o dicionário com os dados para gravar
-                dados_para_salvar = {"content": conteudo, "tags": tags}
-                with open(self.caminho_ficheiro, "w", encoding='utf-8') as fich:
-                    # usa o método dump para guardar o objecto num ficheiro
-                    json.dump(dados_para_salvar, fich, indent=4)
-        # Caso algo corra mal, é levantada uma excepção e mostrada uma mensagem de erro
+            return self.gravar_como(esperar=esperar)
+        # Um ficheiro carregado pela metade não pode ser gravado
+        if self.a_carregar:
+            return False
+        if self.a_gravar:
+            if not esperar:
+                # Grava outra vez quando a gravação em curso acabar
+                self._gravar_de_novo = True
+                return True
+        # O fim de uma gravação pode começar outra (_gravar_de_novo):
+        # espera por todas, para não haver duas a escrever no mesmo ficheiro
+        while self.a_gravar:
+            self.esperar_gravacao()
+
+        # Cópia do estado atual: o utilizador pode continuar a escrever
+        janela = self.area_texto.janela
+        if janela is not None:
+            # Ficheiro grande: os blocos do documento não mudam depois de
+            # criados, por isso basta copiar a lista deles
+            janela.sincronizar()
+            conteudo, tags = janela.documento.fotografia()
+        else:
+            # "end-1c" exclui o último caracter ('\n') que é adicionado automaticamente pelo Tkinter
+            conteudo = self.area_texto.texto.get(1.0, "end-1c")
+            tags = self._coletar_tags_formatacao()
+        # Se for um ficheiro .txt, grava como texto simples (sem as tags) para compatibilidade
+        if self.caminho_ficheiro.endswith(".txt"):
+            tags = {}
+        self._edicoes_gravadas = self._edicoes
+        self._gravar_de_novo = False
+        # Marca no diário o ponto a que corresponde esta cópia
+        self._marca_gravacao = self.diario.marcar_gravacao()
+        self._caminho_gravado = self.caminho_ficheiro
+        self._inicio_gravacao = time.perf_counter()
+
+        self._thread_gravacao = threading.Thread(
+            target=self._gravar_em_segundo_plano,
+            args=(self.caminho_ficheiro, conteudo, tags), daemon=True)
+        self._thread_gravacao.start()
+        self.callback_titulo()
+        if esperar:
+            return self.esperar_gravacao()
+        self.area_texto.texto.after(50, self._verificar_gravacao)
+        return True
+
+    def _gravar_em_segundo_plano(self, caminho, conteudo, tags):
+        """Corre no thread de gravação: não pode tocar nos widgets.
+
+        `conteudo` é o texto, ou a lista de blocos de um DocumentoLinhas
+        (com as tags em (linha, coluna)) no modo de ficheiro grande.
+        """
+        try:
+            if not isinstance(conteudo, str):
+                self._gravar_blocos(caminho, conteudo, tags)
+            elif caminho.endswith(".txt"):
+                dados = conteudo.encode("utf-8")
+                self._escrever_atomicamente(caminho, lambda fich: fich.write(dados))
+            else:  # Para .rtxt ou outros, guarda com formatação (formato v2)
+                spans = rtxt.FormatoRtxt.spans_de_indices(conteudo, tags)
+                self._escrever_atomicamente(
+                    caminho, lambda fich: rtxt.FormatoRtxt.escrever(fich, conteudo, spans))
+            self._resultados_gravacao.put(None)
+        # Caso algo corra mal, a excepção é devolvida ao thread do Tk
         except Exception as erro:
+            self._resultados_gravacao.put(erro)
+
+    def _gravar_blocos(self, caminho, blocos, spans):
+        if caminho.endswith(".txt"):
+            def escrever(fich):
+                for pedaco in DocumentoLinhas.pedacos_texto(blocos):
+                    fich.write(pedaco.encode("utf-8"))
+        else:
+            offsets = DocumentoLinhas.spans_em_offsets(blocos, spans)
+
+            def escrever(fich):
+                rtxt.FormatoRtxt.escrever_pedacos(
+                    fich, DocumentoLinhas.pedacos_texto(blocos), offsets)
+        self._escrever_atomicamente(caminho, escrever)
+
+    def _escrever_atomicamente(self, caminho, escrever):
+        """Escreve num ficheiro temporário e só depois o põe no lugar do original."""
+        rtxt.escrever_atomicamente(caminho, escrever)
+
+    def _verificar_gravacao(self):
+        """Vê (no thread do Tk) se a gravação em segundo plano já terminou."""
+        if self._thread_gravacao is None:
+            return
+        try:
+            erro = self._resultados_gravacao.get_nowait()
+        except queue.Empty:
+            self.area_texto.texto.after(50, self._verificar_gravacao)
+            return
+        self._concluir_gravacao(erro)
+
+    def esperar_gravacao(self):
+        """Bloqueia até a gravação em curso terminar; devolve se correu bem."""
+        if self._thread_gravacao is None:
+            return True
+        self._thread_gravacao.join()
+        return self._concluir_gravacao(self._resultados_gravacao.get())
+
+    def _concluir_gravacao(self, erro):
+        self._thread_gravacao.join()
+        self._thread_gravacao = None
+        medidor.registar("gravar (total)", time.perf_counter() - self._inicio_gravacao)
+        if erro is not None:
             tk.messagebox.showerror(
                 "Erro ao Gravar", f"Não foi possível gravar o ficheiro:\n{erro}")
+            self.callback_titulo()
+            return False
+
+        # As edições anteriores à cópia já estão no disco
+        self._conhecer_disco(self._caminho_gravado)
+        if not self.area_texto.modo_grande:
+            self.diario.gravacao_concluida(self._marca_gravacao, self._caminho_gravado)
+        # reposição de variáveis/estado, se nada mudou desde a cópia gravada
+        if self._edicoes == self._edicoes_gravadas:
+            self.modificado = False
+            self.area_texto.texto.edit_modified(False)
+        self.callback_titulo()
+        if self._gravar_de_novo:
+            self.gravar_ficheiro()
+        return True
+
+    def recuperar_diario(self, caminho_diario, plano):
+        """Reconstrói o documento de um diário deixado por uma sessão que terminou mal.
+
+        `plano` é o resultado de DiarioEdicoes.ler_plano(caminho_diario).
+        """
+        base, caminho, edicoes = plano
+        if base is None:
+            tk.messagebox.showerror(
+                "Erro ao Recuperar",
+                "Não foi possível recuperar as alterações: o ficheiro original mudou.")
+            return False
+        self.cancelar_carregamento()
+        texto = self.area_texto.texto
+        try:
+            if base["t"] == "s":
+                conteudo, tags = base["x"], base["tags"]
+            elif base["caminho"] is None:
+                conteudo, tags = "", {}
+            elif base["caminho"].endswith(".rtxt"):
+                leitor = rtxt.FormatoRtxt.abrir(base["caminho"])
+                conteudo = "".join(pedaco for _, pedaco in leitor.pedacos())
+                tags = leitor.indices_spans()
+            else:
+                conteudo = "".join(pedaco for _, pedaco in
+                                   CarregadorFicheiro.ler_texto_simples(base["caminho"]))
+                tags = {}
+        except (OSError, ValueError) as erro:
+            tk.messagebox.showerror(
+                "Erro ao Recuperar", f"Não foi possível ler o ficheiro original:\n{erro}")
+            return False
+
+        self.diario.suspender()
+        self.area_texto.sair_modo_grande()
+        texto.delete("1.0", tk.END)
+        texto.insert("1.0", conteudo)
+        self.area_texto.formatacao.carregar(tags)
+        self.area_texto.formatacao.empurrar()
+        # Reaplica as edições pela ordem em que foram feitas
+        for registo in edicoes:
+            if registo["t"] == "i":
+                texto.insert(registo["p"], registo["x"])
+            elif registo["t"] == "d":
+                texto.delete(registo["p"], registo["f"])
+            else:
+                self.area_texto.aplicar_cor(registo["p"], registo["f"], registo["c"])
+        self.area_texto.undo.reset_undo()
+        texto.mark_set(tk.INSERT, "1.0")
+
+        # O texto recuperado ainda não está gravado: fica como modificado,
+        # e o diário novo parte de uma cópia dele
+        self.caminho_ficheiro = caminho
+        self._conhecer_disco(caminho)
+        self.diario.iniciar_com_copia(caminho)
+        os.unlink(caminho_diario)
+        self.modificado = True
+        texto.edit_modified(False)
+        self.callback_titulo()
+        self.area_texto.atualizar_numeros_linha()
+        return True
+
+    def _conhecer_disco(self, caminho):
+        """Toma o ficheiro, tal como está agora no disco, como o do documento."""
+        self.vigilante.vigiar(caminho)
+        if caminho is None:
+            self._disco = None
+            return
+        disco = self._disco = [DiarioEdicoes.identidade(caminho), None]
+
+        # O resumo só é preciso quando o ficheiro mudar: fica para um thread
+        def resumir():
+            disco[1] = VigilanteFicheiro.resumo(caminho)
+        threading.Thread(target=resumir, daemon=True).start()
+
+    def verificar_disco(self):
+        """Vê se o ficheiro mudou no disco desde que foi lido ou gravado e
+        oferece recarregá-lo."""
+        caminho = self.caminho_ficheiro
+        if (self._disco is None or caminho is None or self.a_carregar
+                or self.a_gravar or self._a_perguntar):
+            return
+        identidade = DiarioEdicoes.identidade(caminho)
+        conhecida, resumo = self._disco
+        if identidade is None or identidade == conhecida:
+            # Igual, ou apagado (a próxima gravação volta a criá-lo)
+            return
+        novo_resumo = VigilanteFicheiro.resumo(caminho)
+        self._disco = [identidade, novo_resumo]
+        if novo_resumo == resumo:
+            return  # Só mudou a data (ex.: touch)
+        aviso = ("\nAs alterações feitas aqui que não foram gravadas perdem-se."
+                 if self.modificado else "")
+        self._a_perguntar = True
+        try:
+            recarregar = askyesno(
+                title="Ficheiro Alterado",
+                message=f"\"{os.path.basename(caminho)}\" foi alterado por outro "
+                        f"programa. Quer recarregá-lo?{aviso}")
+        finally:
+            self._a_perguntar = False
+        if recarregar:
+            self.recarregar()
+        else:
+            # O texto do editor deixou de ser o que está no disco
+            self.modificado = True
+            self.callback_titulo()
+
+    def recarregar(self):
+        """Relê o ficheiro do disco, mudando no widget só as linhas diferentes.
+
+        O cursor, a vista, as cores e o histórico de undo (a recarga é um só
+        passo) mantêm-se onde o texto não mudou; num .rtxt as cores passam
+        a ser as do ficheiro. Os ficheiros grandes são abertos de novo.
+        """
+        caminho = self.caminho_ficheiro
+        try:
+            if (self.area_texto.modo_grande
+                    or os.path.getsize(caminho) > AreaTexto.LIMITE_MODO_GRANDE):
+                return self.abrir_caminho(caminho)
+            tags = None
+            if caminho.endswith(".rtxt"):
+                leitor = rtxt.FormatoRtxt.abrir(caminho)
+                conteudo = "".join(pedaco for _, pedaco in leitor.pedacos())
+                tags = leitor.indices_spans()
+            else:
+                conteudo = "".join(pedaco for _, pedaco in
+                                   CarregadorFicheiro.ler_texto_simples(caminho))
+        except (OSError, ValueError) as erro:
+            tk.messagebox.showerror(
+                "Erro ao Recarregar", f"Não foi possível ler o ficheiro:\n{erro}")
             return False
 
-        # reposição de variáveis/estado
+        self.area_texto.substituir_texto(conteudo)
+        if tags is not None:
+            self.area_texto.formatacao.carregar(tags)
+            self.area_texto.formatacao.empurrar()
+        # O ficheiro em disco volta a ser a base do diário
+        self.diario.iniciar(caminho)
+        self._conhecer_disco(caminho)
         self.modificado = False
         self.area_texto.texto.edit_modified(False)
         self.callback_titulo()
+        self.area_texto.agendador.ao_editar()
         return True
 
-    def gravar_como(self, event=None):
+    def gravar_como(self, event=None, esperar=False):
+        from tkinter.filedialog import asksaveasfilename
         caminho = asksaveasfilename(
             # Mudar a extensão padrão para o nosso novo formato
             defaultextension=".rtxt",
@@ -608,7 +5361,7 @@ class GestorFicheiros:
 
         self.caminho_ficheiro = caminho
         # A lógica de qual formato usar já está dentro de gravar_ficheiro()
-        return self.gravar_ficheiro()
+        return self.gravar_ficheiro(esperar=esperar)
 
     def _verificar_modificacoes(self):
         # verifica se o texto foi modificado desde a última vez que ele foi salvo
@@ -623,13 +5376,358 @@ class GestorFicheiros:
         if resposta is None:  # Cancelar
             return False
         elif resposta:  # Sim (Guardar)
-            return self.gravar_ficheiro()
+            return self.gravar_ficheiro(esperar=True)
         else:  # Não (Não guardar)
             return True
 
 
+class Separador:
+    """Um documento aberto num separador.
+
+    Enquanto não é o documento que está no widget, o seu estado fica aqui:
+    `estado_gestor` (GestorFicheiros.exportar_estado) e `estado_area`
+    (AreaTexto.exportar_documento).
+    """
+
+    # Custo estimado (bytes) de cada índice das cores guardadas
+    CUSTO_INDICE = 60
+
+    def __init__(self, pagina):
+        # Página (vazia) do ttk.Notebook: só o cabeçalho é mostrado
+        self.pagina = pagina
+        self.estado_gestor = None
+        self.estado_area = None
+        # Documento de uma sessão anterior ainda por abrir:
+        # {"caminho", "insert", "vista"} (ver GestorSeparadores.restaurar)
+        self.pendente = None
+        # Momento do último uso, para comprimir primeiro os mais antigos
+        self.usado_em = 0
+
+    @property
+    def caminho(self):
+        """Caminho do documento, enquanto está inativo."""
+        if self.pendente is not None:
+            return self.pendente["caminho"]
+        return self.estado_gestor["caminho_ficheiro"] if self.estado_gestor else None
+
+    @property
+    def modificado(self):
+        """Se tem alterações por gravar, enquanto está inativo."""
+        return bool(self.estado_gestor and self.estado_gestor["modificado"])
+
+    def memoria(self):
+        """Memória (bytes, estimada) que o documento ocupa enquanto está inativo."""
+        if self.estado_area is None:
+            return 0
+        texto = self.estado_area.get("texto")
+        if isinstance(texto, TextoComprimido):
+            tamanho = len(texto.dados)
+        elif texto is not None:
+            tamanho = sys.getsizeof(texto)
+        else:
+            # Ficheiro grande: o texto está nas linhas da sua janela
+            tamanho = self.estado_area["janela"].documento.memoria()
+        indices = sum(map(len, self.estado_area.get("tags", {}).values()))
+        return (tamanho + self.CUSTO_INDICE * indices
+                + self.estado_area["undo"]["tamanho"])
+
+    def comprimir(self):
+        if self.estado_area is None:
+            return
+        texto = self.estado_area.get("texto")
+        if isinstance(texto, str) and texto:
+            self.estado_area["texto"] = TextoComprimido(texto)
+        elif "janela" in self.estado_area:
+            self.estado_area["janela"].documento.comprimir()
+
+
+class GestorSeparadores:
+    """Vários documentos abertos, cada um no seu separador.
+
+    Há um só widget de texto: o documento ativo está nele e os outros ficam
+    guardados nos seus Separador (texto, cores, undo, diário, caminho...).
+    Quando os separadores inativos passam de ORCAMENTO_INATIVOS bytes, os
+    textos dos usados há mais tempo são comprimidos.
+    """
+
+    ORCAMENTO_INATIVOS = 64 * 1024 * 1024
+
+    def __init__(self, parent, area_texto, gestor_ficheiros):
+        self.area_texto = area_texto
+        self.gestor = gestor_ficheiros
+        self.notebook = ttk.Notebook(parent, takefocus=0)
+        self.separadores = []
+        self._usos = 0
+        # O documento que já está no widget fica no primeiro separador
+        self.atual = self._criar_separador()
+        self.notebook.bind("<<NotebookTabChanged>>", self._ao_escolher)
+        gestor_ficheiros.separadores = self
+
+    def _criar_separador(self):
+        pagina = tk.Frame(self.notebook, height=1)
+        separador = Separador(pagina)
+        self.separadores.append(separador)
+        self.notebook.add(pagina, text="Sem Título")
+        return separador
+
+    def _remover(self, separador):
+        """Tira um separador inativo (o seu diário também deixa de ser preciso)."""
+        if separador.estado_gestor is not None:
+            separador.estado_gestor["diario"].fechar()
+        self.separadores.remove(separador)
+        self.notebook.forget(separador.pagina)
+        separador.pagina.destroy()
+
+    def _ao_escolher(self, event=None):
+        escolhido = str(self.notebook.select())
+        separador = next(
+            (s for s in self.separadores if str(s.pagina) == escolhido), None)
+        if separador is None or separador is self.atual:
+            return
+        if not self.ativar(separador):
+            self.notebook.select(self.atual.pagina)
+
+    def ativar(self, separador):
+        """Põe no widget o documento de `separador`; devolve se mudou."""
+        if separador is self.atual:
+            return True
+        if self.gestor.a_carregar:
+            # O carregamento escreve no widget: só depois de acabar
+            return False
+        atual = self.atual
+        atual.estado_gestor = self.gestor.exportar_estado()
+        atual.estado_area = self.area_texto.exportar_documento()
+        self._mostrar(separador)
+        self._limitar_memoria()
+        return True
+
+    def _mostrar(self, separador):
+        """Importa o documento de `separador` para o widget (que está vazio)."""
+        self.atual = separador
+        self.area_texto.importar_documento(separador.estado_area)
+        # Também atualiza o título e o rótulo do separador
+        self.gestor.importar_estado(separador.estado_gestor)
+        separador.estado_gestor = separador.estado_area = None
+        self._usos += 1
+        separador.usado_em = self._usos
+        if str(self.notebook.select()) != str(separador.pagina):
+            self.notebook.select(separador.pagina)
+        if separador.pendente is not None:
+            # Documento da sessão anterior: só é lido agora
+            pendente, separador.pendente = separador.pendente, None
+            self.gestor.abrir_caminho(
+                pendente["caminho"],
+                lambda: self.area_texto.repor_posicao(pendente["insert"], pendente["vista"]))
+        # Números de linha, pesquisa, sintaxe... passam a ser os deste documento
+        self.area_texto.agendador.ao_editar()
+        self.area_texto.texto.focus_set()
+
+    def _limitar_memoria(self):
+        """Comprime os separadores inativos usados há mais tempo, até caberem no orçamento."""
+        inativos = sorted((s for s in self.separadores if s is not self.atual),
+                          key=lambda s: s.usado_em)
+        total = sum(s.memoria() for s in inativos)
+        for separador in inativos:
+            if total <= self.ORCAMENTO_INATIVOS:
+                break
+            antes = separador.memoria()
+            separador.comprimir()
+            total -= antes - separador.memoria()
+
+    def _procurar(self, caminho):
+        real = os.path.realpath(caminho)
+        for separador in self.separadores:
+            if separador is self.atual:
+                if self.gestor.mesmo_ficheiro(caminho):
+                    return separador
+            elif separador.caminho and os.path.realpath(separador.caminho) == real:
+                return separador
+        return None
+
+    def descartavel(self):
+        """O documento atual é novo, vazio e sem alterações (pode dar lugar a outro)."""
+        gestor = self.gestor
+        return (gestor.caminho_ficheiro is None and not gestor.modificado
+                and not gestor.a_carregar
+                and self.area_texto.texto.compare("end-1c", "==", "1.0"))
+
+    def novo(self, event=None):
+        """Abre um documento vazio num separador novo; devolve o separador."""
+        if self.gestor.a_carregar:
+            return None
+        separador = self._criar_separador()
+        if not self.ativar(separador):
+            return None
+        return separador
+
+    def abrir(self, caminho, ao_abrir=None):
+        """Abre `caminho` num separador (no seu, se já estiver aberto).
+
+        ao_abrir() é chamado com o documento já mostrado e carregado.
+        """
+        existente = self._procurar(caminho)
+        if existente is not None:
+            if not self.ativar(existente):
+                return False
+            if ao_abrir is not None:
+                ao_abrir()
+            return True
+        if not self.descartavel() and self.novo() is None:
+            return False
+        return self.gestor.abrir_caminho(caminho, ao_abrir)
+
+    def fechar_atual(self, event=None):
+        """Fecha o separador atual, perguntando se há alterações por gravar."""
+        gestor = self.gestor
+        if not gestor._verificar_modificacoes():
+            return "break"
+        gestor.cancelar_carregamento()
+        while gestor.a_gravar:
+            gestor.esperar_gravacao()
+        gestor.diario.fechar()
+        fechado = self.atual
+        self.separadores.remove(fechado)
+        if self.separadores:
+            # Volta ao documento usado mais recentemente
+            seguinte = max(self.separadores, key=lambda s: s.usado_em)
+        else:
+            seguinte = self._criar_separador()
+        self.area_texto.sair_modo_grande()
+        self.area_texto.importar_documento()
+        self._mostrar(seguinte)
+        self.notebook.forget(fechado.pagina)
+        fechado.pagina.destroy()
+        return "break"
+
+    def mudar(self, passo):
+        """Vai para o separador `passo` posições à frente (ou atrás)."""
+        if len(self.separadores) > 1:
+            indice = self.separadores.index(self.atual) + passo
+            self.ativar(self.separadores[indice % len(self.separadores)])
+        return "break"
+
+    def atualizar_rotulo(self):
+        """Nome do ficheiro (com * se modificado) no separador atual."""
+        caminho = self.gestor.caminho_ficheiro
+        nome = os.path.basename(caminho) if caminho else "Sem Título"
+        modificado = "*" if self.gestor.modificado else ""
+        self.notebook.tab(self.atual.pagina, text=f"{modificado}{nome}")
+
+    def fechar_todos(self):
+        """Saída do editor: pergunta por cada documento modificado; devolve se pode sair."""
+        self.gestor.cancelar_carregamento()
+        for separador in list(self.separadores):
+            modificado = (self.gestor.modificado if separador is self.atual
+                          else separador.modificado)
+            if modificado:
+                self.ativar(separador)
+                if not self.gestor._verificar_modificacoes():
+                    return False
+        while self.gestor.a_gravar:
+            self.gestor.esperar_gravacao()
+        # Saída normal: os diários de recuperação já não são precisos
+        for separador in self.separadores:
+            if separador is self.atual:
+                self.gestor.diario.fechar()
+            elif separador.estado_gestor is not None:
+                separador.estado_gestor["diario"].fechar()
+        return True
+
+    def estado_sessao(self):
+        """Documentos abertos (com caminho) e o índice do ativo, para a Sessao."""
+        documentos = []
+        ativo = 0
+        for separador in self.separadores:
+            if separador is self.atual:
+                caminho = self.gestor.caminho_ficheiro
+                insert, vista = self.area_texto.posicao()
+                if caminho is not None:
+                    ativo = len(documentos)
+            elif separador.pendente is not None:
+                caminho = separador.pendente["caminho"]
+                insert, vista = separador.pendente["insert"], separador.pendente["vista"]
+            else:
+                caminho = separador.caminho
+                insert = separador.estado_area["insert"]
+                vista = separador.estado_area["vista"]
+            if caminho is not None:
+                documentos.append({"caminho": caminho, "insert": insert, "vista": vista})
+        return documentos, ativo
+
+    def restaurar(self, documentos, ativo):
+        """Reabre os documentos de uma sessão anterior, com o documento vazio
+        do arranque a dar-lhes lugar. Só o ativo é lido já; os outros são
+        lidos quando o seu separador for escolhido."""
+        documentos = [d for d in documentos if os.path.isfile(d["caminho"])]
+        if not documentos or not self.descartavel():
+            return
+        vazio = self.atual
+        novos = []
+        for documento in documentos:
+            separador = self._criar_separador()
+            separador.pendente = documento
+            self.notebook.tab(separador.pagina, text=os.path.basename(documento["caminho"]))
+            novos.append(separador)
+        self.ativar(novos[min(max(ativo, 0), len(novos) - 1)])
+        self._remover(vazio)
+
+
+class Sessao:
+    """Estado do editor guardado à saída e reposto no arranque seguinte.
+
+    Guarda os documentos abertos (com o cursor e a vista de cada um), a
+    fonte, os números de linha, a verificação automática e a última
+    pesquisa, num ficheiro JSON escrito de forma atómica.
+    """
+
+    CAMINHO = os.path.join(os.path.expanduser("~"), ".pycharmoso", "sessao.json")
+    VERSAO = 1
+
+    @classmethod
+    def ler(cls, caminho=None):
+        """Devolve o estado guardado ({} se não houver, ou não for válido)."""
+        try:
+            with open(caminho or cls.CAMINHO, encoding="utf-8") as fich:
+                dados = json.load(fich)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(dados, dict) or dados.get("versao") != cls.VERSAO:
+            return {}
+        return dados
+
+    @classmethod
+    def guardar(cls, dados, caminho=None):
+        caminho = caminho or cls.CAMINHO
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(temporario, "w", encoding="utf-8") as fich:
+                json.dump(dict(dados, versao=cls.VERSAO), fich,
+                          ensure_ascii=False, indent=1)
+            os.replace(temporario, caminho)
+        except OSError:
+            # Sem sessão guardada, o próximo arranque começa vazio
+            try:
+                os.unlink(temporario)
+            except OSError:
+                pass
+
+
 class EditorTexto:
-    """Classe principal que coordena todos os componentes do editor."""
+    """Classe principal que coordena todos os componentes do editor.
+
+    No arranque só é criado o necessário para mostrar e editar o texto; o
+    realce de sintaxe, a verificação de sintaxe e os painéis laterais e de
+    pesquisa são criados por completar_arranque(), depois de a área de
+    texto ser desenhada (ou antes, se algum deles for pedido).
+    """
+
+    # Objetivo (ms) para a primeira pintura da área de texto, contado desde
+    # o início do carregamento do módulo (ver --medir-arranque)
+    ALVO_ARRANQUE_MS = 250
+    # Se a janela não for desenhada até lá (ex.: arranque minimizado), o
+    # resto do arranque é feito na mesma
+    ESPERA_MAXIMA_ARRANQUE_MS = 1000
 
     def __init__(self, master):
         """
@@ -643,6 +5741,13 @@ class EditorTexto:
         self._configurar_layout()
         self._criar_componentes()
         self._configurar_bindings()
+        # O resto da interface fica para depois da primeira pintura
+        self.tempos_arranque = {}
+        self._id_exposicao = self.area_texto.texto.bind("<Expose>", self._ao_desenhar)
+        self._id_espera_arranque = self.master.after(
+            self.ESPERA_MAXIMA_ARRANQUE_MS, self.completar_arranque)
+        # Trabalho não gravado de uma sessão anterior que terminou mal
+        self.master.after_idle(self._oferecer_recuperacao)
 
     def _configurar_layout(self):
         self.master.rowconfigure(0, minsize=300, weight=1)
@@ -652,27 +5757,88 @@ class EditorTexto:
             0, minsize=200, weight=0)  # Coluna dos botões
         self.master.columnconfigure(
             1, minsize=600, weight=1)  # Coluna do texto
+        self.master.columnconfigure(
+            2, minsize=180, weight=0)  # Coluna da estrutura do código
 
     def _criar_componentes(self):
-        """ Cria e configura todos os componentes do editor de texto """
+        """ Cria os componentes precisos para mostrar e editar o texto """
+        # Separadores dos documentos abertos, por cima da área de texto
+        self.frame_documentos = tk.Frame(self.master)
+        self.frame_documentos.grid(row=0, column=1, sticky="nsew")
+
         # Área de texto
-        self.area_texto = AreaTexto(self.master)
-        self.area_texto.frame.grid(row=0, column=1, sticky="nsew")
+        self.area_texto = AreaTexto(self.frame_documentos)
 
         # Gestor de ficheiros
         self.gestor_ficheiros = GestorFicheiros(
             self.area_texto, self._atualizar_titulo)
+        self.separadores = GestorSeparadores(
+            self.frame_documentos, self.area_texto, self.gestor_ficheiros)
+        self.separadores.notebook.pack(side=tk.TOP, fill=tk.X)
+        self.area_texto.frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.area_texto.agendador.registar(
+            "titulo", self._atualizar_titulo, prioridade=1, apos_edicao=True)
+
+        # Janela de desempenho (aberta com Ctrl+Shift+D)
+        self.painel_desempenho = PainelDesempenho(
+            self.master, self.area_texto.agendador)
+
+        # Pesquisa e verificação da sessão anterior, repostas quando os
+        # painéis forem criados
+        self._sessao_paineis = {}
+
+        # Criados por completar_arranque()
+        self.verificador_sintaxe = None
+        self.painel_ferramentas = None
+        self.painel_pesquisa = None
+        self.painel_estrutura = None
+        self.completar_palavras = None
+
+    def _ao_desenhar(self, event=None):
+        """Primeira pintura da área de texto: o resto do arranque vai para o idle."""
+        if "primeira_pintura" not in self.tempos_arranque:
+            self._marcar_arranque("primeira_pintura")
+            self.master.after_idle(self.completar_arranque)
+
+    def _marcar_arranque(self, etapa):
+        duracao = time.perf_counter() - INICIO_ARRANQUE
+        self.tempos_arranque[etapa] = duracao * 1000
+        medidor.registar(f"arranque ({etapa})", duracao)
+
+    def completar_arranque(self):
+        """Cria os componentes adiados no arranque (só da primeira vez)."""
+        if self.painel_pesquisa is not None:
+            return
+        self.master.after_cancel(self._id_espera_arranque)
+        self.area_texto.texto.unbind("<Expose>", self._id_exposicao)
+
+        # Realce de sintaxe primeiro: as tags do utilizador ficam por cima
+        self.area_texto.ativar_realce_sintaxe()
+
+        # Verificação de sintaxe (num processo à parte)
+        self.verificador_sintaxe = VerificadorSintaxe(self.area_texto)
 
         # Painel de ferramentas
         self.painel_ferramentas = PainelFerramentas(
-            self.master, self.area_texto, self.gestor_ficheiros)
+            self.master, self.area_texto, self.gestor_ficheiros,
+            self.verificador_sintaxe)
         self.painel_ferramentas.frame.grid(row=0, column=0, sticky="ns")
 
         # Painel de pesquisa
-        self.painel_pesquisa = PainelPesquisa(self.master, self.area_texto)
+        self.painel_pesquisa = PainelPesquisa(
+            self.master, self.area_texto, self.gestor_ficheiros)
         self.painel_pesquisa.frame.grid(
             row=1, column=1, sticky="ew", padx=5, pady=(5, 10))
 
+        # Estrutura do código (classes, funções...) à direita do texto
+        self.painel_estrutura = PainelEstrutura(self.master, self.area_texto)
+        self.painel_estrutura.frame.grid(row=0, column=2, sticky="ns")
+
+        # Lista para completar palavras, ao escrever
+        self.completar_palavras = CompletarPalavras(self.area_texto)
+        self._repor_paineis()
+        self._marcar_arranque("completo")
+
     def _configurar_bindings(self):
         """ Configura bindings para eventos específicos """
         # funciona como um listener, que é chamado sempre que ocorre uma mudança na caixa de texto
@@ -683,7 +5849,17 @@ class EditorTexto:
         # Atalhos de teclado
         self.master.bind("<Control-n>", self.gestor_ficheiros.novo_ficheiro)
         self.master.bind("<Control-c>", self.gestor_ficheiros.gravar_como)
-        self.master.bind("<Control-f>", self.painel_pesquisa.focar_pesquisa)
+        self.master.bind("<Control-w>", self.separadores.fechar_atual)
+        # Na área de texto, Ctrl+Tab mudaria o foco (ligação da classe Text)
+        for widget in (self.master, self.area_texto.texto):
+            widget.bind("<Control-Tab>", lambda e: self.separadores.mudar(1))
+            widget.bind("<Control-Shift-Tab>", lambda e: self.separadores.mudar(-1))
+            widget.bind("<Control-ISO_Left_Tab>", lambda e: self.separadores.mudar(-1))
+        self.master.bind("<Control-f>", self._focar_pesquisa)
+        self.area_texto.texto.bind("<F12>", self._ir_para_definicao)
+        self.master.bind("<Control-D>", self.painel_desempenho.alternar)
+        # Tempo de cada tecla até o Tk ficar livre (só com a medição ligada)
+        self.area_texto.texto.bind("<KeyPress>", self._ao_premir_tecla, add="+")
 
         # Ligar os eventos de Undo/Redo do widget de texto ao nosso gestor de undo
         self.area_texto.texto.bind("<<Undo>>", self.area_texto.undo.undo_event)
@@ -692,21 +5868,138 @@ class EditorTexto:
         # WM_DELETE_WINDOW é um evento que é acionado quando o usuário tenta fechar a janela
         self.master.protocol("WM_DELETE_WINDOW", self._ao_fechar)
 
+    def _focar_pesquisa(self, event=None):
+        # Ctrl+F antes de o painel existir: é criado já
+        self.completar_arranque()
+        return self.painel_pesquisa.focar_pesquisa(event)
+
+    def restaurar_sessao(self, documentos=True):
+        """Repõe o estado guardado por _guardar_sessao() (com documentos=False,
+        só as preferências)."""
+        sessao = Sessao.ler()
+        if not sessao:
+            return
+        fonte = sessao.get("fonte", {})
+        self.area_texto.definir_fonte(fonte.get("familia"), fonte.get("tamanho"))
+        if sessao.get("numeros_linha"):
+            self.area_texto.mostrar_numeros_linha.set(True)
+            self.area_texto.alternar_numeros_linha()
+        self._sessao_paineis = sessao
+        if self.painel_pesquisa is not None:
+            self._repor_paineis()
+        if documentos:
+            self.separadores.restaurar(sessao.get("documentos", []), sessao.get("ativo", 0))
+
+    def _repor_paineis(self):
+        sessao, self._sessao_paineis = self._sessao_paineis, {}
+        if not sessao:
+            return
+        self.verificador_sintaxe.automatica.set(sessao.get("verificacao_automatica", False))
+        pesquisa = sessao.get("pesquisa", {})
+        painel = self.painel_pesquisa
+        painel.maiusculas_var.set(pesquisa.get("maiusculas", False))
+        painel.palavra_inteira_var.set(pesquisa.get("palavra_inteira", False))
+        painel.regex_var.set(pesquisa.get("regex", False))
+        painel.pasta = pesquisa.get("pasta", painel.pasta)
+        # O termo por último: escrevê-lo agenda a pesquisa
+        painel.termo_var.set(pesquisa.get("termo", ""))
+
+    def _guardar_sessao(self, documentos_ativo=None):
+        documentos, ativo = documentos_ativo or self.separadores.estado_sessao()
+        sessao = {
+            "documentos": documentos,
+            "ativo": ativo,
+            "fonte": {"familia": self.area_texto.familia_fonte,
+                      "tamanho": self.area_texto.tamanho_fonte},
+            "numeros_linha": self.area_texto.mostrar_numeros_linha.get(),
+        }
+        if self.painel_pesquisa is not None:
+            painel = self.painel_pesquisa
+            sessao["verificacao_automatica"] = self.verificador_sintaxe.automatica.get()
+            sessao["pesquisa"] = {
+                "termo": painel.termo_var.get(),
+                "maiusculas": painel.maiusculas_var.get(),
+                "palavra_inteira": painel.palavra_inteira_var.get(),
+                "regex": painel.regex_var.get(),
+                "pasta": painel.pasta,
+            }
+        else:
+            # Os painéis nunca chegaram a ser criados: fica o que já estava
+            sessao.update({chave: valor for chave, valor in self._sessao_paineis.items()
+                           if chave in ("verificacao_automatica", "pesquisa")})
+        Sessao.guardar(sessao)
+
+    def _ir_para_definicao(self, event=None):
+        self.completar_arranque()
+        return self.painel_estrutura.ir_para_definicao(event)
+
+    def abrir_no_arranque(self, caminho):
+        """Abre o ficheiro dado na linha de comandos.
+
+        Um caminho que ainda não existe dá um documento vazio com esse nome,
+        criado na primeira gravação.
+        """
+        if os.path.exists(caminho):
+            self.separadores.abrir(caminho)
+        else:
+            self.gestor_ficheiros.caminho_ficheiro = os.path.abspath(caminho)
+            self._atualizar_titulo()
+
+    def _ao_premir_tecla(self, event):
+        medidor.ao_premir_tecla(event, self.area_texto.agendador)
+
+    @medidor.medir("<<Modified>>")
     def _ao_modificar(self, event=None):
         """ Trata a modificação do texto e atualiza a flag de modificação. """
+        # Um ficheiro a ser carregado não conta como modificação
+        if self.gestor_ficheiros.a_carregar:
+            self.area_texto.texto.edit_modified(False)
+            return
         # verifica se a flag de modificação está ativada (== True)
         if self.area_texto.texto.edit_modified():
             # se sim, altera a variável da aplicação para True
             self.gestor_ficheiros.modificado = True
-            # e atualiza o título da janela com um asterisco (*) no início do título
-            self._atualizar_titulo()
-            # Atualiza os números de linha, pois o conteúdo mudou
-            self.area_texto.atualizar_numeros_linha()
+            # O título (com o asterisco), os números de linha e o resto do
+            # trabalho que depende do texto ficam para quando o Tk estiver livre
+            self.area_texto.agendador.ao_editar()
             # Faz o reset da flag interna de modificado
             self.area_texto.texto.edit_modified(False)
 
+    def _oferecer_recuperacao(self):
+        """Procura diários de sessões que terminaram mal e oferece recuperá-los."""
+        if self.gestor_ficheiros.a_carregar:
+            # Ex.: o documento da sessão anterior ainda a ser lido
+            self.master.after(100, self._oferecer_recuperacao)
+            return
+        for caminho_diario in DiarioEdicoes.procurar_orfaos():
+            try:
+                plano = DiarioEdicoes.ler_plano(caminho_diario)
+            except (OSError, ValueError, KeyError):
+                continue
+            base, caminho, edicoes = plano
+            if not edicoes and (base is None or base["t"] != "s"):
+                # Nada por gravar nesse diário
+                os.unlink(caminho_diario)
+                continue
+            nome = os.path.basename(caminho) if caminho else "Sem Título"
+            data = time.strftime(
+                "%d/%m/%Y %H:%M", time.localtime(os.path.getmtime(caminho_diario)))
+            if askyesno(
+                    title="Recuperar Alterações?",
+                    message=f"Foram encontradas alterações não gravadas em "
+                            f"\"{nome}\" ({data}). Quer recuperá-las?"):
+                # Cada documento recuperado fica no seu separador
+                if not self.separadores.descartavel() and self.separadores.novo() is None:
+                    return
+                self.gestor_ficheiros.recuperar_diario(caminho_diario, plano)
+            else:
+                os.unlink(caminho_diario)
+
     def _on_tab_key(self, event=None):
         """Insere um número predefinido de espaços em vez de um caractere de tabulação."""
+        # Com a lista de palavras aberta, o Tab completa
+        if self.completar_palavras is not None and self.completar_palavras.aceitar():
+            return "break"
         self.area_texto.texto.insert(
             tk.INSERT, " " * self.area_texto.tab_width)
         # Impede o comportamento padrão da tecla Tab
@@ -720,14 +6013,26 @@ class EditorTexto:
                          if self.gestor_ficheiros.caminho_ficheiro else "Sem Título")
         # mostra um asterisco (*) no início do título da janela se o texto tiver sido modificado
         modificado_str = "*" if self.gestor_ficheiros.modificado else ""
+        # e indica quando uma gravação está a decorrer em segundo plano
+        gravar_str = " (a gravar...)" if self.gestor_ficheiros.a_gravar else ""
         self.master.title(
-            f"{modificado_str}{nome_ficheiro} - PyCharmoso, editor de código Python")
+            f"{modificado_str}{nome_ficheiro}{gravar_str} - PyCharmoso, editor de código Python")
+        self.separadores.atualizar_rotulo()
 
     def _ao_fechar(self):
         # TODO
         """  """
-        # verifica se há modificações não guardadas antes de fechar a janela
-        if self.gestor_ficheiros._verificar_modificacoes():
+        # verifica se há modificações não guardadas (em todos os separadores)
+        # antes de fechar a janela; espera pelas gravações e fecha os diários
+        # (o estado da sessão é lido antes: fechar pode mudar de separador)
+        documentos = self.separadores.estado_sessao()
+        if self.separadores.fechar_todos():
+            self._guardar_sessao(documentos)
+            self.gestor_ficheiros.vigilante.fechar()
+            self.area_texto.agendador.parar()
+            if self.verificador_sintaxe is not None:
+                self.verificador_sintaxe.fechar()
+                self.painel_pesquisa.fechar()
             # Limpar o percolator para evitar erros ao fechar
             self.area_texto.percolator.close()
             # se não há modificações não guardadas, fecha a janela
@@ -735,11 +6040,35 @@ class EditorTexto:
 
 
 def main():
+    """editor_texto.py [ficheiro] [--medir-arranque]
+
+    Com --medir-arranque, escreve os tempos de arranque (ms) em JSON e sai.
+    """
+    argumentos = sys.argv[1:]
+    medir_arranque = "--medir-arranque" in argumentos
+    ficheiros = [a for a in argumentos if not a.startswith("--")]
     janela = tk.Tk()
-    # Impede redimensionamento horizontal abaixo de 500px
-    janela.minsize(1300, 800)
     app = EditorTexto(janela)
+    # Com um ficheiro na linha de comandos, da sessão anterior só ficam as preferências
+    app.restaurar_sessao(documentos=not ficheiros)
+    if ficheiros:
+        app.abrir_no_arranque(ficheiros[0])
+    if medir_arranque:
+        def terminar_medicao():
+            if "completo" not in app.tempos_arranque:
+                janela.after(10, terminar_medicao)
+                return
+            print(json.dumps(dict(app.tempos_arranque,
+                                  alvo_ms=EditorTexto.ALVO_ARRANQUE_MS)))
+            janela.destroy()
+        terminar_medicao()
+    # PYCHARMOSO_PERFIL=ficheiro.prof corre a sessão inteira sob o cProfile
+    perfil = os.environ.get("PYCHARMOSO_PERFIL")
+    if perfil:
+        medidor.iniciar_perfil()
     janela.mainloop()
+    if perfil and medidor.a_perfilar:
+        medidor.parar_perfil(perfil)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,717 @@
+"""Leitura e escrita do formato .rtxt (texto com formatação), sem Tk.
+
+É o módulo usado pelo editor (editor_texto.py) para abrir e gravar
+documentos, e pode ser usado sozinho, num servidor sem display, pela
+linha de comandos:
+
+    python rtxt.py para-txt documentos/            # .rtxt -> .txt
+    python rtxt.py de-txt notas.txt -o notas.rtxt  # .txt -> .rtxt
+    python rtxt.py limpar documento.rtxt           # tira a formatação
+    python rtxt.py listar documento.rtxt --resumo  # mostra a formatação
+    python rtxt.py procurar -i termo documentos/ notas.txt
+
+As pastas são percorridas (saltando as escondidas) e os ficheiros
+distribuídos por vários processos (-j). Cada ficheiro é lido e escrito aos
+pedaços, por isso a memória usada por ficheiro não depende do tamanho do
+texto; só as formatações ficam todas em memória. A exceção é o formato
+antigo (v1), que é um único objeto JSON.
+"""
+
+import codecs
+import io
+import json
+import mmap
+import os
+import re
+import sys
+import zlib
+from itertools import accumulate, chain
+
+# Tamanho (bytes) de cada bloco lido do disco
+TAMANHO_BLOCO = 256 * 1024
+# Bytes do início de um ficheiro de texto onde um '\0' indica que é binário
+AMOSTRA_BINARIO = 8192
+
+
+def _ler_umask():
+    # Só é possível ler a umask mudando-a; é feito uma vez, ao importar
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _ler_umask()
+
+
+def partir_texto(conteudo, tamanho=TAMANHO_BLOCO):
+    """Iterador dos pedaços (posicao_lida, texto) de um texto já em memória."""
+    for inicio in range(0, len(conteudo), tamanho):
+        fim = inicio + tamanho
+        yield min(fim, len(conteudo)), conteudo[inicio:fim]
+
+
+def ler_texto(caminho, tamanho=TAMANHO_BLOCO):
+    """Abre um ficheiro de texto e devolve um iterador dos seus pedaços.
+
+    O ficheiro é mapeado em memória (mmap) e descodificado aos bocados,
+    convertendo as quebras de linha para '\\n' como o modo texto do open().
+    """
+    ficheiro = open(caminho, "rb")
+    total = os.fstat(ficheiro.fileno()).st_size
+    if total == 0:
+        # Não é possível mapear um ficheiro vazio
+        ficheiro.close()
+        return partir_texto("")
+    mapa = mmap.mmap(ficheiro.fileno(), 0, access=mmap.ACCESS_READ)
+    # O início de cada pedaço tem de estar alinhado com as páginas
+    libertar = hasattr(mmap, "MADV_DONTNEED") and tamanho % mmap.PAGESIZE == 0
+
+    def pedacos():
+        descodificador = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder("utf-8")(), translate=True)
+        try:
+            for inicio in range(0, total, tamanho):
+                fim = min(inicio + tamanho, total)
+                texto = descodificador.decode(mapa[inicio:fim], final=fim == total)
+                if libertar:
+                    # As páginas já lidas não voltam a ser precisas
+                    mapa.madvise(mmap.MADV_DONTNEED, inicio, fim - inicio)
+                yield fim, texto
+        finally:
+            mapa.close()
+            ficheiro.close()
+    return pedacos()
+
+
+def linhas(pedacos):
+    """Gera as linhas (sem o '\\n') de um iterador de pedaços (posicao, texto).
+
+    Como o grep, um '\\n' no fim do texto não dá origem a mais uma linha vazia.
+    """
+    resto = ""
+    for _, texto in pedacos:
+        partes = texto.split("\n")
+        partes[0] = resto + partes[0]
+        resto = partes.pop()
+        yield from partes
+    if resto:
+        yield resto
+
+
+def compilar_procura(termo, maiusculas=False, palavra_inteira=False, regex=False):
+    """Expressão regular de uma pesquisa (pode levantar re.error, tratado por quem chama)."""
+    padrao = termo if regex else re.escape(termo)
+    if palavra_inteira:
+        padrao = rf"\b(?:{padrao})\b"
+    return re.compile(padrao, 0 if maiusculas else re.IGNORECASE)
+
+
+def escrever_atomicamente(caminho, escrever):
+    """Escreve num ficheiro temporário e só depois o põe no lugar do original.
+
+    `escrever` recebe o ficheiro temporário, aberto em modo binário. Se o
+    processo morrer a meio, o ficheiro original fica intacto.
+    """
+    import shutil
+    import tempfile
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(
+        prefix=f".{os.path.basename(caminho)}.", suffix=".tmp", dir=pasta)
+    try:
+        with os.fdopen(descritor, "wb") as fich:
+            escrever(fich)
+            fich.flush()
+            os.fsync(fich.fileno())
+        # Mantém as permissões do ficheiro original (mkstemp cria com 0600)
+        if os.path.exists(caminho):
+            shutil.copymode(caminho, temporario)
+        else:
+            os.chmod(temporario, 0o666 & ~UMASK)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.unlink(temporario)
+        except OSError:
+            pass
+        raise
+    # Garante que a mudança de nome também fica no disco
+    if hasattr(os, "O_DIRECTORY"):
+        descritor_pasta = os.open(pasta, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descritor_pasta)
+        finally:
+            os.close(descritor_pasta)
+
+
+class FormatoRtxt:
+    """Leitura e escrita do formato .rtxt (texto com formatação).
+
+    Versão 2 (a que é escrita):
+        RTXT 2\\n
+        {cabeçalho JSON numa linha}\\n
+        <conteúdo em UTF-8, comprimido com zlib se o cabeçalho o indicar>
+
+    O cabeçalho tem o tamanho do conteúdo em bytes e as formatações, em
+    deslocamentos de caracteres codificados como pares [intervalo, comprimento]
+    relativos ao fim do span anterior da mesma tag. Como vem antes do
+    conteúdo, quem lê pode ir mostrando o texto e aplicar a formatação no fim.
+
+    Versão 1: um objeto JSON {"content": ..., "tags": [{"name", "start", "end"}]}
+    com índices "linha.coluna" do Tk. Continua a ser lida.
+    """
+
+    MAGIA = b"RTXT 2\n"
+    # Conteúdos maiores do que isto (bytes) são comprimidos
+    COMPRIMIR_ACIMA = 256 * 1024
+
+    @staticmethod
+    def codificar_spans(spans):
+        """{tag: [(inicio, fim), ...]} -> {tag: [intervalo, comprimento, ...]}"""
+        codificados = {}
+        for nome, intervalos in spans.items():
+            lista = []
+            anterior = 0
+            for inicio, fim in sorted(intervalos):
+                if fim <= inicio:
+                    continue
+                if lista and inicio <= anterior:
+                    # Sobreposto ou adjacente ao anterior: junta os dois
+                    lista[-1] += max(fim - anterior, 0)
+                    anterior = max(anterior, fim)
+                    continue
+                lista += (inicio - anterior, fim - inicio)
+                anterior = fim
+            if lista:
+                codificados[nome] = lista
+        return codificados
+
+    @staticmethod
+    def descodificar_spans(codificados):
+        """Inverso de codificar_spans."""
+        spans = {}
+        for nome, lista in codificados.items():
+            intervalos = []
+            posicao = 0
+            for i in range(0, len(lista) - 1, 2):
+                inicio = posicao + lista[i]
+                posicao = inicio + lista[i + 1]
+                intervalos.append((inicio, posicao))
+            spans[nome] = intervalos
+        return spans
+
+    @staticmethod
+    def offsets_de_indices(conteudo, indices):
+        """Converte índices "linha.coluna" do Tk em deslocamentos no conteúdo."""
+        # Comprimento acumulado das linhas, calculado em C
+        acumulado = [0]
+        acumulado += accumulate(map(len, conteudo.split('\n')))
+        offsets = []
+        for indice in indices:
+            linha, coluna = map(int, str(indice).split('.'))
+            offsets.append(acumulado[linha - 1] + linha - 1 + coluna)
+        return offsets
+
+    @classmethod
+    def spans_de_indices(cls, conteudo, indices_por_tag):
+        """{tag: [inicio, fim, ...] em "linha.coluna"} -> {tag: [(inicio, fim), ...]}"""
+        nomes = [nome for nome, indices in indices_por_tag.items() if indices]
+        todos = [indice for nome in nomes for indice in indices_por_tag[nome]]
+        if not todos:
+            return {}
+        offsets = iter(cls.offsets_de_indices(conteudo, todos))
+        spans = {}
+        for nome in nomes:
+            pares = [next(offsets) for _ in indices_por_tag[nome]]
+            spans[nome] = list(zip(pares[::2], pares[1::2]))
+        return spans
+
+    @classmethod
+    def escrever(cls, ficheiro, conteudo, spans, comprimir=None):
+        """Escreve o documento em formato v2 num ficheiro aberto em modo binário."""
+        dados = conteudo.encode("utf-8")
+        if comprimir is None:
+            comprimir = len(dados) > cls.COMPRIMIR_ACIMA
+        if comprimir:
+            # Nível 1: quase tão rápido como copiar, e já reduz bastante o texto
+            dados = zlib.compress(dados, 1)
+        cls._escrever_cabecalho(ficheiro, comprimir, len(dados), len(conteudo), spans)
+        ficheiro.write(dados)
+
+    @classmethod
+    def escrever_pedacos(cls, ficheiro, pedacos, spans, comprimir=True):
+        """Como escrever(), mas com o conteúdo dado aos pedaços (strings).
+
+        Evita juntar o texto todo numa só string; só os bytes já codificados
+        (e comprimidos) ficam em memória até o cabeçalho ser escrito.
+        Para não os guardar todos, ver EscritorRtxt.
+        """
+        compressor = zlib.compressobj(1) if comprimir else None
+        partes = []
+        caracteres = 0
+        for pedaco in pedacos:
+            caracteres += len(pedaco)
+            dados = pedaco.encode("utf-8")
+            partes.append(compressor.compress(dados) if compressor else dados)
+        if compressor is not None:
+            partes.append(compressor.flush())
+        cls._escrever_cabecalho(
+            ficheiro, comprimir, sum(map(len, partes)), caracteres, spans)
+        ficheiro.writelines(partes)
+
+    @classmethod
+    def _escrever_cabecalho(cls, ficheiro, comprimir, n_bytes, caracteres, spans):
+        cabecalho = {
+            "codificacao": "utf-8",
+            "compressao": "zlib" if comprimir else None,
+            "bytes": n_bytes,
+            "caracteres": caracteres,
+            "spans": cls.codificar_spans(spans),
+        }
+        ficheiro.write(cls.MAGIA)
+        ficheiro.write(json.dumps(cabecalho, separators=(",", ":")).encode("utf-8"))
+        ficheiro.write(b"\n")
+
+    @staticmethod
+    def abrir(caminho):
+        """Abre um ficheiro .rtxt (v1 ou v2) para leitura: devolve um LeitorRtxt."""
+        return LeitorRtxt(caminho)
+
+
+class LeitorRtxt:
+    """Leitor em streaming de um ficheiro .rtxt.
+
+    Uso: percorrer pedacos() (tuplos (posicao_lida, texto)) e, no fim,
+    pedir indices_spans() com as formatações já em índices "linha.coluna".
+    spans() dá as formatações em deslocamentos de caracteres e, na versão 2,
+    não precisa de ler o conteúdo. Levanta OSError ou ValueError se o
+    ficheiro não for válido.
+    """
+
+    TAMANHO_BLOCO = 256 * 1024
+
+    def __init__(self, caminho):
+        self._ficheiro = open(caminho, "rb")
+        try:
+            self.tamanho = os.fstat(self._ficheiro.fileno()).st_size
+            inicio = self._ficheiro.read(len(FormatoRtxt.MAGIA))
+            if inicio == FormatoRtxt.MAGIA:
+                self._abrir_v2()
+            else:
+                self._ficheiro.seek(0)
+                self._abrir_v1()
+        except Exception:
+            self._ficheiro.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+
+    def fechar(self):
+        """Fecha o ficheiro, mesmo que o conteúdo não tenha sido lido até ao fim."""
+        self._ficheiro.close()
+
+    def _abrir_v1(self):
+        self.versao = 1
+        dados = json.loads(self._ficheiro.read().decode("utf-8"))
+        self._ficheiro.close()
+        self._conteudo = dados.get('content', '')
+        self._indices = {}
+        for tag in dados.get('tags', []):
+            if 'name' in tag and 'start' in tag and 'end' in tag:
+                self._indices.setdefault(tag['name'], []).extend(
+                    (tag['start'], tag['end']))
+
+    def _abrir_v2(self):
+        self.versao = 2
+        try:
+            self.cabecalho = json.loads(self._ficheiro.readline().decode("utf-8"))
+            self._bytes = int(self.cabecalho["bytes"])
+            spans = FormatoRtxt.descodificar_spans(self.cabecalho.get("spans", {}))
+        except (KeyError, TypeError) as erro:
+            raise ValueError(f"Cabeçalho .rtxt inválido: {erro}") from erro
+        if self.cabecalho.get("compressao") not in (None, "zlib"):
+            raise ValueError(
+                f"Compressão desconhecida: {self.cabecalho['compressao']}")
+        self._spans = spans
+        # Fronteiras dos spans por ordem, convertidas para "linha.coluna"
+        # à medida que o conteúdo é lido
+        self._fronteiras = sorted({o for intervalos in spans.values()
+                                   for intervalo in intervalos for o in intervalo})
+        self._convertidas = {}
+        self._proxima = 0
+        self._offset = 0
+        self._linha = 1
+        self._coluna = 0
+
+    @property
+    def comprimido(self):
+        return self.versao == 2 and self.cabecalho.get("compressao") == "zlib"
+
+    def pedacos(self):
+        if self.versao == 1:
+            yield from partir_texto(self._conteudo, self.TAMANHO_BLOCO)
+            return
+        try:
+            descodificador = codecs.getincrementaldecoder("utf-8")()
+            # None marca o fim (a descompressão pode dar blocos vazios pelo meio)
+            for bloco in chain(self._blocos(), [None]):
+                texto = descodificador.decode(bloco or b"", final=bloco is None)
+                if texto:
+                    self._converter_fronteiras(texto)
+                    yield self._ficheiro.tell(), texto
+        except zlib.error as erro:
+            raise ValueError(f"Conteúdo .rtxt corrompido: {erro}") from erro
+        finally:
+            self._ficheiro.close()
+
+    def _blocos(self):
+        """Bytes do conteúdo, já descomprimidos, no máximo TAMANHO_BLOCO de cada vez.
+
+        O texto comprime muito, por isso cada bloco lido pode dar vários.
+        """
+        descompressor = zlib.decompressobj() if self.comprimido else None
+        restante = self._bytes
+        while restante:
+            bloco = self._ficheiro.read(min(self.TAMANHO_BLOCO, restante))
+            if not bloco:
+                raise ValueError("Ficheiro .rtxt truncado")
+            restante -= len(bloco)
+            if descompressor is None:
+                yield bloco
+                continue
+            while bloco:
+                yield descompressor.decompress(bloco, self.TAMANHO_BLOCO)
+                bloco = descompressor.unconsumed_tail
+        if descompressor is not None:
+            yield descompressor.flush()
+
+    def _converter_fronteiras(self, texto):
+        """Converte para "linha.coluna" as fronteiras que caem neste pedaço."""
+        fim = self._offset + len(texto)
+        linha, coluna, anterior = self._linha, self._coluna, 0
+        fronteiras = self._fronteiras
+        while self._proxima < len(fronteiras) and fronteiras[self._proxima] <= fim:
+            relativo = fronteiras[self._proxima] - self._offset
+            quebras = texto.count('\n', anterior, relativo)
+            if quebras:
+                linha += quebras
+                coluna = relativo - texto.rfind('\n', anterior, relativo) - 1
+            else:
+                coluna += relativo - anterior
+            anterior = relativo
+            self._convertidas[fronteiras[self._proxima]] = f"{linha}.{coluna}"
+            self._proxima += 1
+        quebras = texto.count('\n')
+        if quebras:
+            self._linha += quebras
+            self._coluna = len(texto) - texto.rfind('\n') - 1
+        else:
+            self._coluna += len(texto)
+        self._offset = fim
+
+    def indices_spans(self):
+        """{tag: [inicio1, fim1, inicio2, fim2, ...]} em índices do Tk."""
+        if self.versao == 1:
+            return self._indices
+        # Fronteiras para lá do fim do texto ficam no fim
+        fim = f"{self._linha}.{self._coluna}"
+        return {nome: [self._convertidas.get(o, fim)
+                       for intervalo in intervalos for o in intervalo]
+                for nome, intervalos in self._spans.items()}
+
+    def spans(self):
+        """{tag: [(inicio, fim), ...]} em deslocamentos de caracteres."""
+        if self.versao == 1:
+            return FormatoRtxt.spans_de_indices(self._conteudo, self._indices)
+        return self._spans
+
+
+class EscritorRtxt:
+    """Escritor em streaming de um ficheiro .rtxt (versão 2).
+
+    O conteúdo é dado aos pedaços com escrever() e as formatações com
+    formatar(), em deslocamentos de caracteres; fechar() escreve o cabeçalho
+    e a seguir o conteúdo. Como o cabeçalho leva o tamanho do conteúdo, os
+    bytes (já comprimidos) esperam num ficheiro temporário, que só fica em
+    memória enquanto é pequeno.
+    """
+
+    EM_MEMORIA_ATE = 4 * 1024 * 1024
+
+    def __init__(self, ficheiro, comprimir=True):
+        import tempfile
+        self._ficheiro = ficheiro
+        self._temporario = tempfile.SpooledTemporaryFile(self.EM_MEMORIA_ATE)
+        self._compressor = zlib.compressobj(1) if comprimir else None
+        self._spans = {}
+        self.caracteres = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *erro):
+        if tipo is None:
+            self.fechar()
+        else:
+            self._temporario.close()
+
+    def escrever(self, texto):
+        self.caracteres += len(texto)
+        dados = texto.encode("utf-8")
+        if self._compressor is not None:
+            dados = self._compressor.compress(dados)
+        self._temporario.write(dados)
+
+    def formatar(self, nome, inicio, fim):
+        self._spans.setdefault(nome, []).append((inicio, fim))
+
+    def fechar(self):
+        import shutil
+        try:
+            if self._compressor is not None:
+                self._temporario.write(self._compressor.flush())
+            FormatoRtxt._escrever_cabecalho(
+                self._ficheiro, self._compressor is not None,
+                self._temporario.tell(), self.caracteres, self._spans)
+            self._temporario.seek(0)
+            shutil.copyfileobj(self._temporario, self._ficheiro, TAMANHO_BLOCO)
+        finally:
+            self._temporario.close()
+
+
+# --- Linha de comandos ---
+# Cada comando é uma função que trata um ficheiro e devolve as linhas a
+# mostrar; corre num processo do conjunto, por isso tem de estar ao nível
+# do módulo (para poder ser enviada ao processo).
+
+def _e_binario(caminho):
+    with open(caminho, "rb") as ficheiro:
+        return b"\0" in ficheiro.read(AMOSTRA_BINARIO)
+
+
+def _pedacos(caminho):
+    """Pedaços do texto de um ficheiro .rtxt ou de texto simples."""
+    if caminho.lower().endswith(".rtxt"):
+        return LeitorRtxt(caminho).pedacos()
+    return ler_texto(caminho)
+
+
+def _gravar(destino, escrever, substituir):
+    if not substituir and os.path.exists(destino):
+        raise FileExistsError(f"{destino} já existe (usar --substituir)")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    escrever_atomicamente(destino, escrever)
+
+
+def para_txt(origem, destino, substituir):
+    def escrever(ficheiro):
+        for _, texto in LeitorRtxt(origem).pedacos():
+            ficheiro.write(texto.encode("utf-8"))
+    _gravar(destino, escrever, substituir)
+    return [f"{origem} -> {destino}"]
+
+
+def de_txt(origem, destino, substituir):
+    comprimir = os.path.getsize(origem) > FormatoRtxt.COMPRIMIR_ACIMA
+
+    def escrever(ficheiro):
+        with EscritorRtxt(ficheiro, comprimir) as escritor:
+            for _, texto in ler_texto(origem):
+                escritor.escrever(texto)
+    _gravar(destino, escrever, substituir)
+    return [f"{origem} -> {destino}"]
+
+
+def limpar(origem, destino, substituir):
+    # Sem destino, o próprio ficheiro é substituído
+    substituir = substituir or destino == origem
+
+    def escrever(ficheiro):
+        leitor = LeitorRtxt(origem)
+        comprimir = (leitor.comprimido if leitor.versao == 2
+                     else leitor.tamanho > FormatoRtxt.COMPRIMIR_ACIMA)
+        with EscritorRtxt(ficheiro, comprimir) as escritor:
+            for _, texto in leitor.pedacos():
+                escritor.escrever(texto)
+    _gravar(destino, escrever, substituir)
+    return [f"{origem} -> {destino}" if destino != origem else origem]
+
+
+def listar(caminho, resumo):
+    with LeitorRtxt(caminho) as leitor:
+        if resumo:
+            return [f"{caminho}\t{nome}\t{len(intervalos)} spans\t"
+                    f"{sum(fim - inicio for inicio, fim in intervalos)} caracteres"
+                    for nome, intervalos in sorted(leitor.spans().items())]
+        # As fronteiras são convertidas para "linha.coluna" durante a leitura
+        for _ in leitor.pedacos():
+            pass
+        saida = []
+        for nome, indices in sorted(leitor.indices_spans().items()):
+            saida += (f"{caminho}\t{nome}\t{inicio}\t{fim}"
+                      for inicio, fim in zip(indices[::2], indices[1::2]))
+        return saida
+
+
+def procurar(caminho, opcoes, maximo):
+    if not caminho.lower().endswith(".rtxt") and _e_binario(caminho):
+        return []
+    padrao = compilar_procura(*opcoes)
+    saida = []
+    pedacos = _pedacos(caminho)
+    try:
+        for numero, linha in enumerate(linhas(pedacos), 1):
+            correspondencia = padrao.search(linha)
+            if correspondencia is None:
+                continue
+            saida.append(f"{caminho}:{numero}:{correspondencia.start() + 1}:{linha}")
+            if len(saida) == maximo:
+                break
+    finally:
+        pedacos.close()
+    return saida
+
+
+def _correr(tarefa):
+    """Corre uma tarefa (funcao, caminho, *argumentos): (linhas, erro)."""
+    funcao, caminho, *argumentos = tarefa
+    try:
+        return funcao(caminho, *argumentos), None
+    except (OSError, ValueError) as erro:
+        # ValueError inclui os erros de descodificação (UnicodeDecodeError)
+        return [], f"{caminho}: {erro}"
+
+
+def executar(tarefas, processos):
+    """Gera os resultados das tarefas, pela ordem delas, com vários processos."""
+    processos = min(processos, len(tarefas))
+    if processos <= 1:
+        yield from map(_correr, tarefas)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        yield from executor.map(_correr, tarefas)
+
+
+def expandir(caminhos, extensoes):
+    """(caminho, relativo) de cada ficheiro; as pastas são percorridas.
+
+    Dentro das pastas só entram os ficheiros com uma das extensões dadas
+    (os indicados diretamente entram sempre); as pastas escondidas são saltadas.
+    """
+    for caminho in caminhos:
+        if not os.path.isdir(caminho):
+            yield caminho, os.path.basename(caminho)
+            continue
+        for raiz, pastas, ficheiros in os.walk(caminho):
+            pastas[:] = sorted(nome for nome in pastas if not nome.startswith("."))
+            for nome in sorted(ficheiros):
+                if nome.lower().endswith(extensoes):
+                    completo = os.path.join(raiz, nome)
+                    yield completo, os.path.relpath(completo, caminho)
+
+
+def _destinos(args, entrada, extensao):
+    """(origem, destino) de cada ficheiro a converter.
+
+    O destino fica junto do original, com a nova extensão, ou dentro da
+    pasta -o com o mesmo caminho relativo; com um único ficheiro de entrada,
+    -o pode ser o próprio ficheiro de destino. Sem extensão (limpar), o
+    destino por omissão é o próprio original.
+    """
+    saida = args.saida
+    para_ficheiro = (saida is not None and len(args.caminhos) == 1
+                     and not os.path.isdir(args.caminhos[0])
+                     and not os.path.isdir(saida) and not saida.endswith(os.sep))
+    pares = []
+    for origem, relativo in expandir(args.caminhos, (entrada,)):
+        if extensao is not None:
+            relativo = os.path.splitext(relativo)[0] + extensao
+        if para_ficheiro:
+            destino = saida
+        elif saida is None:
+            destino = os.path.join(os.path.dirname(origem), os.path.basename(relativo))
+        else:
+            destino = os.path.join(saida, relativo)
+        pares.append((origem, destino))
+    return pares
+
+
+def main(argumentos=None):
+    """Ponto de entrada da linha de comandos; devolve o código de saída."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="rtxt", description="Processa ficheiros .rtxt sem abrir o editor.")
+    parser.add_argument("-j", "--processos", type=int, default=os.cpu_count() or 1,
+                        help="processos a usar (por omissão, um por núcleo)")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    for nome, ajuda in (("para-txt", "converte .rtxt em .txt (perde a formatação)"),
+                        ("de-txt", "converte .txt em .rtxt"),
+                        ("limpar", "tira a formatação de ficheiros .rtxt")):
+        comando = comandos.add_parser(nome, help=ajuda)
+        comando.add_argument("caminhos", nargs="+", help="ficheiros ou pastas")
+        comando.add_argument("-o", "--saida",
+                             help="ficheiro ou pasta de destino (por omissão, "
+                                  "junto de cada original"
+                                  + (", que é substituído)" if nome == "limpar" else ")"))
+        comando.add_argument("-f", "--substituir", action="store_true",
+                             help="substitui os ficheiros de destino que já existam")
+
+    comando = comandos.add_parser("listar", help="mostra a formatação de ficheiros .rtxt")
+    comando.add_argument("caminhos", nargs="+", help="ficheiros ou pastas")
+    comando.add_argument("-r", "--resumo", action="store_true",
+                         help="só o número de spans e de caracteres de cada tag")
+
+    comando = comandos.add_parser("procurar", help="procura um termo em ficheiros .rtxt e .txt")
+    comando.add_argument("termo")
+    comando.add_argument("caminhos", nargs="+", help="ficheiros ou pastas")
+    comando.add_argument("-i", "--ignorar-maiusculas", action="store_true",
+                         help="não distingue maiúsculas de minúsculas")
+    comando.add_argument("-w", "--palavra-inteira", action="store_true",
+                         help="só palavras inteiras")
+    comando.add_argument("-E", "--regex", action="store_true",
+                         help="o termo é uma expressão regular")
+    comando.add_argument("-m", "--max", type=int, default=0,
+                         help="máximo de linhas encontradas por ficheiro")
+    args = parser.parse_args(argumentos)
+
+    if args.comando == "procurar":
+        opcoes = (args.termo, not args.ignorar_maiusculas, args.palavra_inteira, args.regex)
+        try:
+            compilar_procura(*opcoes)
+        except re.error as erro:
+            parser.error(f"expressão regular inválida: {erro}")
+        tarefas = [(procurar, caminho, opcoes, args.max)
+                   for caminho, _ in expandir(args.caminhos, (".rtxt", ".txt"))]
+    elif args.comando == "listar":
+        tarefas = [(listar, caminho, args.resumo)
+                   for caminho, _ in expandir(args.caminhos, (".rtxt",))]
+    else:
+        funcao, entrada, extensao = {
+            "para-txt": (para_txt, ".rtxt", ".txt"),
+            "de-txt": (de_txt, ".txt", ".rtxt"),
+            "limpar": (limpar, ".rtxt", None),
+        }[args.comando]
+        tarefas = [(funcao, origem, destino, args.substituir)
+                   for origem, destino in _destinos(args, entrada, extensao)]
+
+    encontrado = erros = False
+    for saida, erro in executar(tarefas, args.processos):
+        if erro is not None:
+            erros = True
+            print(erro, file=sys.stderr)
+        for linha in saida:
+            encontrado = True
+            print(linha)
+    # Como o grep: 1 se a pesquisa não encontrou nada, 2 se houve erros
+    if erros:
+        return 2
+    return 0 if encontrado or args.comando != "procurar" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Testes do IndicePalavras (completar palavras), sem abrir janelas.
+
+Uso:
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import editor_texto  # noqa: E402
+
+
+class TextoFalso:
+    """O mínimo do tk.Text usado pelo índice: get() e index("end-1c")."""
+
+    def __init__(self, conteudo):
+        self.linhas = conteudo.split("\n")
+
+    def _posicao(self, indice):
+        if indice == "end-1c":
+            return len(self.linhas), len(self.linhas[-1])
+        linha, coluna = indice.split(".")
+        linha = int(linha)
+        return linha, len(self.linhas[linha - 1]) if coluna == "end" else int(coluna)
+
+    def index(self, indice):
+        return "%d.%d" % self._posicao(indice)
+
+    def get(self, inicio, fim):
+        (l1, c1), (l2, c2) = self._posicao(inicio), self._posicao(fim)
+        texto = "\n".join(self.linhas[l1 - 1:l2])
+        return texto[c1:len(texto) - (len(self.linhas[l2 - 1]) - c2)]
+
+
+class TesteIndicePalavras(unittest.TestCase):
+
+    def test_edicoes(self):
+        texto = TextoFalso("valor_total = 1\nvalor_parcial = 2\nvalor_total += 3")
+        indice = editor_texto.IndicePalavras(texto)
+        self.assertEqual(indice.completar("valor"), ["valor_total", "valor_parcial"])
+        self.assertIn("print", indice.completar("pri"))
+        # Linha 2 trocada por duas linhas novas
+        texto.linhas[1:2] = ["valor_medio = 4", "valor_medio += 5"]
+        indice.invalidar_linhas(2, 1, 2)
+        self.assertEqual(indice.completar("valor"), ["valor_medio", "valor_total"])
+
+    def test_numero_de_linhas_dessincronizado(self):
+        texto = TextoFalso("alfa\nbeta")
+        indice = editor_texto.IndicePalavras(texto)
+        self.assertEqual(indice.completar("alf"), ["alfa"])
+        # Uma edição anotada com menos linhas do que as que mudaram:
+        # o índice fica com outro número de linhas e tem de reler tudo
+        texto.linhas[1:2] = ["betao", "alfabeto", "alfarroba"]
+        indice.invalidar_linhas(2, 1, 1)
+        self.assertEqual(indice.completar("alf"), ["alfa", "alfabeto", "alfarroba"])
+        self.assertEqual(len(indice._linhas), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
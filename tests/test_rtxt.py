@@ -0,0 +1,227 @@
+"""Testes do módulo rtxt (formato .rtxt e linha de comandos).
+
+Uso:
+    python -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import rtxt  # noqa: E402
+
+# Caracteres de vários tamanhos em UTF-8, para cair nas fronteiras dos blocos
+TEXTO = "".join(f"linha {i} çé€😀 valor{i % 3}\n" for i in range(200)) + "fim"
+SPANS = {"color_red": [(0, 5), (40, 90)], "bold": [(7, 9), (len(TEXTO) - 3, len(TEXTO))]}
+
+
+def indice_tk(texto, offset):
+    linha = texto.count("\n", 0, offset) + 1
+    return f"{linha}.{offset - (texto.rfind(chr(10), 0, offset) + 1)}"
+
+
+class TesteFormato(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix="teste_rtxt_")
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+
+    def caminho(self, nome):
+        return os.path.join(self.pasta, nome)
+
+    def ler(self, caminho, tamanho_bloco=None):
+        leitor = rtxt.LeitorRtxt(caminho)
+        if tamanho_bloco is not None:
+            leitor.TAMANHO_BLOCO = tamanho_bloco
+        return leitor, "".join(texto for _, texto in leitor.pedacos())
+
+    def verificar(self, caminho, texto, spans):
+        # Blocos pequenos: os caracteres e as fronteiras ficam partidos
+        for tamanho_bloco in (None, 1, 7):
+            leitor, lido = self.ler(caminho, tamanho_bloco)
+            self.assertEqual(lido, texto)
+            self.assertEqual(leitor.spans(), spans)
+            self.assertEqual(
+                leitor.indices_spans(),
+                {nome: [indice_tk(texto, o) for intervalo in intervalos for o in intervalo]
+                 for nome, intervalos in spans.items()})
+
+    def test_ida_e_volta(self):
+        for comprimir in (False, True):
+            with self.subTest(comprimir=comprimir):
+                caminho = self.caminho("documento.rtxt")
+                with open(caminho, "wb") as ficheiro:
+                    rtxt.FormatoRtxt.escrever(ficheiro, TEXTO, SPANS, comprimir)
+                with rtxt.LeitorRtxt(caminho) as leitor:
+                    self.assertEqual(leitor.comprimido, comprimir)
+                self.verificar(caminho, TEXTO, SPANS)
+
+    def test_escritor_aos_pedacos(self):
+        for comprimir in (False, True):
+            with self.subTest(comprimir=comprimir):
+                caminho = self.caminho("documento.rtxt")
+                with open(caminho, "wb") as ficheiro, \
+                        rtxt.EscritorRtxt(ficheiro, comprimir) as escritor:
+                    for inicio in range(0, len(TEXTO), 13):
+                        escritor.escrever(TEXTO[inicio:inicio + 13])
+                    for nome, intervalos in SPANS.items():
+                        for inicio, fim in intervalos:
+                            escritor.formatar(nome, inicio, fim)
+                self.verificar(caminho, TEXTO, SPANS)
+
+    def test_spans_juntos_e_vazios(self):
+        codificados = rtxt.FormatoRtxt.codificar_spans(
+            {"a": [(5, 8), (0, 3), (3, 4), (9, 9)], "b": [(2, 2)]})
+        self.assertEqual(rtxt.FormatoRtxt.descodificar_spans(codificados),
+                         {"a": [(0, 4), (5, 8)]})
+
+    def test_versao_1(self):
+        caminho = self.caminho("antigo.rtxt")
+        with open(caminho, "w", encoding="utf-8") as ficheiro:
+            json.dump({"content": "ab\ncd", "tags": [
+                {"name": "t", "start": "1.1", "end": "2.1"}, {"name": "incompleta"}]},
+                ficheiro)
+        leitor, lido = self.ler(caminho)
+        self.assertEqual(leitor.versao, 1)
+        self.assertEqual(lido, "ab\ncd")
+        self.assertEqual(leitor.indices_spans(), {"t": ["1.1", "2.1"]})
+        self.assertEqual(leitor.spans(), {"t": [(1, 4)]})
+
+    def test_ficheiro_truncado(self):
+        caminho = self.caminho("truncado.rtxt")
+        with open(caminho, "wb") as ficheiro:
+            rtxt.FormatoRtxt.escrever(ficheiro, TEXTO, SPANS, comprimir=True)
+        with open(caminho, "r+b") as ficheiro:
+            ficheiro.truncate(os.path.getsize(caminho) - 10)
+        with self.assertRaises(ValueError):
+            self.ler(caminho)
+
+    def test_linhas(self):
+        pedacos = rtxt.partir_texto("a\nbc\n\nd\n", 3)
+        self.assertEqual(list(rtxt.linhas(pedacos)), ["a", "bc", "", "d"])
+
+    def test_texto_simples(self):
+        caminho = self.caminho("notas.txt")
+        with open(caminho, "wb") as ficheiro:
+            ficheiro.write("um\r\ndois\rtrês".encode("utf-8"))
+        self.assertEqual("".join(t for _, t in rtxt.ler_texto(caminho, 4)),
+                         "um\ndois\ntrês")
+
+
+class TesteLinhaComandos(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp(prefix="teste_rtxt_")
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        os.makedirs(self.caminho("docs", "sub"))
+        os.makedirs(self.caminho("docs", ".escondida"))
+        with open(self.caminho("docs", "a.rtxt"), "wb") as ficheiro:
+            rtxt.FormatoRtxt.escrever(ficheiro, TEXTO, SPANS)
+        with open(self.caminho("docs", "sub", "b.rtxt"), "wb") as ficheiro:
+            rtxt.FormatoRtxt.escrever(ficheiro, "Olá\nmundo valor\n", {"x": [(1, 6)]})
+        with open(self.caminho("docs", ".escondida", "c.rtxt"), "wb") as ficheiro:
+            rtxt.FormatoRtxt.escrever(ficheiro, "valor", {})
+        with open(self.caminho("docs", "notas.txt"), "w", encoding="utf-8") as ficheiro:
+            ficheiro.write("primeira\nsegunda VALOR\n")
+        with open(self.caminho("docs", "binario.txt"), "wb") as ficheiro:
+            ficheiro.write(b"\0valor")
+
+    def caminho(self, *partes):
+        return os.path.join(self.pasta, *partes)
+
+    def correr(self, *argumentos):
+        """(código de saída, linhas do stdout, stderr)"""
+        saida, erros = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(saida), contextlib.redirect_stderr(erros):
+            try:
+                codigo = rtxt.main(["-j", "1", *argumentos])
+            except SystemExit as saida_argparse:
+                codigo = saida_argparse.code
+        return codigo, saida.getvalue().splitlines(), erros.getvalue()
+
+    def conteudo(self, caminho):
+        leitor = rtxt.LeitorRtxt(caminho)
+        return "".join(texto for _, texto in leitor.pedacos()), leitor.spans()
+
+    def test_para_txt(self):
+        codigo, saida, _ = self.correr("para-txt", self.caminho("docs"))
+        self.assertEqual(codigo, 0)
+        self.assertEqual(len(saida), 2)
+        with open(self.caminho("docs", "a.txt"), encoding="utf-8") as ficheiro:
+            self.assertEqual(ficheiro.read(), TEXTO)
+        self.assertTrue(os.path.exists(self.caminho("docs", "sub", "b.txt")))
+        self.assertFalse(os.path.exists(self.caminho("docs", ".escondida", "c.txt")))
+        # Não substitui sem -f
+        codigo, _, erros = self.correr("para-txt", self.caminho("docs", "a.rtxt"))
+        self.assertEqual(codigo, 2)
+        self.assertIn("já existe", erros)
+        codigo, _, _ = self.correr("para-txt", "-f", self.caminho("docs", "a.rtxt"))
+        self.assertEqual(codigo, 0)
+
+    def test_de_txt(self):
+        destino = self.caminho("saida", "notas.rtxt")
+        codigo, _, _ = self.correr("de-txt", self.caminho("docs", "notas.txt"), "-o", destino)
+        self.assertEqual(codigo, 0)
+        self.assertEqual(self.conteudo(destino), ("primeira\nsegunda VALOR\n", {}))
+        # Uma pasta vai para outra, com os mesmos caminhos relativos
+        codigo, _, _ = self.correr("de-txt", self.caminho("docs"), "-o", self.caminho("copia"))
+        self.assertEqual(codigo, 0)
+        self.assertTrue(os.path.exists(self.caminho("copia", "notas.rtxt")))
+
+    def test_limpar(self):
+        caminho = self.caminho("docs", "a.rtxt")
+        codigo, _, _ = self.correr("limpar", caminho, "-o", self.caminho("limpo.rtxt"))
+        self.assertEqual(codigo, 0)
+        self.assertEqual(self.conteudo(self.caminho("limpo.rtxt")), (TEXTO, {}))
+        self.assertEqual(self.conteudo(caminho), (TEXTO, SPANS))
+        # Sem -o, o próprio ficheiro é substituído
+        codigo, _, _ = self.correr("limpar", caminho)
+        self.assertEqual(codigo, 0)
+        self.assertEqual(self.conteudo(caminho), (TEXTO, {}))
+
+    def test_listar(self):
+        caminho = self.caminho("docs", "sub", "b.rtxt")
+        codigo, saida, _ = self.correr("listar", caminho)
+        self.assertEqual(codigo, 0)
+        self.assertEqual(saida, [f"{caminho}\tx\t1.1\t2.2"])
+        codigo, saida, _ = self.correr("listar", "-r", caminho)
+        self.assertEqual(saida, [f"{caminho}\tx\t1 spans\t5 caracteres"])
+
+    def test_procurar(self):
+        pasta = self.caminho("docs")
+        codigo, saida, _ = self.correr("procurar", "mundo valor", pasta)
+        self.assertEqual(codigo, 0)
+        self.assertEqual(saida, [f"{self.caminho('docs', 'sub', 'b.rtxt')}:2:1:mundo valor"])
+        # Com -i também encontra "VALOR"; o binário e a pasta escondida ficam de fora
+        codigo, saida, _ = self.correr("procurar", "-i", "-m", "1", "valor", pasta)
+        self.assertEqual(sorted(os.path.basename(linha.split(":")[0]) for linha in saida),
+                         ["a.rtxt", "b.rtxt", "notas.txt"])
+        codigo, saida, _ = self.correr("procurar", "-E", "-w", r"valor\d", pasta)
+        self.assertEqual(len(saida), 200)
+        codigo, saida, _ = self.correr("procurar", "inexistente", pasta)
+        self.assertEqual((codigo, saida), (1, []))
+        codigo, _, erros = self.correr("procurar", "-E", "(", pasta)
+        self.assertEqual(codigo, 2)
+        self.assertIn("expressão regular inválida", erros)
+
+    def test_varios_processos(self):
+        pasta = self.caminho("docs")
+        _, sequencial, _ = self.correr("procurar", "-i", "valor", pasta)
+        saida = io.StringIO()
+        with contextlib.redirect_stdout(saida):
+            codigo = rtxt.main(["-j", "2", "procurar", "-i", "valor", pasta])
+        self.assertEqual(codigo, 0)
+        # A ordem é a dos ficheiros, como com um só processo
+        self.assertEqual(saida.getvalue().splitlines(), sequencial)
+
+
+if __name__ == "__main__":
+    unittest.main()